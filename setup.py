@@ -20,7 +20,12 @@ setuptools.setup(
         "Development Status :: 2 - Pre-Alpha",
     ],
     python_requires='>=3.6',
+    extras_require={
+        "zstd": ["zstandard"],
+    },
     entry_points={
-        "console_scripts": ["logmerge-csv=csvlog.command_line:main"],
+        "console_scripts": ["logmerge-csv=csvlog.command_line:main",
+                            "logmerge-concat=csvlog.command_line:concat_main",
+                            "logmerge-benchmark=csvlog.benchmark.command_line:main"],
     },
 )
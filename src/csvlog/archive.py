@@ -0,0 +1,263 @@
+import errno
+import filecmp
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from csvlog.defaults import DEFAULT_ARCHIVE_THREADS, RECOVERY_MODES
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Moves are written to the journal, and synced, this many at a time.  Syncing once per file would cost more than the
+# moves themselves.
+ARCHIVE_BATCH_SIZE = 256
+# A cross-device copy is written under this suffix and renamed into place once complete, so a partial copy is never
+# mistaken for an archived file.
+PARTIAL_SUFFIX = ".partial"
+
+
+def move_file(source: Path, destination: Path, created_directories: Optional[Set[Path]] = None,
+              directory_lock: Optional[threading.Lock] = None) -> None:
+    # Moves one file, creating the destination's directory if needed.  Directories in created_directories are known to
+    # exist and aren't created again.  When the destination is on another filesystem the file is copied and the
+    # original removed, since a rename can't cross devices.
+    parent = destination.parent
+    if created_directories is None or parent not in created_directories:
+        parent.mkdir(parents=True, exist_ok=True)
+        if created_directories is not None:
+            with directory_lock:
+                created_directories.add(parent)
+    if destination.exists():
+        logger.error(f"Destination file {destination} already exists.")
+        raise FileExistsError(f"Destination file {destination} already exists.")
+    try:
+        os.replace(str(source), str(destination))
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        copy_across_devices(source, destination)
+
+
+def copy_across_devices(source: Path, destination: Path) -> None:
+    partial_path = Path(destination.parent, destination.name + PARTIAL_SUFFIX)
+    # shutil.copyfile streams the data, using sendfile where the platform has it.
+    shutil.copyfile(str(source), str(partial_path))
+    shutil.copystat(str(source), str(partial_path))
+    os.replace(str(partial_path), str(destination))
+    source.unlink()
+
+
+def run_journal_path(journal_path: Path) -> Path:
+    # Every run journals its moves in a file of its own next to the configured journal, so a run never settles the
+    # moves of another run that is still archiving.
+    journal_path = Path(journal_path)
+    return Path(journal_path.parent, f"{journal_path.name}.{uuid.uuid4().hex}")
+
+
+def find_archive_journals(journal_path: Path) -> List[Path]:
+    # The journals of every run that shares the configured journal, and the configured journal itself, which earlier
+    # versions wrote to.
+    journal_path = Path(journal_path)
+    try:
+        names = [entry.name for entry in os.scandir(str(journal_path.parent)) if entry.is_file()]
+    except FileNotFoundError:
+        return []
+    return [Path(journal_path.parent, name) for name in sorted(names)
+            if name == journal_path.name or name.startswith(journal_path.name + ".")]
+
+
+def lock_journal(journal) -> bool:
+    # Takes an exclusive lock on an open journal without waiting.  The lock is held by the run writing the journal, or
+    # by the run recovering it, until the journal is closed.  Without fcntl journals can't be locked, and every journal
+    # is taken to be abandoned.
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as e:
+        if e.errno not in (errno.EAGAIN, errno.EACCES):
+            raise
+        return False
+    return True
+
+
+def open_locked_journal(journal_path: Path):
+    # The journal is created under a hidden name and only renamed into place once it is locked, so recovery never
+    # finds it unlocked.
+    temporary_path = Path(journal_path.parent, f".{journal_path.name}.{uuid.uuid4().hex}")
+    journal = temporary_path.open(mode="x", encoding="utf-8")
+    try:
+        lock_journal(journal)
+        os.replace(str(temporary_path), str(journal_path))
+    except BaseException:
+        journal.close()
+        temporary_path.unlink()
+        raise
+    return journal
+
+
+class Archiver:
+    # Moves merged files into the archive on a pool of threads.  Every move is written to the journal before it starts,
+    # so a run that is interrupted part way can later be finished or rolled back by recover_archive_journal.  The
+    # journal is locked while the archiver is open, and removed once every move has finished.  Errors from a move are
+    # raised by the next call to archive() or by close().
+    def __init__(self, search_directory: Path, archive_directory: Path, threads: int = DEFAULT_ARCHIVE_THREADS,
+                 journal_path: Optional[Path] = None):
+        self.search_directory = Path(search_directory)
+        self.archive_directory = Path(archive_directory)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, threads))
+        self.journal_path = Path(journal_path) if journal_path is not None else None
+        self.journal = None
+        self.created_directories = set()  # type: Set[Path]
+        self.directory_lock = threading.Lock()
+        self.pending_moves = []  # type: List[Tuple[Path, Path]]
+        self.in_flight_moves = deque()  # type: Deque[Future]
+        self.moved = 0
+        self.closed = False
+        if self.journal_path is not None:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            self.journal = open_locked_journal(self.journal_path)
+
+    def __enter__(self) -> "Archiver":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close(wait=exc_type is None)
+
+    def archive(self, file_path: Path) -> None:
+        destination = Path(self.archive_directory, file_path.relative_to(self.search_directory))
+        self.pending_moves.append((file_path, destination))
+        if len(self.pending_moves) >= ARCHIVE_BATCH_SIZE:
+            self.start_pending_moves()
+        self.collect_finished_moves()
+
+    def start_pending_moves(self) -> None:
+        if not self.pending_moves:
+            return
+        self.write_journal_entries([("move", source, destination) for source, destination in self.pending_moves],
+                                   sync=True)
+        for source, destination in self.pending_moves:
+            self.in_flight_moves.append(self.pool.submit(self.move, source, destination))
+        self.pending_moves = []
+
+    def move(self, source: Path, destination: Path) -> None:
+        move_file(source, destination, self.created_directories, self.directory_lock)
+
+    def collect_finished_moves(self) -> None:
+        while self.in_flight_moves and self.in_flight_moves[0].done():
+            self.in_flight_moves.popleft().result()
+            self.moved += 1
+
+    def write_journal_entries(self, entries: List[Tuple[str, Path, Path]], sync: bool = False) -> None:
+        # Only called from the thread that calls archive(), so the journal needs no lock.
+        if self.journal is None:
+            return
+        lines = "".join(json.dumps({"operation": operation, "source": str(source), "destination": str(destination)})
+                        + "\n" for operation, source, destination in entries)
+        self.journal.write(lines)
+        self.journal.flush()
+        if sync:
+            os.fsync(self.journal.fileno())
+
+    def close(self, wait: bool = True) -> None:
+        # Without wait, moves that haven't started are abandoned.  They are still in the journal, so the next run
+        # recovers them.
+        if self.closed:
+            return
+        self.closed = True
+        completed = False
+        try:
+            if wait:
+                self.start_pending_moves()
+                while self.in_flight_moves:
+                    self.in_flight_moves.popleft().result()
+                    self.moved += 1
+                completed = True
+        finally:
+            self.pool.shutdown(wait=True)
+            if self.journal is not None:
+                # Every move in the journal finished, so there is nothing left to recover.  It is removed before the
+                # lock is released, so recovery can't pick it up in between.
+                if completed:
+                    self.journal_path.unlink()
+                self.journal.close()
+        logger.info(f"Archived {self.moved} files to {self.archive_directory}")
+
+
+def recover_archive_journals(journal_path: Path, mode: str = "finish") -> int:
+    # Recovers every journal that shares the configured journal and isn't locked by a run that is still archiving.
+    return sum(recover_archive_journal(path, mode) for path in find_archive_journals(journal_path))
+
+
+def recover_archive_journal(journal_path: Path, mode: str = "finish") -> int:
+    # Deals with the moves an interrupted run left behind.  finish completes every move in the journal that hadn't
+    # finished.  rollback puts every file the run moved, finished or not, back where it came from, so the next merge
+    # picks those files up again.  Returns the number of files that were moved, and removes the journal.  A journal
+    # that is locked belongs to a run that is still archiving, and is left alone.
+    if mode not in RECOVERY_MODES:
+        raise ValueError(f"{mode} is not an archive recovery mode")
+    journal_path = Path(journal_path)
+    try:
+        journal = journal_path.open(encoding="utf-8")
+    except FileNotFoundError:
+        return 0
+    with journal:
+        if not lock_journal(journal):
+            logger.info(f"Leaving the archive journal at {journal_path} alone because another run is using it")
+            return 0
+        # The run that wrote the journal removes it before releasing its lock, so a journal that is no longer at its
+        # path was finished, or recovered by another run, while this one waited for the lock.
+        try:
+            if not os.path.samestat(os.fstat(journal.fileno()), os.stat(str(journal_path))):
+                return 0
+        except FileNotFoundError:
+            return 0
+        # What happened to each file is read from the filesystem.  The journal only says which files to look at.
+        moves = {}  # type: Dict[Tuple[str, str], None]
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line can be cut short by a crash.
+                continue
+            moves[(entry["source"], entry["destination"])] = None
+        recovered = settle_moves(moves, mode)
+        logger.warning(f"Recovered an interrupted archive journal at {journal_path}: {mode} moved {recovered} files")
+        journal_path.unlink()
+    return recovered
+
+
+def settle_moves(moves: Iterable[Tuple[str, str]], mode: str) -> int:
+    recovered = 0
+    for source_name, destination_name in moves:
+        source, destination = Path(source_name), Path(destination_name)
+        partial_path = Path(destination.parent, destination.name + PARTIAL_SUFFIX)
+        if partial_path.exists():
+            partial_path.unlink()
+        if source.exists() and destination.exists():
+            # Either a cross-device copy finished but the original wasn't removed yet, or the move was refused because
+            # the destination was already there.  Only identical files are taken to be the first case.
+            if not filecmp.cmp(str(source), str(destination), shallow=False):
+                logger.warning(f"Leaving {source} and {destination} alone because they differ")
+                continue
+            (source if mode == "finish" else destination).unlink()
+            recovered += 1
+        elif mode == "finish" and source.exists():
+            move_file(source, destination)
+            recovered += 1
+        elif mode == "rollback" and destination.exists():
+            move_file(destination, source)
+            recovered += 1
+    return recovered
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Set, Tuple, Union
+
+from csvlog.defaults import DEFAULT_PIPELINE_READERS
+
+logger = logging.getLogger(__name__)
+
+# Each reader may get this many chunks ahead of the writer before it has to wait for it.
+PIPELINE_QUEUE_DEPTH = 4
+# The chunks of a file are followed by this, and the input files by END_OF_INPUT.
+END_OF_FILE = object()
+END_OF_INPUT = object()
+
+Chunk = Union[bytes, str]
+# Returns an iterator whose first item says whether the file is merged at all, followed by the chunks to write if it
+# is.  Every step of the iterator runs on a reader thread, so it is where the file is opened, read and parsed.
+FileReader = Callable[[Path], Iterator[Union[bool, Chunk]]]
+
+
+class AsyncMergePipeline:
+    # Merges files with reading and writing overlapped.  An asyncio event loop reads up to readers files at once, each
+    # through executor threads, while a single writer writes their chunks, in input order, on a thread of its own.  The
+    # stages are joined by bounded queues, so readers wait when the writer falls behind and memory stays bounded by
+    # about (readers + 1) * (queue_depth + 1) chunks.  Yields each input path, with whether it was merged, once the
+    # last of its chunks has been written.
+    def __init__(self, read_file: FileReader, write_chunk: Callable[[Chunk], None],
+                 readers: int = DEFAULT_PIPELINE_READERS, queue_depth: int = PIPELINE_QUEUE_DEPTH):
+        self.read_file = read_file
+        self.write_chunk = write_chunk
+        self.readers = max(1, readers)
+        self.queue_depth = max(1, queue_depth)
+        self.read_pool = None  # type: Optional[ThreadPoolExecutor]
+        self.write_pool = None  # type: Optional[ThreadPoolExecutor]
+        self.loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self.tasks = set()  # type: Set[asyncio.Future]
+        self.open_readers = set()  # type: Set[Iterator]
+
+    def __call__(self, file_paths: Iterable[Path]) -> Iterator[Tuple[Path, bool]]:
+        loop = self.loop = asyncio.new_event_loop()
+        # One more thread than readers pulls the next input path, which may mean waiting on discovery.
+        self.read_pool = ThreadPoolExecutor(max_workers=self.readers + 1)
+        self.write_pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            # Queues are made inside the loop, since before Python 3.10 they bind to the loop that is current then.
+            finished, pipeline = loop.run_until_complete(self.start(iter(file_paths)))
+            while True:
+                next_finished = self.track(finished.get())
+                loop.run_until_complete(asyncio.wait([next_finished, pipeline],
+                                                     return_when=asyncio.FIRST_COMPLETED))
+                if not next_finished.done():
+                    next_finished.cancel()
+                    # The pipeline only stops early when it failed, and this raises its error.
+                    pipeline.result()
+                    continue
+                item = next_finished.result()
+                if item is END_OF_INPUT:
+                    break
+                # The loop is paused while the caller handles the file, so the caller's code never races the pipeline.
+                yield item
+            loop.run_until_complete(pipeline)
+        finally:
+            self.stop()
+
+    async def start(self, file_paths: Iterator[Path]) -> Tuple[asyncio.Queue, asyncio.Future]:
+        finished = asyncio.Queue()
+        return finished, self.track(self.run(file_paths, finished))
+
+    def track(self, coroutine) -> asyncio.Future:
+        # Running tasks are remembered so that stop can cancel them.  Finished ones forget themselves.
+        task = self.loop.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def stop(self) -> None:
+        # Cancels whatever is still running, waits for the threads and then closes readers that didn't finish.  A reader
+        # can only be closed once no thread is in the middle of it.
+        unfinished_tasks = [task for task in self.tasks if not task.done()]
+        for task in unfinished_tasks:
+            task.cancel()
+        if unfinished_tasks:
+            self.loop.run_until_complete(asyncio.gather(*unfinished_tasks, return_exceptions=True))
+        self.read_pool.shutdown(wait=True)
+        self.write_pool.shutdown(wait=True)
+        for file_reader in self.open_readers:
+            close = getattr(file_reader, "close", None)
+            if close is not None:
+                close()
+        self.open_readers.clear()
+        self.tasks.clear()
+        self.loop.close()
+        self.loop = None
+
+    async def run(self, file_paths: Iterator[Path], finished: asyncio.Queue) -> None:
+        slots = asyncio.Semaphore(self.readers)
+        files = asyncio.Queue(maxsize=self.readers)
+        self.track(self.start_readers(file_paths, slots, files))
+        await self.write_files(files, finished)
+
+    async def start_readers(self, file_paths: Iterator[Path], slots: asyncio.Semaphore, files: asyncio.Queue) -> None:
+        # Starts a reader for each input path, as soon as fewer than readers files are being read.  Errors are passed
+        # to the writer through the queue, which raises them in input order.
+        try:
+            while True:
+                await slots.acquire()
+                file_path = await self.loop.run_in_executor(self.read_pool, next, file_paths, None)
+                if file_path is None:
+                    slots.release()
+                    break
+                chunks = asyncio.Queue(maxsize=self.queue_depth)
+                self.track(self.read(file_path, chunks, slots))
+                await files.put((file_path, chunks))
+            await files.put(END_OF_INPUT)
+        except Exception as e:
+            await files.put(e)
+
+    async def read(self, file_path: Path, chunks: asyncio.Queue, slots: asyncio.Semaphore) -> None:
+        file_reader = self.read_file(file_path)
+        self.open_readers.add(file_reader)
+        try:
+            while True:
+                item = await self.loop.run_in_executor(self.read_pool, next, file_reader, END_OF_FILE)
+                await chunks.put(item)
+                if item is END_OF_FILE or item is False:
+                    break
+            close = getattr(file_reader, "close", None)
+            if close is not None:
+                await self.loop.run_in_executor(self.read_pool, close)
+            self.open_readers.discard(file_reader)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await chunks.put(e)
+        finally:
+            slots.release()
+
+    async def write_files(self, files: asyncio.Queue, finished: asyncio.Queue) -> None:
+        while True:
+            item = await files.get()
+            if item is END_OF_INPUT:
+                await finished.put(END_OF_INPUT)
+                return
+            if isinstance(item, Exception):
+                raise item
+            file_path, chunks = item
+            merged = await chunks.get()
+            if isinstance(merged, Exception):
+                raise merged
+            if merged is True:
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is END_OF_FILE:
+                        break
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    await self.loop.run_in_executor(self.write_pool, self.write_chunk, chunk)
+            await finished.put((file_path, merged is True))
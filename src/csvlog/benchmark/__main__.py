@@ -0,0 +1,5 @@
+import sys
+
+from csvlog.benchmark.command_line import main
+
+sys.exit(main())
@@ -0,0 +1,55 @@
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from csvlog.benchmark.corpus import SCENARIOS
+from csvlog.benchmark.runner import (DEFAULT_REGRESSION_THRESHOLD, compare_results, format_results, load_results,
+                                     run_benchmarks, save_results)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+
+def create_benchmark_argument_parser() -> argparse.ArgumentParser:
+    benchmark_parser = argparse.ArgumentParser(description="Time log merges of generated corpora")
+    benchmark_parser.add_argument("--scenario", help=f"Run only this scenario.  Repeat for more scenarios.",
+                                  choices=sorted(SCENARIOS), action="append")
+    benchmark_parser.add_argument("--scale", help=f"Multiply the size of every corpus by this.", type=float,
+                                  default=1.0)
+    benchmark_parser.add_argument("--repeat", help=f"Run every scenario this many times and keep the fastest.",
+                                  type=int, default=3)
+    benchmark_parser.add_argument("--seed", help=f"Seed for the corpus generator.", type=int, default=0)
+    benchmark_parser.add_argument("--work-directory", help=f"Generate corpora here instead of the temporary "
+                                                           f"directory.  Use it to benchmark a particular disk.")
+    benchmark_parser.add_argument("--output", "-o", help=f"Save the results to this JSON file.")
+    benchmark_parser.add_argument("--baseline", "-b", help=f"Compare the results to the ones saved in this JSON file "
+                                                           f"and fail if any phase got slower.")
+    benchmark_parser.add_argument("--threshold", help=f"How much slower than the baseline a phase may be, as a "
+                                                      f"fraction.", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    benchmark_parser.add_argument("--skip-startup", help=f"Don't time how long logmerge-csv takes to start.",
+                                  action="store_true")
+    benchmark_parser.add_argument("--verbose", "-v", help="Report each scenario as it finishes.", action="store_true")
+    return benchmark_parser
+
+
+def main() -> int:
+    args = create_benchmark_argument_parser().parse_args()
+    logging.getLogger().setLevel("INFO" if args.verbose else "WARNING")
+    results = run_benchmarks(args.scenario or sorted(SCENARIOS), args.scale, max(1, args.repeat), args.seed,
+                             Path(args.work_directory) if args.work_directory else None, not args.skip_startup)
+    print(format_results(results))
+    if args.output:
+        save_results(results, Path(args.output))
+    if args.baseline:
+        regressions = compare_results(load_results(Path(args.baseline)), results, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression.scenario} {regression.phase}: {regression.baseline_seconds:.3f}s -> "
+                  f"{regression.current_seconds:.3f}s ({regression.slowdown:+.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
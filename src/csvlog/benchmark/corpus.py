@@ -0,0 +1,86 @@
+import csv
+import random
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Sequence
+
+# The header and the item section header of a material order export, as in tests/yy-12345_MaterialOrder.csv.
+MATERIAL_ORDER_HEADER = ["Record Type", "Material Order", "Job number", "Description", "", "", "", "Record key", "",
+                         ""]
+ITEM_HEADER = ["Record Type", "Item", "Job Number", "Location", "Cost Type", "Material Number", "Ordered Units",
+               "Record Key", "Tax Code", "Phase"]
+REJECTED_HEADER = ["Timestamp", "Level", "Message"]
+WIDE_COLUMN_COUNT = 200
+
+
+class CorpusShape(NamedTuple):
+    # files is how many files are made, and items how many item rows each holds.  Files are spread over directories
+    # depth levels deep.  rejected_fraction of the files have a header the merge doesn't accept.  A wide corpus has
+    # WIDE_COLUMN_COUNT columns per row instead of an export's ten.
+    files: int
+    items: int
+    depth: int = 0
+    rejected_fraction: float = 0.0
+    wide: bool = False
+
+
+SCENARIOS = {
+    "tiny_files": CorpusShape(files=2000, items=5),
+    "huge_files": CorpusShape(files=3, items=200000),
+    "deep_tree": CorpusShape(files=1000, items=20, depth=8),
+    "rejected_headers": CorpusShape(files=2000, items=20, rejected_fraction=0.9),
+    "wide_rows": CorpusShape(files=50, items=2000, wide=True),
+}  # type: Dict[str, CorpusShape]
+
+
+def wide_header() -> List[str]:
+    return ["Record Type"] + [f"Field {number}" for number in range(1, WIDE_COLUMN_COUNT)]
+
+
+def header_for_shape(shape: CorpusShape) -> List[str]:
+    return wide_header() if shape.wide else MATERIAL_ORDER_HEADER
+
+
+def scaled_shape(shape: CorpusShape, scale: float) -> CorpusShape:
+    # Scaling changes how much data there is, but not its character.  Corpora of many files get fewer or more files,
+    # and corpora of a few big files get smaller or bigger files.
+    if shape.files > 10:
+        return shape._replace(files=max(1, round(shape.files * scale)))
+    return shape._replace(items=max(1, round(shape.items * scale)))
+
+
+def generate_corpus(directory: Path, shape: CorpusShape, seed: int = 0) -> None:
+    # The same shape and seed always produce the same files.
+    random_generator = random.Random(seed)
+    directory = Path(directory)
+    for file_number in range(shape.files):
+        file_directory = Path(directory, *(f"level{level}_{random_generator.randrange(3)}"
+                                           for level in range(random_generator.randint(0, shape.depth))))
+        file_directory.mkdir(parents=True, exist_ok=True)
+        job_number = f"yy-{random_generator.randrange(100000):05}"
+        file_path = Path(file_directory, f"{job_number}_{file_number:06}_MaterialOrder.csv")
+        with file_path.open(mode="w", newline="") as export_file:
+            export_writer = csv.writer(export_file)
+            if random_generator.random() < shape.rejected_fraction:
+                export_writer.writerow(REJECTED_HEADER)
+                export_writer.writerows([f"2020-06-04T12:00:{row_number % 60:02}", "INFO", "export started"]
+                                        for row_number in range(shape.items))
+            elif shape.wide:
+                export_writer.writerow(wide_header())
+                export_writer.writerows(wide_rows(random_generator, shape.items))
+            else:
+                export_writer.writerow(MATERIAL_ORDER_HEADER)
+                export_writer.writerow(["INMB", f"{job_number}01", job_number, "export test 6.4.2020 v1", "", "", "",
+                                        "1", "", ""])
+                export_writer.writerow(ITEM_HEADER)
+                export_writer.writerows(item_rows(random_generator, job_number, shape.items))
+
+
+def item_rows(random_generator: random.Random, job_number: str, count: int) -> Sequence[List[str]]:
+    return [["INIB", str(item), job_number, "", "2", f"1-{random_generator.randrange(16 ** 5):05X}",
+             str(random_generator.choice((1, 2, 9, 10, 24, 45, 100))), "1", "WI-ADA", "01.01.01"]
+            for item in range(1, count + 1)]
+
+
+def wide_rows(random_generator: random.Random, count: int) -> Sequence[List[str]]:
+    return [["INIB"] + [str(random_generator.randrange(1000000)) for _ in range(WIDE_COLUMN_COUNT - 1)]
+            for _ in range(count)]
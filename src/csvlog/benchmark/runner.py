@@ -0,0 +1,162 @@
+import json
+import logging
+import platform
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from csvlog.archive import Archiver
+from csvlog.benchmark.corpus import SCENARIOS, CorpusShape, generate_corpus, header_for_shape, scaled_shape
+from csvlog.benchmark.startup import STARTUP_PHASES, run_startup_benchmark
+from csvlog.csv_merge import get_csv_paths_in_directory, merge_file_paths
+from csvlog.header_probe import HeaderProbe
+
+logger = logging.getLogger(__name__)
+
+RESULTS_VERSION = 1
+PHASES = ("discovery", "header_check", "merge", "archive")
+# A phase is a regression when it takes this much longer than in the baseline.  Shorter phases are noisier, so phases
+# that took less than MINIMUM_COMPARED_SECONDS in the baseline aren't compared at all.
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+MINIMUM_COMPARED_SECONDS = 0.05
+# Startup takes tens of milliseconds, and it is the fastest of several runs, so it is compared at a much finer scale.
+MINIMUM_COMPARED_STARTUP_SECONDS = 0.005
+
+
+class Regression(NamedTuple):
+    scenario: str
+    phase: str
+    baseline_seconds: float
+    current_seconds: float
+
+    @property
+    def slowdown(self) -> float:
+        return self.current_seconds / self.baseline_seconds - 1
+
+
+def run_scenario(shape: CorpusShape, work_directory: Path, seed: int = 0) -> Dict:
+    # Times one merge of a freshly generated corpus, phase by phase.  Each phase works on the complete result of the
+    # one before it, so the time of one isn't hidden inside another the way it is in a streamed merge.
+    search_directory = Path(work_directory, "input")
+    output_directory = Path(work_directory, "output")
+    archive_directory = Path(work_directory, "archive")
+    search_directory.mkdir(parents=True)
+    output_directory.mkdir()
+    generate_corpus(search_directory, shape, seed)
+    header_row = header_for_shape(shape)
+    output_file_path = Path(output_directory, "merged.csv")
+    timings = {}
+
+    start = time.perf_counter()
+    candidate_paths = list(get_csv_paths_in_directory(search_directory, output_file_path, recurse=True))
+    timings["discovery"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    accepted_paths = list(HeaderProbe(header_row)(iter(candidate_paths)))
+    timings["header_check"] = time.perf_counter() - start
+
+    input_bytes = sum(path.stat().st_size for path in accepted_paths)
+    start = time.perf_counter()
+    merged_paths = []  # type: List[Path]
+    merge_file_paths(iter(accepted_paths), search_directory, output_file_path, header_row,
+                     on_merged=merged_paths.append)
+    timings["merge"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with Archiver(search_directory, archive_directory) as archiver:
+        for merged_path in merged_paths:
+            archiver.archive(merged_path)
+    timings["archive"] = time.perf_counter() - start
+
+    with output_file_path.open(mode="rb") as output_file:
+        output_rows = sum(1 for _ in output_file) - 1
+    merge_seconds = max(timings["merge"], 1e-9)
+    return {"files": len(candidate_paths), "merged_files": len(merged_paths), "rows": output_rows,
+            "input_bytes": input_bytes, "phases": timings,
+            "rows_per_second": output_rows / merge_seconds,
+            "megabytes_per_second": input_bytes / (1024 * 1024) / merge_seconds}
+
+
+def run_benchmarks(scenario_names: Iterable[str] = tuple(SCENARIOS), scale: float = 1.0, repeat: int = 1,
+                   seed: int = 0, work_directory: Optional[Path] = None, startup: bool = True) -> Dict:
+    # Every scenario is run repeat times on a new copy of its corpus and the fastest time of each phase is kept.  The
+    # fastest run is the one least disturbed by whatever else the machine was doing.
+    results = {"version": RESULTS_VERSION, "python": platform.python_version(), "platform": platform.platform(),
+               "scale": scale, "seed": seed, "scenarios": {}}
+    for scenario_name in scenario_names:
+        shape = scaled_shape(SCENARIOS[scenario_name], scale)
+        runs = []
+        for run_number in range(repeat):
+            run_directory = Path(tempfile.mkdtemp(prefix=f"logmerge-benchmark-{scenario_name}-",
+                                                  dir=str(work_directory) if work_directory else None))
+            try:
+                runs.append(run_scenario(shape, run_directory, seed))
+            finally:
+                shutil.rmtree(run_directory, ignore_errors=True)
+        best_result = dict(runs[0])
+        best_result["phases"] = {phase: min(run["phases"][phase] for run in runs) for phase in PHASES}
+        merge_seconds = max(best_result["phases"]["merge"], 1e-9)
+        best_result["rows_per_second"] = best_result["rows"] / merge_seconds
+        best_result["megabytes_per_second"] = best_result["input_bytes"] / (1024 * 1024) / merge_seconds
+        results["scenarios"][scenario_name] = best_result
+        logger.info(f"{scenario_name}: {best_result['rows_per_second']:.0f} rows/s, "
+                    f"{best_result['megabytes_per_second']:.1f} MB/s")
+    if startup:
+        results["startup"] = run_startup_benchmark(work_directory=work_directory)
+        logger.info(f"startup: {results['startup']['empty_run']:.3f}s for a run with nothing to merge")
+    return results
+
+
+def save_results(results: Dict, results_path: Path) -> None:
+    with Path(results_path).open(mode="w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def load_results(results_path: Path) -> Dict:
+    with Path(results_path).open() as results_file:
+        results = json.load(results_file)
+    if results.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{results_path} holds results in an unknown format")
+    return results
+
+
+def compare_results(baseline: Dict, current: Dict,
+                    threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> List[Regression]:
+    # Only scenarios that are in both results are compared.  Results made at different scales can't be compared.
+    if baseline.get("scale") != current.get("scale"):
+        raise ValueError(f"The baseline was run at scale {baseline.get('scale')} and these results at scale "
+                         f"{current.get('scale')}")
+    regressions = []
+    for scenario_name, current_result in current["scenarios"].items():
+        baseline_result = baseline["scenarios"].get(scenario_name)
+        if baseline_result is None:
+            continue
+        for phase in PHASES:
+            baseline_seconds = baseline_result["phases"][phase]
+            current_seconds = current_result["phases"][phase]
+            if baseline_seconds >= MINIMUM_COMPARED_SECONDS and current_seconds > baseline_seconds * (1 + threshold):
+                regressions.append(Regression(scenario_name, phase, baseline_seconds, current_seconds))
+    # Results saved before startup was measured, or without it, have nothing to compare.
+    if "startup" in baseline and "startup" in current:
+        for phase in STARTUP_PHASES:
+            baseline_seconds = baseline["startup"][phase]
+            current_seconds = current["startup"][phase]
+            if (baseline_seconds >= MINIMUM_COMPARED_STARTUP_SECONDS and
+                    current_seconds > baseline_seconds * (1 + threshold)):
+                regressions.append(Regression("startup", phase, baseline_seconds, current_seconds))
+    return regressions
+
+
+def format_results(results: Dict) -> str:
+    lines = [f"{'scenario':<18}{'files':>8}{'rows':>10}" + "".join(f"{phase:>14}" for phase in PHASES) +
+             f"{'rows/s':>12}{'MB/s':>8}"]
+    for scenario_name, result in results["scenarios"].items():
+        lines.append(f"{scenario_name:<18}{result['files']:>8}{result['rows']:>10}" +
+                     "".join(f"{result['phases'][phase]:>13.3f}s" for phase in PHASES) +
+                     f"{result['rows_per_second']:>12.0f}{result['megabytes_per_second']:>8.1f}")
+    if "startup" in results:
+        lines.append("startup" + "".join(f"{phase:>14}" for phase in STARTUP_PHASES))
+        lines.append(" " * 7 + "".join(f"{results['startup'][phase]:>13.3f}s" for phase in STARTUP_PHASES))
+    return "\n".join(lines)
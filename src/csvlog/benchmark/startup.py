@@ -0,0 +1,43 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Each startup measurement is the fastest of this many runs.  A single start takes tens of milliseconds, so one slow
+# run would otherwise decide the result.
+STARTUP_RUNS = 5
+STARTUP_PHASES = ("interpreter", "import", "empty_run")
+
+
+def time_command(command: List[str], environment: Dict[str, str], runs: int = STARTUP_RUNS) -> float:
+    fastest = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=environment, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        fastest = min(fastest, time.perf_counter() - start)
+    return fastest
+
+
+def run_startup_benchmark(runs: int = STARTUP_RUNS, work_directory: Optional[Path] = None) -> Dict[str, float]:
+    # Times starting a bare interpreter, importing the command line module and a whole run of logmerge-csv that finds
+    # nothing to merge.  The runs get a home directory of their own, so the configuration file they create and cache
+    # isn't the user's.  A first, untimed run creates it, so the timed runs are the ones a scheduler sees every day.
+    home_directory = Path(tempfile.mkdtemp(prefix="logmerge-benchmark-startup-",
+                                           dir=str(work_directory) if work_directory else None))
+    try:
+        input_directory = Path(home_directory, "input")
+        input_directory.mkdir()
+        environment = dict(os.environ, HOME=str(home_directory), USERPROFILE=str(home_directory))
+        # The package may only be on this process's path, for example when it is run from a source checkout.
+        environment["PYTHONPATH"] = os.pathsep.join(path for path in sys.path if path)
+        empty_run = [sys.executable, "-m", "csvlog.command_line", "-i", str(input_directory), "-A"]
+        time_command(empty_run, environment, runs=1)
+        return {"interpreter": time_command([sys.executable, "-c", "pass"], environment, runs),
+                "import": time_command([sys.executable, "-c", "import csvlog.command_line"], environment, runs),
+                "empty_run": time_command(empty_run, environment, runs)}
+    finally:
+        shutil.rmtree(home_directory, ignore_errors=True)
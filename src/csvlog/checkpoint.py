@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+from csv import writer
+from pathlib import Path
+from typing import IO, Iterable, Optional, Sequence, Set
+
+from csvlog.compression import compression_for_path, open_output_file
+
+logger = logging.getLogger(__name__)
+
+# The output is written under this suffix and only renamed to its real name once the merge is complete.  The suffix
+# also keeps an unfinished output from matching the include patterns of a later run.
+PARTIAL_OUTPUT_SUFFIX = ".partial"
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+def partial_output_path(output_file_path: Path) -> Path:
+    return Path(output_file_path.parent, output_file_path.name + PARTIAL_OUTPUT_SUFFIX)
+
+
+def checkpoint_log_path(output_file_path: Path) -> Path:
+    return Path(output_file_path.parent, output_file_path.name + CHECKPOINT_SUFFIX)
+
+
+def find_resumable_output(directory: Path) -> Optional[Path]:
+    # Returns the output of the most recent interrupted merge in directory, or None if there isn't one.
+    checkpoint_paths = [path for path in Path(directory).glob(f"*{CHECKPOINT_SUFFIX}")
+                        if partial_output_path(Path(str(path)[:-len(CHECKPOINT_SUFFIX)])).exists()]
+    if not checkpoint_paths:
+        return None
+    newest_checkpoint_path = max(checkpoint_paths, key=lambda path: path.stat().st_mtime)
+    return Path(str(newest_checkpoint_path)[:-len(CHECKPOINT_SUFFIX)])
+
+
+class MergeCheckpoint:
+    # Makes a merge crash safe.  The output is written to a partial file that is atomically renamed into place by
+    # commit().  Along the way record() syncs the partial output and appends its size and the inputs that are now fully
+    # written to a checkpoint log.  A merge that was interrupted is resumed by truncating the partial output back to
+    # the last checkpoint and skipping the inputs the log lists.
+    def __init__(self, output_file_path: Path, resume: bool = False):
+        if compression_for_path(output_file_path):
+            raise ValueError("Compressed output can't be checkpointed, a compressed stream can't be cut at an offset.")
+        self.output_file_path = Path(output_file_path)
+        self.partial_path = partial_output_path(self.output_file_path)
+        self.checkpoint_path = checkpoint_log_path(self.output_file_path)
+        self.offset = 0
+        self.merged = set()  # type: Set[str]
+        if resume:
+            self.load()
+        elif self.checkpoint_path.exists():
+            logger.warning(f"Discarding the checkpoint of an earlier merge into {self.output_file_path}")
+            self.checkpoint_path.unlink()
+        self.checkpoint_log = None
+
+    def load(self) -> None:
+        if not self.checkpoint_path.exists() or not self.partial_path.exists():
+            raise FileNotFoundError(f"There is no interrupted merge into {self.output_file_path} to resume.")
+        with self.checkpoint_path.open(encoding="utf-8") as checkpoint_log:
+            for line in checkpoint_log:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash while appending can leave the last line cut short.  The checkpoint before it stands.
+                    break
+                self.offset = entry["offset"]
+                self.merged.update(entry["merged"])
+        logger.info(f"Resuming the merge into {self.output_file_path} after {len(self.merged)} files")
+
+    def is_merged(self, file_path: Path) -> bool:
+        return os.path.abspath(str(file_path)) in self.merged
+
+    def open_output(self, header_row: Optional[Sequence[str]] = None, binary: bool = False) -> IO:
+        # Anything written after the last checkpoint is thrown away.  Without any checkpoint that is everything,
+        # header included.
+        with self.partial_path.open(mode="ab"):
+            pass
+        os.truncate(str(self.partial_path), self.offset)
+        if self.offset == 0 and header_row:
+            with open_output_file(self.partial_path, "a") as output_file:
+                writer(output_file).writerow(header_row)
+        self.checkpoint_log = self.checkpoint_path.open(mode="a", encoding="utf-8")
+        return open_output_file(self.partial_path, "ab" if binary else "a")
+
+    def record(self, output_file: IO, merged_file_paths: Iterable[Path]) -> None:
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        self.offset = os.fstat(output_file.fileno()).st_size
+        merged_names = [os.path.abspath(str(file_path)) for file_path in merged_file_paths]
+        self.merged.update(merged_names)
+        self.checkpoint_log.write(json.dumps({"offset": self.offset, "merged": merged_names}) + "\n")
+        self.checkpoint_log.flush()
+        os.fsync(self.checkpoint_log.fileno())
+
+    def commit(self, output_file: IO) -> None:
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        output_file.close()
+        os.replace(str(self.partial_path), str(self.output_file_path))
+        self.close()
+        self.checkpoint_path.unlink()
+
+    def close(self) -> None:
+        if self.checkpoint_log is not None:
+            self.checkpoint_log.close()
+            self.checkpoint_log = None
@@ -1,10 +1,17 @@
 import argparse
 import logging
-from ast import literal_eval
+import os
+import sys
 from pathlib import Path
 
+from csvlog.archive import find_archive_journals
+from csvlog.compression import COMPRESSION_SUFFIXES, compression_for_path
 from csvlog.config_file import LogmergeConfig, get_configuration, log_levels
-from csvlog.csv_merge import merge_log_files
+from csvlog.defaults import FSYNC_POLICIES, RECOVERY_MODES
+from csvlog.discovery import has_candidate_files
+
+# The merge machinery is imported by the functions that use it, so that a run with nothing to merge, which is most
+# runs from a scheduler, starts and finishes quickly.
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -17,6 +24,9 @@ logger = logging.getLogger(__name__)
 # I used constant objects here because I don't want them to be ambiguous.  If I just used a string like "DEFAULT"
 # then the user could just type "DEFAULT" on the command line.
 DEFAULT_OBJECT = object()
+# An output location or stats file named this goes to standard output, and a file list named this is read from
+# standard input.
+STANDARD_OUTPUT = STANDARD_INPUT = "-"
 
 
 # Unfortunately, doing it this way means that I don't think I can hide the work of processing user input in custom
@@ -33,8 +43,18 @@ def create_csv_merge_argument_parser() -> argparse.ArgumentParser:
                                   default=DEFAULT_OBJECT)
     csv_merge_parser.add_argument("--output-location", "-o",
                                   help=f"Force output to the supplied location, "
-                                       f"defaults to a unique time-based name in the data directory",
+                                       f"defaults to a unique time-based name in the data directory.  "
+                                       f"Use - to write to standard output",
+                                  default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--compress",
+                                  help=f"Compress the output in this format.  The matching suffix is added to the "
+                                       f"output name.  An output name that already ends in a compression suffix is "
+                                       f"compressed either way.",
+                                  choices=[suffix.lstrip(".") for suffix in COMPRESSION_SUFFIXES],
                                   default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--compression-level",
+                                  help=f"The compression level to use for compressed output.",
+                                  type=int, default=DEFAULT_OBJECT)
     archive_argument = csv_merge_parser.add_mutually_exclusive_group()
     archive_argument.add_argument("-a", "--archive",
                                   help=f"Force merged files to be moved to the archive folder, "
@@ -43,6 +63,14 @@ def create_csv_merge_argument_parser() -> argparse.ArgumentParser:
     archive_argument.add_argument("--no-archive", "-A",
                                   help=f"Force no archiving.  Merged files will not be moved.",
                                   dest="archive", const=False, action="store_const")
+    csv_merge_parser.add_argument("--rollback-archive",
+                                  help=f"If an earlier run was interrupted while archiving, move the files it archived "
+                                       f"back so they are merged again, instead of finishing its moves.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
+    csv_merge_parser.add_argument("--incremental", "-n",
+                                  help=f"Skip files that an earlier run already merged and that haven't changed since.  "
+                                       f"Only used when archiving is off.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
     recursion_argument = csv_merge_parser.add_mutually_exclusive_group()
     recursion_argument.add_argument("--recursive", "-r",
                                     help=f"Force a recursive search for log files.  "
@@ -52,6 +80,27 @@ def create_csv_merge_argument_parser() -> argparse.ArgumentParser:
                                     help=f"Force a flat (non-recursive) search for log files.  "
                                          f"Subdirectories of the input directory will not be scanned",
                                     const=False, action="store_const", dest="recursive")
+    csv_merge_parser.add_argument("--max-depth",
+                                  help=f"Limit how many levels of subdirectories a recursive search descends into.",
+                                  type=int, default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--include",
+                                  help=f"Only merge files matching this pattern.  Repeat for more patterns.  "
+                                       f"Replaces the configured patterns.", action="append")
+    csv_merge_parser.add_argument("--exclude",
+                                  help=f"Skip files and directories matching this pattern.  Repeat for more patterns.  "
+                                       f"Added to the configured patterns.", action="append")
+    csv_merge_parser.add_argument("--files-from",
+                                  help=f"Merge the files listed in this file, or on standard input for -, instead of "
+                                       f"searching the input directory.  Paths are one per line or separated by NUL "
+                                       f"characters, as find -print0 writes them.  Relative paths are relative to the "
+                                       f"input directory and files outside it are skipped.",
+                                  default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--shard",
+                                  help=f"Only merge the files of shard K out of N, written K/N with K from 1 to N.  "
+                                       f"Each file belongs to exactly one shard, by a hash of its path below the input "
+                                       f"directory, so N hosts can split a merge.  The shard is added to the output "
+                                       f"name.  Use logmerge-concat to join the outputs.",
+                                  default=DEFAULT_OBJECT)
     header_argument = csv_merge_parser.add_mutually_exclusive_group()
     header_argument.add_argument("--header", "-t",
                                  help=f"Force header checking using the configured header, "
@@ -60,6 +109,84 @@ def create_csv_merge_argument_parser() -> argparse.ArgumentParser:
     header_argument.add_argument("--no-header", "-T", help=f"Force no header checking.  "
                                                            f"This will merge every .csv file found.", const=False,
                                  action="store_const", dest="header")
+    csv_merge_parser.add_argument("--passthrough", "-p",
+                                  help=f"Copy the records of merged files as raw bytes instead of parsing them.  "
+                                       f"Only the header line is checked.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
+    csv_merge_parser.add_argument("--sort-by",
+                                  help=f"Order the merged output by this column, named by its header or given as a "
+                                       f"zero based column number.  Repeat for secondary keys.",
+                                  action="append")
+    csv_merge_parser.add_argument("--where",
+                                  help=f"Only merge rows that meet this condition: COLUMN=VALUE, COLUMN=VALUE|VALUE "
+                                       f"for any of several values, COLUMN^=PREFIX or COLUMN~=REGEX.  Columns are "
+                                       f"named by their header or given as a zero based column number.  Repeat for "
+                                       f"rows that meet every condition.",
+                                  action="append")
+    csv_merge_parser.add_argument("--split-sections",
+                                  help=f"Write each section of the merged files to its own output, named after the "
+                                       f"section, using the configured section headers.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
+    csv_merge_parser.add_argument("--dedup",
+                                  help=f"Drop rows that are exact copies of a row already merged, from any file.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
+    csv_merge_parser.add_argument("--dedup-by",
+                                  help=f"Treat rows as copies when this column matches, named by its header or given "
+                                       f"as a zero based column number.  Repeat for more columns.  Implies --dedup.",
+                                  action="append")
+    csv_merge_parser.add_argument("--max-part-bytes",
+                                  help=f"Split the output into numbered part files of about this many bytes each, "
+                                       f"before compression.  Parts always end between rows.",
+                                  type=int, default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--max-part-rows",
+                                  help=f"Split the output into numbered part files of at most this many rows each.",
+                                  type=int, default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--writer-threads",
+                                  help=f"Write up to this many part files at the same time.",
+                                  type=int, default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--sqlite",
+                                  help=f"Load the merged rows into a SQLite database at the output location instead of "
+                                       f"writing a csv file.  The columns are named after the header.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
+    csv_merge_parser.add_argument("--sqlite-index",
+                                  help=f"Index this column of the SQLite table once the load is done.  Repeat for more "
+                                       f"indexes.", action="append")
+    csv_merge_parser.add_argument("--checkpoint",
+                                  help=f"Write the output under a temporary name, checkpoint progress as files are "
+                                       f"merged and only give it its real name once the merge is complete.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
+    csv_merge_parser.add_argument("--resume",
+                                  help=f"Continue an interrupted checkpointed merge from its last checkpoint.  Without "
+                                       f"--output-location the newest one in the output folder is continued.",
+                                  action="store_true")
+    csv_merge_parser.add_argument("--pipeline",
+                                  help=f"Read, check and parse several files at once while earlier ones are written.  "
+                                       f"The output is the same as an ordinary merge.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
+    csv_merge_parser.add_argument("--pipeline-readers",
+                                  help=f"Read up to this many files at the same time in a pipelined merge.  "
+                                       f"Implies --pipeline.",
+                                  type=int, default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--stats",
+                                  help=f"Write a JSON report of how long each phase took and how many files, rows and "
+                                       f"bytes were merged to this file, or to standard output if no file is given.",
+                                  nargs="?", default=DEFAULT_OBJECT, const="-")
+    csv_merge_parser.add_argument("--profile",
+                                  help=f"Run under cProfile and save the profile to this file, for pstats or snakeviz.")
+    csv_merge_parser.add_argument("--trace-memory",
+                                  help=f"Trace memory allocations and save a tracemalloc snapshot to this file.")
+    csv_merge_parser.add_argument("--jobs", "-j",
+                                  help=f"Merge files in this many worker processes.  "
+                                       f"The output is the same as a single process merge.",
+                                  type=int, default=DEFAULT_OBJECT)
+    csv_merge_parser.add_argument("--watch", "-w",
+                                  help=f"Keep running and merge new log files in batches as they arrive.  "
+                                       f"The output rolls over to a new file periodically.",
+                                  action="store_true")
+    csv_merge_parser.add_argument("--header-cache",
+                                  help=f"Remember which files failed the header check so unchanged ones aren't opened "
+                                       f"again on later runs.",
+                                  default=DEFAULT_OBJECT, const=True, action="store_const")
     verbosity_argument = csv_merge_parser.add_mutually_exclusive_group()
     verbosity_argument.add_argument("--verbose", "-v", help="Increase verbosity, repeat for even more detail.",
                                     action="count", default=0)
@@ -80,16 +207,44 @@ def update_configuration_from_args(configuration: LogmergeConfig, args: argparse
         return configuration
 
     def handle_output_location_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.output_location == STANDARD_OUTPUT:
+            configuration.output_to_stdout = True
+            return configuration
         res = Path(args.output_location) if args.output_location is not DEFAULT_OBJECT else (
             configuration.output_location)
+        if res.is_dir():
+            res = Path(res, f"{configuration.name_date_component}.csv")
+        # Every shard writes an output of its own, which may well be in the same directory as the others.
+        if configuration.shard:
+            from csvlog.sharding import parse_shard, shard_output_path
+
+            res = shard_output_path(res, *parse_shard(configuration.shard))
         if res.exists():
-            if res.is_dir():
-                res = Path(res, f"{configuration.name_date_component}.csv")
-            else:
-                raise (FileExistsError(f"The file {res} already exists and will not be overwritten."))
+            raise (FileExistsError(f"The file {res} already exists and will not be overwritten."))
         configuration.output_location = res
         return configuration
 
+    def handle_compress_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        compression_suffix = configuration.compression if args.compress is DEFAULT_OBJECT else args.compress
+        if configuration.output_to_stdout:
+            # Standard output has no name to take a suffix, so it is never compressed.
+            if args.compress is not DEFAULT_OBJECT:
+                raise argparse.ArgumentTypeError("--compress can't be combined with -o -.")
+            compression_suffix = None
+        if args.compression_level is not DEFAULT_OBJECT:
+            configuration.compression_level = args.compression_level
+        if compression_suffix:
+            compression_suffix = f".{compression_suffix.lstrip('.')}"
+            if compression_suffix not in COMPRESSION_SUFFIXES:
+                raise argparse.ArgumentTypeError(f"{compression_suffix} is not a supported compression format.")
+            res = configuration.output_location
+            if res.suffix.lower() != compression_suffix:
+                res = Path(res.parent, f"{res.name}{compression_suffix}")
+                if res.exists():
+                    raise (FileExistsError(f"The file {res} already exists and will not be overwritten."))
+            configuration.output_location = res
+        return configuration
+
     def handle_archive_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
         archive_path = Path(configuration.archive_folder)
         do_archive = bool(configuration.archive)
@@ -114,24 +269,259 @@ def update_configuration_from_args(configuration: LogmergeConfig, args: argparse
 
         configuration.archive = do_archive
         configuration.archive_folder = archive_path
+        if args.rollback_archive is not DEFAULT_OBJECT:
+            configuration.archive_recovery = "rollback"
+        if configuration.archive_recovery not in RECOVERY_MODES:
+            raise argparse.ArgumentTypeError(f"{configuration.archive_recovery} is not an archive recovery mode.")
+        return configuration
+
+    def handle_files_from_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.files_from is not DEFAULT_OBJECT:
+            if args.files_from != STANDARD_INPUT and not Path(args.files_from).is_file():
+                raise argparse.ArgumentTypeError(f"The file list {args.files_from} doesn't exist.")
+            if args.watch:
+                raise argparse.ArgumentTypeError("--files-from can't be combined with --watch.")
+            configuration.files_from = args.files_from
+        return configuration
+
+    def handle_shard_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.shard is not DEFAULT_OBJECT:
+            configuration.shard = args.shard
+        if configuration.shard:
+            from csvlog.sharding import parse_shard
+
+            try:
+                parse_shard(configuration.shard)
+            except ValueError as e:
+                raise argparse.ArgumentTypeError(str(e))
+            # Watching has no end for the outputs to be joined at.
+            if args.watch:
+                raise argparse.ArgumentTypeError("--shard can't be combined with --watch.")
+        return configuration
+
+    def handle_header_cache_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        configuration.header_cache = configuration.header_cache if args.header_cache is DEFAULT_OBJECT else True
         return configuration
 
     def handle_recursive_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
         configuration.recursive = configuration.recursive if args.recursive is DEFAULT_OBJECT else bool(args.recursive)
         return configuration
 
+    def handle_discovery_arguments(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.max_depth is not DEFAULT_OBJECT:
+            if args.max_depth < 0:
+                raise argparse.ArgumentTypeError(f"--max-depth {args.max_depth} must not be negative.")
+            configuration.max_depth = args.max_depth
+        if args.include:
+            configuration.include_patterns = list(args.include)
+        if args.exclude:
+            configuration.exclude_patterns = list(configuration.exclude_patterns) + list(args.exclude)
+        return configuration
+
     def handle_header_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
         header_arg = args.header
         file_header = configuration.header
         if header_arg is False:
             file_header = None
         if isinstance(header_arg, str):
+            from ast import literal_eval
+
             file_header = literal_eval(header_arg)
             if not isinstance(file_header, (list, tuple)):
                 raise argparse.ArgumentTypeError(f"{file_header} is not a valid header row.")
         configuration.header = file_header
         return configuration
 
+    def handle_incremental_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        configuration.incremental = configuration.incremental if args.incremental is DEFAULT_OBJECT else True
+        if configuration.incremental and configuration.archive:
+            logger.info("Incremental merging is ignored because merged files are being archived.")
+        return configuration
+
+    def handle_passthrough_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        configuration.passthrough = configuration.passthrough if args.passthrough is DEFAULT_OBJECT else True
+        return configuration
+
+    def handle_jobs_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.jobs is not DEFAULT_OBJECT:
+            if args.jobs < 1:
+                raise argparse.ArgumentTypeError(f"--jobs {args.jobs} must be at least 1.")
+            configuration.jobs = args.jobs
+        return configuration
+
+    def handle_sort_by_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.sort_by:
+            configuration.sort_columns = list(args.sort_by)
+        if configuration.sort_columns:
+            if configuration.passthrough or configuration.jobs > 1 or args.watch:
+                raise argparse.ArgumentTypeError("--sort-by can't be combined with --passthrough, --jobs or --watch.")
+            from csvlog.sorted_merge import resolve_key_columns
+
+            # Columns are named by the header, so without one they can only be given by number.
+            try:
+                resolve_key_columns(configuration.sort_columns, configuration.header)
+            except ValueError as e:
+                raise argparse.ArgumentTypeError(str(e))
+        return configuration
+
+    def handle_split_sections_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        configuration.split_sections = (configuration.split_sections if args.split_sections is DEFAULT_OBJECT
+                                        else True)
+        if configuration.split_sections:
+            if not isinstance(configuration.section_headers, dict) or not configuration.section_headers:
+                raise argparse.ArgumentTypeError(f"{configuration.section_headers} is not a valid set of section "
+                                                 f"headers.")
+            if configuration.passthrough or configuration.jobs > 1 or configuration.sort_columns or args.watch:
+                raise argparse.ArgumentTypeError("--split-sections can't be combined with --passthrough, --jobs, "
+                                                 "--sort-by or --watch.")
+        return configuration
+
+    def handle_dedup_arguments(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        configuration.deduplicate = configuration.deduplicate if args.dedup is DEFAULT_OBJECT else True
+        if args.dedup_by:
+            configuration.deduplicate = True
+            configuration.dedup_columns = list(args.dedup_by)
+        if configuration.deduplicate and (configuration.passthrough or configuration.jobs > 1 or args.watch):
+            raise argparse.ArgumentTypeError("--dedup can't be combined with --passthrough, --jobs or --watch.")
+        return configuration
+
+    def handle_part_arguments(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.max_part_bytes is not DEFAULT_OBJECT:
+            if args.max_part_bytes < 0:
+                raise argparse.ArgumentTypeError(f"--max-part-bytes {args.max_part_bytes} must not be negative.")
+            configuration.max_part_bytes = args.max_part_bytes
+        if args.max_part_rows is not DEFAULT_OBJECT:
+            if args.max_part_rows < 0:
+                raise argparse.ArgumentTypeError(f"--max-part-rows {args.max_part_rows} must not be negative.")
+            configuration.max_part_rows = args.max_part_rows
+        if args.writer_threads is not DEFAULT_OBJECT:
+            if args.writer_threads < 1:
+                raise argparse.ArgumentTypeError(f"--writer-threads {args.writer_threads} must be at least 1.")
+            configuration.writer_threads = args.writer_threads
+        if (configuration.max_part_bytes > 0 or configuration.max_part_rows > 0) and (
+                configuration.passthrough or configuration.jobs > 1 or configuration.sort_columns or
+                configuration.split_sections or configuration.watch):
+            raise argparse.ArgumentTypeError("Part files can't be combined with --passthrough, --jobs, --sort-by, "
+                                             "--split-sections or --watch.")
+        return configuration
+
+    def handle_sqlite_arguments(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.sqlite is not DEFAULT_OBJECT:
+            configuration.output_format = "sqlite"
+        if args.sqlite_index:
+            configuration.sqlite_index_columns = list(args.sqlite_index)
+        if configuration.output_format not in ("csv", "sqlite"):
+            raise argparse.ArgumentTypeError(f"{configuration.output_format} is not a supported output format.")
+        if configuration.output_format == "sqlite":
+            if not configuration.header:
+                raise argparse.ArgumentTypeError("--sqlite needs a header to name the table's columns.")
+            if (configuration.passthrough or configuration.jobs > 1 or configuration.sort_columns or
+                    configuration.split_sections or configuration.watch or
+                    compression_for_path(configuration.output_location)):
+                raise argparse.ArgumentTypeError("--sqlite can't be combined with --passthrough, --jobs, --sort-by, "
+                                                 "--split-sections, --watch or --compress.")
+            # The generated output name is for a csv file.
+            if configuration.output_location.suffix.lower() == ".csv":
+                res = configuration.output_location.with_suffix(".sqlite3")
+                if res.exists():
+                    raise (FileExistsError(f"The file {res} already exists and will not be overwritten."))
+                configuration.output_location = res
+        return configuration
+
+    def handle_where_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.where:
+            configuration.where = list(args.where)
+        if configuration.where:
+            if (configuration.passthrough or configuration.jobs > 1 or configuration.sort_columns or
+                    configuration.split_sections or configuration.output_format != "csv" or configuration.watch):
+                raise argparse.ArgumentTypeError("--where can't be combined with --passthrough, --jobs, --sort-by, "
+                                                 "--split-sections, --sqlite or --watch.")
+            from csvlog.row_filter import RowFilter
+
+            try:
+                RowFilter(configuration.where, configuration.header)
+            except ValueError as e:
+                raise argparse.ArgumentTypeError(str(e))
+        return configuration
+
+    def handle_checkpoint_arguments(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        configuration.checkpoint = configuration.checkpoint if args.checkpoint is DEFAULT_OBJECT else True
+        configuration.resume = bool(args.resume)
+        if configuration.checkpoint or configuration.resume:
+            if (configuration.jobs > 1 or configuration.sort_columns or configuration.split_sections or
+                    configuration.max_part_bytes > 0 or configuration.max_part_rows > 0 or
+                    configuration.output_format != "csv" or configuration.watch or
+                    compression_for_path(configuration.output_location)):
+                raise argparse.ArgumentTypeError("--checkpoint and --resume can't be combined with --jobs, --sort-by, "
+                                                 "--split-sections, part files, --sqlite, --watch or --compress.")
+        if configuration.resume and args.output_location is DEFAULT_OBJECT:
+            # The generated output name is new on every run, so the interrupted merge has to be found.
+            from csvlog.checkpoint import find_resumable_output
+
+            resumable_output = find_resumable_output(configuration.output_location.parent)
+            if resumable_output is None:
+                raise argparse.ArgumentTypeError(f"There is no interrupted merge in "
+                                                 f"{configuration.output_location.parent} to resume.")
+            configuration.output_location = resumable_output
+        return configuration
+
+    def handle_pipeline_arguments(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        configuration.pipeline = configuration.pipeline if args.pipeline is DEFAULT_OBJECT else True
+        if args.pipeline_readers is not DEFAULT_OBJECT:
+            if args.pipeline_readers < 1:
+                raise argparse.ArgumentTypeError(f"--pipeline-readers {args.pipeline_readers} must be at least 1.")
+            configuration.pipeline_readers = args.pipeline_readers
+            configuration.pipeline = True
+        if configuration.pipeline and (
+                configuration.jobs > 1 or configuration.sort_columns or configuration.split_sections or
+                configuration.deduplicate or configuration.max_part_bytes > 0 or configuration.max_part_rows > 0 or
+                configuration.output_format != "csv" or configuration.checkpoint or configuration.resume or
+                configuration.watch):
+            raise argparse.ArgumentTypeError("--pipeline can't be combined with --jobs, --sort-by, --split-sections, "
+                                             "--dedup, part files, --sqlite, --checkpoint, --resume or --watch.")
+        return configuration
+
+    def handle_stats_arguments(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if args.stats is not DEFAULT_OBJECT:
+            configuration.stats_file = args.stats
+        if configuration.stats_file and configuration.watch:
+            raise argparse.ArgumentTypeError("--stats reports on a single merge, it can't be combined with --watch.")
+        configuration.profile_file = Path(args.profile) if args.profile else None
+        configuration.trace_memory_file = Path(args.trace_memory) if args.trace_memory else None
+        return configuration
+
+    def handle_output_settings(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        # BufferSize and Fsync have no command line options, but a mistake in the configuration file should be
+        # reported before anything is searched for.
+        if configuration.output_buffer_size <= 0:
+            raise argparse.ArgumentTypeError(f"BufferSize {configuration.output_buffer_size} must be at least 1.")
+        if configuration.fsync_policy not in FSYNC_POLICIES:
+            raise argparse.ArgumentTypeError(f"{configuration.fsync_policy} is not an Fsync policy, it must be one of "
+                                             f"{', '.join(FSYNC_POLICIES)}.")
+        return configuration
+
+    def handle_standard_output_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        if configuration.output_to_stdout and (
+                configuration.jobs > 1 or configuration.sort_columns or configuration.split_sections or
+                configuration.max_part_bytes > 0 or configuration.max_part_rows > 0 or
+                configuration.output_format != "csv" or configuration.checkpoint or configuration.resume or
+                configuration.pipeline or configuration.fsync_policy != "never" or configuration.watch or
+                configuration.stats_file == STANDARD_OUTPUT):
+            raise argparse.ArgumentTypeError("-o - can't be combined with --jobs, --sort-by, --split-sections, part "
+                                             "files, --sqlite, --checkpoint, --resume, --pipeline, Fsync, --watch or "
+                                             "--stats -.")
+        return configuration
+
+    def handle_watch_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
+        configuration.watch = bool(args.watch)
+        if configuration.watch and (configuration.header_variants or configuration.output_columns):
+            raise argparse.ArgumentTypeError("--watch can't be combined with Columns or HeaderVariants.")
+        # A watch remembers what it merged itself and checks headers as it merges, so neither store would be used.
+        if configuration.watch and ((configuration.incremental and not configuration.archive) or
+                                    configuration.header_cache):
+            raise argparse.ArgumentTypeError("--watch can't be combined with --incremental or --header-cache.")
+        return configuration
+
     def handle_verbosity_argument(configuration: LogmergeConfig, args: argparse.Namespace) -> LogmergeConfig:
         idx = log_levels.index("WARNING")
         idx += args.verbose
@@ -146,10 +536,31 @@ def update_configuration_from_args(configuration: LogmergeConfig, args: argparse
     # arguments.
     configuration = handle_verbosity_argument(configuration, args)
     configuration = handle_input_directory_argument(configuration, args)
+    # The shard is part of the output name.
+    configuration = handle_shard_argument(configuration, args)
+    configuration = handle_files_from_argument(configuration, args)
     configuration = handle_output_location_argument(configuration, args)
+    configuration = handle_compress_argument(configuration, args)
     configuration = handle_archive_argument(configuration, args)
+    configuration = handle_incremental_argument(configuration, args)
     configuration = handle_header_argument(configuration, args)
+    configuration = handle_header_cache_argument(configuration, args)
     configuration = handle_recursive_argument(configuration, args)
+    configuration = handle_discovery_arguments(configuration, args)
+    configuration = handle_passthrough_argument(configuration, args)
+    configuration = handle_jobs_argument(configuration, args)
+    configuration = handle_sort_by_argument(configuration, args)
+    configuration = handle_split_sections_argument(configuration, args)
+    configuration = handle_dedup_arguments(configuration, args)
+    configuration = handle_watch_argument(configuration, args)
+    configuration = handle_part_arguments(configuration, args)
+    configuration = handle_sqlite_arguments(configuration, args)
+    configuration = handle_where_argument(configuration, args)
+    configuration = handle_checkpoint_arguments(configuration, args)
+    configuration = handle_pipeline_arguments(configuration, args)
+    configuration = handle_stats_arguments(configuration, args)
+    configuration = handle_output_settings(configuration, args)
+    configuration = handle_standard_output_argument(configuration, args)
 
     return configuration
 
@@ -165,10 +576,148 @@ def main():
     logging.getLogger().setLevel(configuration.log_level)
     logger.debug(args)
     logger.debug(configuration)
-    merge_log_files(search_directory=configuration.input_directory, output_file_path=configuration.output_location,
-                    recurse=configuration.recursive,
-                    header_row=configuration.header,
-                    archive_directory=configuration.archive_folder if configuration.archive else None)
+    if nothing_to_merge(configuration):
+        logger.info(f"There are no log files to merge in {configuration.input_directory}")
+        return
+    from csvlog.stats import profiling
+
+    try:
+        with profiling(configuration.profile_file):
+            run_merge(configuration)
+    except BrokenPipeError:
+        # Whatever reads standard output stopped early, as head does.  Pointing standard output at devnull stops the
+        # interpreter failing again when it flushes it on the way out.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+def nothing_to_merge(configuration: LogmergeConfig) -> bool:
+    # A run can skip everything when it has no input, and nothing else to do either.  Watching waits for input that
+    # doesn't exist yet, resuming has a partial output to finish, an archive journal has moves to recover, and stats
+    # and profiles were asked for.  A file list is read once, by the merge, and not searched for.
+    if (configuration.files_from or configuration.watch or configuration.resume or configuration.stats_file or
+            configuration.profile_file or configuration.trace_memory_file or
+            (configuration.archive and find_archive_journals(configuration.archive_journal_file))):
+        return False
+    return not has_candidate_files(configuration.input_directory,
+                                   None if configuration.output_to_stdout else configuration.output_location,
+                                   configuration.max_depth if configuration.recursive else 0,
+                                   configuration.include_patterns, configuration.exclude_patterns)
+
+
+def run_merge(configuration: LogmergeConfig) -> None:
+    from csvlog.csv_merge import merge_log_files
+    from csvlog.sharding import parse_shard
+    from csvlog.stats import MergeStats, tracing_memory
+    from csvlog.watch import watch_and_merge
+
+    stats = MergeStats() if configuration.stats_file else None
+    if configuration.watch:
+        with tracing_memory(configuration.trace_memory_file):
+            watch_and_merge(search_directory=configuration.input_directory,
+                            output_file_path=configuration.output_location,
+                            recurse=configuration.recursive,
+                            header_row=configuration.header,
+                            archive_directory=configuration.archive_folder if configuration.archive else None,
+                            passthrough=configuration.passthrough,
+                            poll_interval=configuration.watch_poll_interval,
+                            batch_seconds=configuration.watch_batch_seconds,
+                            batch_max_files=configuration.watch_batch_files,
+                            batch_max_bytes=configuration.watch_batch_bytes,
+                            roll_seconds=configuration.roll_seconds,
+                            use_inotify=configuration.watch_use_inotify,
+                            max_depth=configuration.max_depth,
+                            include_patterns=configuration.include_patterns,
+                            exclude_patterns=configuration.exclude_patterns,
+                            jobs=configuration.jobs,
+                            compression_level=configuration.compression_level)
+        return
+    shard, shard_count = parse_shard(configuration.shard) if configuration.shard else (1, 1)
+    with tracing_memory(configuration.trace_memory_file, stats):
+        merge_log_files(search_directory=configuration.input_directory,
+                        output_file_path=sys.stdout.buffer if configuration.output_to_stdout else (
+                            configuration.output_location),
+                        recurse=configuration.recursive,
+                        header_row=configuration.header,
+                        archive_directory=configuration.archive_folder if configuration.archive else None,
+                        passthrough=configuration.passthrough,
+                        state_file_path=configuration.state_file
+                        if configuration.incremental and not configuration.archive else None,
+                        hash_contents=configuration.hash_contents,
+                        max_depth=configuration.max_depth,
+                        include_patterns=configuration.include_patterns,
+                        exclude_patterns=configuration.exclude_patterns,
+                        discovery_threads=configuration.discovery_threads,
+                        compression_level=configuration.compression_level,
+                        sort_columns=configuration.sort_columns,
+                        sort_memory=configuration.sort_memory,
+                        deduplicate=configuration.deduplicate,
+                        dedup_columns=configuration.dedup_columns,
+                        dedup_memory=configuration.dedup_memory,
+                        dedup_bloom_filter_bytes=configuration.dedup_bloom_filter_bytes,
+                        section_headers=configuration.section_headers if configuration.split_sections else None,
+                        max_part_bytes=configuration.max_part_bytes,
+                        max_part_rows=configuration.max_part_rows,
+                        repeat_part_header=configuration.repeat_part_header,
+                        writer_threads=configuration.writer_threads,
+                        output_format=configuration.output_format,
+                        sqlite_table=configuration.sqlite_table,
+                        sqlite_batch_size=configuration.sqlite_batch_size,
+                        sqlite_journal_mode=configuration.sqlite_journal_mode,
+                        sqlite_synchronous=configuration.sqlite_synchronous,
+                        sqlite_index_columns=configuration.sqlite_index_columns,
+                        archive_threads=configuration.archive_threads,
+                        archive_journal_path=configuration.archive_journal_file,
+                        archive_recovery=configuration.archive_recovery,
+                        checkpoint=configuration.checkpoint,
+                        resume=configuration.resume,
+                        checkpoint_files=configuration.checkpoint_files,
+                        checkpoint_seconds=configuration.checkpoint_seconds,
+                        pipeline=configuration.pipeline,
+                        pipeline_readers=configuration.pipeline_readers,
+                        output_buffer_size=configuration.output_buffer_size,
+                        fsync_policy=configuration.fsync_policy,
+                        header_variants=configuration.header_variants,
+                        output_columns=configuration.output_columns,
+                        where=configuration.where,
+                        shard=shard,
+                        shard_count=shard_count,
+                        file_list=None if configuration.files_from is None else (
+                            sys.stdin.buffer if configuration.files_from == STANDARD_INPUT else
+                            Path(configuration.files_from)),
+                        jobs=configuration.jobs,
+                        files_per_shard=configuration.files_per_shard,
+                        probe_threads=configuration.probe_threads,
+                        header_cache_path=configuration.header_cache_file if configuration.header_cache else None,
+                        stats=stats)
+    if stats is not None:
+        stats.write_json(configuration.stats_file)
+
+
+def create_concat_argument_parser() -> argparse.ArgumentParser:
+    concat_parser = argparse.ArgumentParser(description="Join the outputs of a merge split with --shard into one file, "
+                                                        "in shard order.")
+    concat_parser.add_argument("shard_outputs", nargs="+",
+                               help="The output of every shard, named NAME_shardKofN.csv as the merge named them.  "
+                                    "They may be given in any order.")
+    concat_parser.add_argument("--output-location", "-o", required=True,
+                               help="The file to write.  It is compressed if its name ends in a compression suffix.")
+    concat_parser.add_argument("--no-header", "-T", help="The shard outputs have no header to keep once.",
+                               action="store_false", dest="header")
+    return concat_parser
+
+
+def concat_main():
+    parser = create_concat_argument_parser()
+    args = parser.parse_args()
+    from csvlog.sharding import concatenate_shards
+
+    try:
+        concatenate_shards(Path(args.output_location), [Path(shard_output) for shard_output in args.shard_outputs],
+                           args.header)
+    except (ValueError, FileExistsError) as e:
+        parser.error(str(e))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+import zlib
+from locale import getpreferredencoding
+from pathlib import Path
+from typing import IO, Optional
+
+# zstandard is an optional dependency.  Without it .zst files are simply not recognized.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed output is handed to the compression thread in blocks this large.  Compressing many tiny csv rows one at a
+# time would be slow and would compress badly.
+COMPRESSION_BLOCK_SIZE = 1024 * 1024
+# How many blocks may wait for the compression thread before the writer has to wait for it.
+COMPRESSION_QUEUE_DEPTH = 4
+
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".bz2": "bzip2", ".xz": "xz"}
+if zstandard is not None:
+    COMPRESSION_SUFFIXES[".zst"] = "zstd"
+
+
+def compression_for_path(path: Path) -> Optional[str]:
+    # Returns the name of the compression format implied by a file name, or None for an uncompressed file.
+    return COMPRESSION_SUFFIXES.get(Path(path).suffix.lower())
+
+
+def name_with_suffix(path: Path, addition: str) -> Path:
+    # Adds to the end of a file's stem, before its extension and any compression suffix.  merged.csv.gz with _INIB
+    # becomes merged_INIB.csv.gz.
+    path = Path(path)
+    name = path.name
+    compression_suffix = path.suffix if compression_for_path(path) else ""
+    name = name[:len(name) - len(compression_suffix)]
+    stem, dot, extension = name.rpartition(".")
+    if not dot:
+        stem, extension = name, ""
+    return Path(path.parent, f"{stem}{addition}{dot}{extension}{compression_suffix}")
+
+
+def compressed_include_patterns(pattern: str = "*.csv") -> tuple:
+    return tuple(f"{pattern}{suffix}" for suffix in COMPRESSION_SUFFIXES)
+
+
+def open_input_file(path: Path, binary: bool = False) -> IO:
+    # Opens an input file for reading, decompressing it on the fly if its name says it is compressed.
+    # Text mode matches Path.open(newline='') so the csv module sees the same thing either way.
+    compression = compression_for_path(path)
+    if compression is None:
+        return path.open(mode="rb") if binary else path.open(newline='')
+    if compression == "gzip":
+        binary_file = gzip.open(str(path), mode="rb")
+    elif compression == "bzip2":
+        binary_file = bz2.open(str(path), mode="rb")
+    elif compression == "xz":
+        binary_file = lzma.open(str(path), mode="rb")
+    else:
+        binary_file = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(path.open(mode="rb"),
+                                                                                  closefd=True))
+    if binary:
+        return binary_file
+    return io.TextIOWrapper(binary_file, encoding=getpreferredencoding(False), newline='')
+
+
+def open_output_file(path: Path, mode: str = "w", compression_level: Optional[int] = None,
+                     buffer_size: int = -1) -> IO:
+    # Opens an output file for writing or appending.  mode is one of "w", "a", "wb" or "ab".
+    # With a buffer_size, plain output is written through a BatchedFileWriter in chunks of buffer_size bytes, and
+    # compressed output reaches the file through a buffer that size.  -1 or 0 keeps Python's default buffering.
+    # Compressed output is written as a new compressed stream.  Appending adds another stream to the end of the file,
+    # which gzip, bzip2, xz and zstd readers all treat as one continuous file.
+    compression = compression_for_path(path)
+    binary = mode.endswith("b")
+    buffering = buffer_size if buffer_size > 0 else -1
+    if compression is None:
+        if binary:
+            # Binary output is opened for update rather than append because copy_file_range refuses O_APPEND
+            # descriptors.
+            binary_mode = "wb" if mode.startswith("w") else "r+b"
+        else:
+            binary_mode = "wb" if mode.startswith("w") else "ab"
+        if buffer_size <= 0:
+            if not binary:
+                return path.open(mode=mode, newline='')
+            output_file = path.open(mode=binary_mode)
+            output_file.seek(0, io.SEEK_END)
+            return output_file
+        raw_file = path.open(mode=binary_mode, buffering=0)
+        raw_file.seek(0, io.SEEK_END)
+        binary_file = BatchedFileWriter(raw_file, buffer_size)
+        if binary:
+            return binary_file
+        return io.TextIOWrapper(binary_file, encoding=getpreferredencoding(False), newline='')
+    binary_file = ThreadedCompressedWriter(path, mode.startswith("a"), compression, compression_level, buffering)
+    if binary:
+        return binary_file
+    return io.TextIOWrapper(binary_file, encoding=getpreferredencoding(False), newline='')
+
+
+def sync_output_file(output_file: IO) -> None:
+    # Writes out whatever an open output file has buffered and waits for the operating system to put it on disk.
+    # Compressed output holds back a partial block until it is closed, so it can only be synced with sync_path.
+    output_file.flush()
+    try:
+        file_descriptor = output_file.fileno()
+    except (OSError, io.UnsupportedOperation):
+        return
+    os.fsync(file_descriptor)
+
+
+def sync_path(path: Path) -> None:
+    # Waits for everything written to a closed file to be on disk.  fsync applies to the file rather than to the
+    # descriptor, so any descriptor that may write to it will do.
+    with Path(path).open(mode="ab") as output_file:
+        os.fsync(output_file.fileno())
+
+
+def new_compressor(compression: str, compression_level: Optional[int] = None):
+    # Every compressor returned here has compress(data) and flush() methods.
+    if compression == "gzip":
+        # A wbits value of 16 + 15 asks zlib for a gzip header and trailer.
+        return zlib.compressobj(compression_level if compression_level is not None else 6, zlib.DEFLATED, 16 + 15)
+    if compression == "bzip2":
+        return bz2.BZ2Compressor(compression_level if compression_level is not None else 9)
+    if compression == "xz":
+        return lzma.LZMACompressor(preset=compression_level)
+    if compression == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=compression_level if compression_level is not None else 3).compressobj()
+    raise ValueError(f"Unsupported compression format {compression}")
+
+
+class BatchedFileWriter(io.BufferedIOBase):
+    # A write-only binary file that collects writes in one reusable buffer and hands them to the operating system in
+    # chunks of buffer_size bytes.  Chunks end on multiples of buffer_size from the start of the file, so appending to
+    # an existing file starts with a shorter chunk.  Nothing else is written until flush() or close(), which is how the
+    # fsync policy gets the rows of a file onto disk.
+    def __init__(self, raw_file: io.FileIO, buffer_size: int):
+        super().__init__()
+        self.raw_file = raw_file
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(buffer_size)
+        self.filled = 0
+        self.chunk_size = self.chunk_size_at(raw_file.tell() if raw_file.seekable() else 0)
+
+    def chunk_size_at(self, position: int) -> int:
+        return self.buffer_size - position % self.buffer_size
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self.raw_file.seekable()
+
+    def fileno(self) -> int:
+        return self.raw_file.fileno()
+
+    def tell(self) -> int:
+        return self.raw_file.tell() + self.filled
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self.flush()
+        position = self.raw_file.seek(offset, whence)
+        self.chunk_size = self.chunk_size_at(position)
+        return position
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        data = memoryview(data).cast("B")
+        size = len(data)
+        while data:
+            if not self.filled and len(data) >= self.chunk_size:
+                # Whole chunks go straight from the caller's data to the file rather than through the buffer.
+                self.write_raw(data[:self.chunk_size])
+                data = data[self.chunk_size:]
+                self.chunk_size = self.buffer_size
+                continue
+            taken = min(self.chunk_size - self.filled, len(data))
+            self.buffer[self.filled:self.filled + taken] = data[:taken]
+            self.filled += taken
+            data = data[taken:]
+            if self.filled == self.chunk_size:
+                self.write_raw(memoryview(self.buffer)[:self.filled])
+                self.filled = 0
+                self.chunk_size = self.buffer_size
+        return size
+
+    def flush(self) -> None:
+        # The next chunk still ends on the same boundary, so a flush doesn't shift every later write.
+        if self.filled:
+            self.write_raw(memoryview(self.buffer)[:self.filled])
+            self.chunk_size -= self.filled
+            self.filled = 0
+
+    def write_raw(self, data: memoryview) -> None:
+        # An unbuffered file may write less than it was given.
+        while data:
+            data = data[self.raw_file.write(data):]
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.raw_file.close()
+            super().close()
+
+
+class ThreadedCompressedWriter(io.BufferedIOBase):
+    # A write-only binary file that compresses on a worker thread.  zlib, bz2 and lzma release the GIL while they work,
+    # so compressing one block overlaps with reading and parsing the next.
+    def __init__(self, path: Path, append: bool, compression: str, compression_level: Optional[int] = None,
+                 buffering: int = -1):
+        super().__init__()
+        self.compressor = new_compressor(compression, compression_level)
+        self.raw_file = Path(path).open(mode="ab" if append else "wb", buffering=buffering)
+        self.pending_block = bytearray()
+        self.blocks = queue.Queue(maxsize=COMPRESSION_QUEUE_DEPTH)
+        self.error = None
+        self.worker = threading.Thread(target=self.compress_blocks, name=f"compress {Path(path).name}", daemon=True)
+        self.worker.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        self.raise_worker_error()
+        self.pending_block += data
+        if len(self.pending_block) >= COMPRESSION_BLOCK_SIZE:
+            self.blocks.put(bytes(self.pending_block))
+            self.pending_block.clear()
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self.pending_block:
+                self.blocks.put(bytes(self.pending_block))
+                self.pending_block.clear()
+            self.blocks.put(None)
+            self.worker.join()
+        finally:
+            self.raw_file.close()
+            super().close()
+        self.raise_worker_error()
+
+    def raise_worker_error(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def compress_blocks(self) -> None:
+        while True:
+            block = self.blocks.get()
+            # After a failure the remaining blocks are drained and dropped, so the writer never blocks on a full queue.
+            if self.error is not None:
+                if block is None:
+                    return
+                continue
+            try:
+                if block is None:
+                    self.raw_file.write(self.compressor.flush())
+                    return
+                self.raw_file.write(self.compressor.compress(block))
+            except Exception as e:
+                self.error = e
+                if block is None:
+                    return
@@ -1,10 +1,21 @@
-import configparser
 import logging
-from ast import literal_eval
+import marshal
+import os
+import sys
 from datetime import datetime
 from os import PathLike
 from pathlib import Path
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+
+from csvlog.defaults import (DEFAULT_ARCHIVE_THREADS, DEFAULT_CHECKPOINT_FILES, DEFAULT_CHECKPOINT_SECONDS,
+                             DEFAULT_DEDUP_MEMORY, DEFAULT_DISCOVERY_THREADS, DEFAULT_FILES_PER_SHARD,
+                             DEFAULT_INCLUDE_PATTERNS, DEFAULT_OUTPUT_BUFFER_SIZE, DEFAULT_PIPELINE_READERS,
+                             DEFAULT_PROBE_THREADS, DEFAULT_SORT_MEMORY, DEFAULT_SQLITE_BATCH_SIZE,
+                             DEFAULT_SQLITE_JOURNAL_MODE, DEFAULT_SQLITE_SYNCHRONOUS, DEFAULT_SQLITE_TABLE)
+
+# configparser and ast are only needed when the configuration file has changed since it was last cached.
+if TYPE_CHECKING:
+    import configparser
 
 logger = logging.getLogger(__name__)
 
@@ -14,35 +25,203 @@ log_levels = "critical error warning info debug notset".upper().split()
 
 # TODO:  This is also in csv_merge.py, remove the duplication
 default_header = ["Record Type", "Material Order", "Job number", "Description", "", "", "", "Record key", "", ""]
+# Exports hold a material order section followed by its item section, each with its own header row.
+default_section_headers = {"INMB": default_header,
+                           "INIB": ["Record Type", "Item", "Job Number", "Location", "Cost Type", "Material Number",
+                                    "Ordered Units", "Record Key", "Tax Code", "Phase"]}
 default_config_file_location = Path(Path.home(), "Documents", "csvmerge", "logmerge.cfg")
 default_archive_location = Path(default_config_file_location.parent, "archive")
 default_output_location = Path(default_config_file_location.parent)
+default_state_file_location = Path(default_config_file_location.parent, "merge_state.sqlite3")
+default_header_cache_location = Path(default_config_file_location.parent, "header_cache.sqlite3")
+default_archive_journal_location = Path(default_config_file_location.parent, "archive_journal.jsonl")
+# The settings read from a configuration file are cached next to it, and used for as long as the file is unchanged.
+CONFIG_CACHE_SUFFIX = ".cache"
+# Change this whenever LogmergeConfig changes, so that caches made by an older version are ignored.
+CONFIG_CACHE_VERSION = 1
 
 
 class LogmergeConfig:
     # TODO: Should this just be a dataclass?
-    def __init__(self, config_parser: configparser.ConfigParser):
+    def __init__(self, config_parser: "configparser.ConfigParser"):
+        from ast import literal_eval
+
         self.cfg = config_parser
         self.date_format_string = '%y%m%d%H%M%S'
         self.name_date_component = datetime.now().strftime(self.date_format_string)
         self.header = literal_eval(self.cfg.get("SEARCH", "Header", fallback=repr(default_header)))
+        self.section_headers = literal_eval(self.cfg.get("SEARCH", "SectionHeaders",
+                                                         fallback=repr(default_section_headers)))
+        # Other headers that are accepted, their columns are matched to those of Header by name.
+        self.header_variants = literal_eval(self.cfg.get("SEARCH", "HeaderVariants", fallback=repr([])))
+        # Only rows that meet all of these conditions are merged.
+        self.where = literal_eval(self.cfg.get("SEARCH", "Where", fallback=repr([])))
         self.recursive = self.cfg.getboolean("SEARCH", "AutoRecursive", fallback=False)
+        self.max_depth = self.cfg.getint("SEARCH", "MaxDepth", fallback=None)
+        self.include_patterns = literal_eval(self.cfg.get("SEARCH", "Include",
+                                                          fallback=repr(list(DEFAULT_INCLUDE_PATTERNS))))
+        self.exclude_patterns = literal_eval(self.cfg.get("SEARCH", "Exclude", fallback=repr([])))
+        self.discovery_threads = self.cfg.getint("SEARCH", "DiscoveryThreads", fallback=DEFAULT_DISCOVERY_THREADS)
+        self.probe_threads = self.cfg.getint("SEARCH", "ProbeThreads", fallback=DEFAULT_PROBE_THREADS)
+        self.header_cache = self.cfg.getboolean("SEARCH", "HeaderCache", fallback=False)
+        self.header_cache_file = Path(self.cfg.get("SEARCH", "HeaderCacheFile",
+                                                   fallback=default_header_cache_location))
+        # K/N merges only the files of shard K out of N, see --shard.  Empty merges every file.
+        self.shard = self.cfg.get("SEARCH", "Shard", fallback="") or None
+        self.watch_poll_interval = self.cfg.getfloat("SEARCH", "WatchPollInterval", fallback=2.0)
+        self.watch_use_inotify = self.cfg.getboolean("SEARCH", "WatchUseInotify", fallback=True)
+        self.watch_batch_seconds = self.cfg.getfloat("SEARCH", "WatchBatchSeconds", fallback=10.0)
+        self.watch_batch_files = self.cfg.getint("SEARCH", "WatchBatchFiles", fallback=1000)
+        self.watch_batch_bytes = self.cfg.getint("SEARCH", "WatchBatchBytes", fallback=256 * 1024 * 1024)
         self.archive_folder = Path(self.cfg.get("ARCHIVE", "Folder", fallback=default_archive_location))
         self.archive = self.cfg.getboolean("ARCHIVE", "AutoArchive", fallback=True)
+        self.archive_threads = self.cfg.getint("ARCHIVE", "Threads", fallback=DEFAULT_ARCHIVE_THREADS)
+        self.archive_journal_file = Path(self.cfg.get("ARCHIVE", "JournalFile",
+                                                      fallback=default_archive_journal_location))
+        self.archive_recovery = self.cfg.get("ARCHIVE", "JournalRecovery", fallback="finish")
+        self.incremental = self.cfg.getboolean("ARCHIVE", "Incremental", fallback=False)
+        self.state_file = Path(self.cfg.get("ARCHIVE", "StateFile", fallback=default_state_file_location))
+        self.hash_contents = self.cfg.getboolean("ARCHIVE", "HashContents", fallback=False)
         self.output_location = Path(self.cfg.get("OUTPUT", "Folder", fallback=default_output_location))
         self.log_level = self.cfg.get("OUTPUT", "LogLevel", fallback="WARNING")
+        self.passthrough = self.cfg.getboolean("OUTPUT", "Passthrough", fallback=False)
+        self.compression = self.cfg.get("OUTPUT", "Compression", fallback="") or None
+        self.compression_level = self.cfg.get("OUTPUT", "CompressionLevel", fallback="")
+        self.compression_level = int(self.compression_level) if self.compression_level else None
+        self.sort_columns = literal_eval(self.cfg.get("OUTPUT", "SortBy", fallback=repr([])))
+        self.sort_memory = self.cfg.getint("OUTPUT", "SortMemory", fallback=DEFAULT_SORT_MEMORY)
+        self.split_sections = self.cfg.getboolean("OUTPUT", "SplitSections", fallback=False)
+        self.deduplicate = self.cfg.getboolean("OUTPUT", "Deduplicate", fallback=False)
+        self.dedup_columns = literal_eval(self.cfg.get("OUTPUT", "DedupBy", fallback=repr([])))
+        self.dedup_memory = self.cfg.getint("OUTPUT", "DedupMemory", fallback=DEFAULT_DEDUP_MEMORY)
+        self.dedup_bloom_filter_bytes = self.cfg.getint("OUTPUT", "DedupBloomFilterBytes", fallback=0)
+        self.max_part_bytes = self.cfg.getint("OUTPUT", "MaxPartBytes", fallback=0)
+        self.max_part_rows = self.cfg.getint("OUTPUT", "MaxPartRows", fallback=0)
+        self.repeat_part_header = self.cfg.getboolean("OUTPUT", "RepeatPartHeader", fallback=True)
+        self.writer_threads = self.cfg.getint("OUTPUT", "WriterThreads", fallback=1)
+        self.output_format = self.cfg.get("OUTPUT", "Format", fallback="csv")
+        self.sqlite_table = self.cfg.get("OUTPUT", "SqliteTable", fallback=DEFAULT_SQLITE_TABLE)
+        self.sqlite_batch_size = self.cfg.getint("OUTPUT", "SqliteBatchSize", fallback=DEFAULT_SQLITE_BATCH_SIZE)
+        self.sqlite_journal_mode = self.cfg.get("OUTPUT", "SqliteJournalMode", fallback=DEFAULT_SQLITE_JOURNAL_MODE)
+        self.sqlite_synchronous = self.cfg.get("OUTPUT", "SqliteSynchronous", fallback=DEFAULT_SQLITE_SYNCHRONOUS)
+        self.sqlite_index_columns = literal_eval(self.cfg.get("OUTPUT", "SqliteIndexColumns", fallback=repr([])))
+        self.checkpoint = self.cfg.getboolean("OUTPUT", "Checkpoint", fallback=False)
+        self.checkpoint_files = self.cfg.getint("OUTPUT", "CheckpointFiles", fallback=DEFAULT_CHECKPOINT_FILES)
+        self.checkpoint_seconds = self.cfg.getfloat("OUTPUT", "CheckpointSeconds", fallback=DEFAULT_CHECKPOINT_SECONDS)
+        self.resume = False
+        self.pipeline = self.cfg.getboolean("OUTPUT", "Pipeline", fallback=False)
+        self.pipeline_readers = self.cfg.getint("OUTPUT", "PipelineReaders", fallback=DEFAULT_PIPELINE_READERS)
+        self.output_buffer_size = self.cfg.getint("OUTPUT", "BufferSize", fallback=DEFAULT_OUTPUT_BUFFER_SIZE)
+        # One of never, file or end.
+        self.fsync_policy = self.cfg.get("OUTPUT", "Fsync", fallback="never")
+        # The columns of Header to write, by name or zero based number.  An empty list writes them all.
+        self.output_columns = literal_eval(self.cfg.get("OUTPUT", "Columns", fallback=repr([])))
+        # Only a merge started from the command line reports stats.  An empty name turns the report off.
+        self.stats_file = self.cfg.get("OUTPUT", "StatsFile", fallback="") or None
+        self.profile_file = None
+        self.trace_memory_file = None
+        self.jobs = self.cfg.getint("OUTPUT", "Jobs", fallback=1)
+        self.files_per_shard = self.cfg.getint("OUTPUT", "FilesPerShard", fallback=DEFAULT_FILES_PER_SHARD)
+        self.roll_seconds = self.cfg.getfloat("OUTPUT", "RollSeconds", fallback=3600.0)
+        self.watch = False
+        # Set by --files-from, a file listing the files to merge, or - for standard input.
+        self.files_from = None
+        # Set by -o -, which writes the merged output to standard output instead of output_location.
+        self.output_to_stdout = False
         self.input_directory = None
 
+    def cached_settings(self) -> Dict[str, Any]:
+        # Everything except the parser and the time of the run.  Paths are turned into strings so that marshal can
+        # save them, and their names are kept so they can be turned back.
+        settings = {name: value for name, value in vars(self).items() if name not in ("cfg", "name_date_component")}
+        path_names = [name for name, value in settings.items() if isinstance(value, Path)]
+        settings.update((name, str(settings[name])) for name in path_names)
+        return {"settings": settings, "paths": path_names}
+
+    @classmethod
+    def from_cached_settings(cls, cached_settings: Dict[str, Any]) -> "LogmergeConfig":
+        configuration = cls.__new__(cls)
+        configuration.cfg = None
+        vars(configuration).update(cached_settings["settings"])
+        for name in cached_settings["paths"]:
+            setattr(configuration, name, Path(getattr(configuration, name)))
+        configuration.name_date_component = datetime.now().strftime(configuration.date_format_string)
+        return configuration
+
 
 def get_configuration(config_file_path: Optional[Union[PathLike, Path]] = None) -> LogmergeConfig:
+    configuration = load_cached_configuration(
+        config_file_path if config_file_path is not None else default_config_file_location)
+    if configuration is not None:
+        return configuration
     cfg = load_or_create_configparser(config_file_path)
-    return LogmergeConfig(cfg)
+    configuration = LogmergeConfig(cfg)
+    save_cached_configuration(
+        config_file_path if config_file_path is not None else default_config_file_location, configuration)
+    return configuration
+
+
+def config_cache_path(config_file_path: Union[PathLike, Path]) -> Path:
+    config_file_path = Path(config_file_path)
+    return Path(config_file_path.parent, config_file_path.name + CONFIG_CACHE_SUFFIX)
+
 
+def config_cache_key(config_file_path: Union[PathLike, Path]) -> Optional[tuple]:
+    # A cache is only used for the same configuration file, the same version of this module and the same Python,
+    # since marshal's format can change between versions.  None means there is no configuration file.
+    try:
+        config_stat = os.stat(str(config_file_path))
+        module_stat = os.stat(__file__)
+    except OSError:
+        return None
+    return (CONFIG_CACHE_VERSION, sys.hexversion, config_stat.st_mtime_ns, config_stat.st_size,
+            module_stat.st_mtime_ns)
+
+
+def load_cached_configuration(config_file_path: Union[PathLike, Path]) -> Optional[LogmergeConfig]:
+    cache_key = config_cache_key(config_file_path)
+    if cache_key is None:
+        return None
+    try:
+        with config_cache_path(config_file_path).open(mode="rb") as cache_file:
+            cached_key, cached_settings = marshal.load(cache_file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if tuple(cached_key) != cache_key:
+        return None
+    logger.debug(f"Using the cached settings of {config_file_path}")
+    return LogmergeConfig.from_cached_settings(cached_settings)
+
+
+def save_cached_configuration(config_file_path: Union[PathLike, Path], configuration: LogmergeConfig) -> None:
+    # The cache only saves time, so failing to write it is never an error.  It is written to a temporary name and
+    # renamed so that a concurrent run never reads half of it.
+    cache_key = config_cache_key(config_file_path)
+    if cache_key is None:
+        return
+    cache_path = config_cache_path(config_file_path)
+    temporary_path = Path(cache_path.parent, f"{cache_path.name}.{os.getpid()}")
+    try:
+        with temporary_path.open(mode="wb") as cache_file:
+            marshal.dump((cache_key, configuration.cached_settings()), cache_file)
+        os.replace(str(temporary_path), str(cache_path))
+    except (OSError, ValueError) as e:
+        logger.debug(f"Cannot cache the settings of {config_file_path}: {e}")
+        try:
+            temporary_path.unlink()
+        except OSError:
+            pass
+
+
+def load_or_create_configparser(
+        config_file_path: Optional[Union[PathLike, Path]] = None) -> "configparser.ConfigParser":
+    import configparser
 
-def load_or_create_configparser(config_file_path: Optional[Union[PathLike, Path]] = None) -> configparser.ConfigParser:
     if config_file_path is None:
         config_file_path = default_config_file_location
-        verify_default_directories()
+        # The default directories only need creating on the first run, or if someone removed them.
+        if not config_file_path.exists() or not default_archive_location.exists():
+            verify_default_directories()
     if not config_file_path.exists():
         logger.info(f"Creating default config file at {config_file_path}")
         write_default_config(config_file_path)
@@ -67,13 +246,68 @@ def write_default_config(config_file_path: Union[PathLike, Path] = default_confi
         cfg.write(configfile)
 
 
-def create_default_config() -> configparser.ConfigParser:
+def create_default_config() -> "configparser.ConfigParser":
+    import configparser
+
     # TODO: Add a prefernece for no automatic header checking?
     cfg = configparser.ConfigParser()
     cfg["SEARCH"] = {"Header": repr(default_header),
-                     "AutoRecursive": str(False)}
+                     "SectionHeaders": repr(default_section_headers),
+                     "HeaderVariants": repr([]),
+                     "Where": repr([]),
+                     "AutoRecursive": str(False),
+                     "Include": repr(list(DEFAULT_INCLUDE_PATTERNS)),
+                     "Exclude": repr([]),
+                     "DiscoveryThreads": str(DEFAULT_DISCOVERY_THREADS),
+                     "ProbeThreads": str(DEFAULT_PROBE_THREADS),
+                     "HeaderCache": str(False),
+                     "HeaderCacheFile": str(default_header_cache_location),
+                     "Shard": "",
+                     "WatchPollInterval": str(2.0),
+                     "WatchUseInotify": str(True),
+                     "WatchBatchSeconds": str(10.0),
+                     "WatchBatchFiles": str(1000),
+                     "WatchBatchBytes": str(256 * 1024 * 1024)}
     cfg["ARCHIVE"] = {"Folder": str(default_archive_location),
-                      "AutoArchive": str(True)}
+                      "AutoArchive": str(True),
+                      "Threads": str(DEFAULT_ARCHIVE_THREADS),
+                      "JournalFile": str(default_archive_journal_location),
+                      "JournalRecovery": "finish",
+                      "Incremental": str(False),
+                      "StateFile": str(default_state_file_location),
+                      "HashContents": str(False)}
     cfg["OUTPUT"] = {"Folder": str(default_output_location),
-                     "LogLevel": "WARNING"}
+                     "LogLevel": "WARNING",
+                     "Passthrough": str(False),
+                     "RollSeconds": str(3600.0),
+                     "Compression": "",
+                     "CompressionLevel": "",
+                     "SortBy": repr([]),
+                     "SortMemory": str(DEFAULT_SORT_MEMORY),
+                     "SplitSections": str(False),
+                     "Deduplicate": str(False),
+                     "DedupBy": repr([]),
+                     "DedupMemory": str(DEFAULT_DEDUP_MEMORY),
+                     "DedupBloomFilterBytes": str(0),
+                     "MaxPartBytes": str(0),
+                     "MaxPartRows": str(0),
+                     "RepeatPartHeader": str(True),
+                     "WriterThreads": str(1),
+                     "Format": "csv",
+                     "SqliteTable": DEFAULT_SQLITE_TABLE,
+                     "SqliteBatchSize": str(DEFAULT_SQLITE_BATCH_SIZE),
+                     "SqliteJournalMode": DEFAULT_SQLITE_JOURNAL_MODE,
+                     "SqliteSynchronous": DEFAULT_SQLITE_SYNCHRONOUS,
+                     "SqliteIndexColumns": repr([]),
+                     "Checkpoint": str(False),
+                     "CheckpointFiles": str(DEFAULT_CHECKPOINT_FILES),
+                     "CheckpointSeconds": str(DEFAULT_CHECKPOINT_SECONDS),
+                     "Pipeline": str(False),
+                     "PipelineReaders": str(DEFAULT_PIPELINE_READERS),
+                     "BufferSize": str(DEFAULT_OUTPUT_BUFFER_SIZE),
+                     "Fsync": "never",
+                     "Columns": repr([]),
+                     "StatsFile": "",
+                     "Jobs": str(1),
+                     "FilesPerShard": str(DEFAULT_FILES_PER_SHARD)}
     return cfg
@@ -1,76 +1,973 @@
 import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from csv import reader, writer
+from io import (BufferedRandom, BufferedReader, BufferedWriter, BytesIO, FileIO, SEEK_END, StringIO, TextIOBase,
+                TextIOWrapper)
+from itertools import chain, islice
+from locale import getpreferredencoding
 from os import PathLike
 from pathlib import Path, PurePath
-from typing import Union, Iterator, Optional, Sequence, Callable
+from typing import Union, Iterator, Optional, Sequence, Callable, BinaryIO, List, IO, Dict, Iterable, NamedTuple, Tuple
+
+from csvlog.archive import Archiver, move_file, recover_archive_journals, run_journal_path
+from csvlog.async_pipeline import AsyncMergePipeline
+from csvlog.checkpoint import MergeCheckpoint
+from csvlog.compression import BatchedFileWriter, open_input_file, open_output_file, sync_output_file, sync_path
+from csvlog.dedup import RecordDeduplicator
+from csvlog.defaults import (DEFAULT_ARCHIVE_THREADS, DEFAULT_CHECKPOINT_FILES, DEFAULT_CHECKPOINT_SECONDS,
+                             DEFAULT_DEDUP_MEMORY, DEFAULT_DISCOVERY_THREADS, DEFAULT_FILES_PER_SHARD,
+                             DEFAULT_INCLUDE_PATTERNS, DEFAULT_OUTPUT_BUFFER_SIZE, DEFAULT_PIPELINE_READERS,
+                             DEFAULT_PROBE_THREADS, DEFAULT_SORT_MEMORY, DEFAULT_SQLITE_BATCH_SIZE,
+                             DEFAULT_SQLITE_JOURNAL_MODE, DEFAULT_SQLITE_SYNCHRONOUS, DEFAULT_SQLITE_TABLE,
+                             FSYNC_POLICIES)
+from csvlog.discovery import listed_csv_files, read_path_list, walk_csv_files
+from csvlog.header_probe import HeaderProbe
+from csvlog.merge_state import FileSnapshot, HeaderVerdictCache, MergeStateStore
+from csvlog.projection import ColumnProjection
+from csvlog.rotation import RotatingOutput
+from csvlog.row_filter import FilteredReader, RowFilter
+from csvlog.sections import SectionHeaders, section_log_file_combiner
+from csvlog.sharding import shard_file_paths
+from csvlog.sorted_merge import sorted_log_file_combiner
+from csvlog.sqlite_sink import sqlite_log_file_combiner
+from csvlog.stats import MergeStats
 
 logger = logging.getLogger(__name__)
 
 PathType = Union[str, bytes, PathLike, PurePath]
+# Merged output goes to a file named by a path, to a text or binary stream the caller opened, or to a callable that is
+# handed each row.
+RowSink = Callable[[Sequence[str]], object]
+OutputTarget = Union[PathType, IO, RowSink]
+# The files to merge can be listed in a file named by a path, in a binary stream such as sys.stdin.buffer, or given as
+# the paths themselves.
+FileList = Union[PathType, BinaryIO, Iterable[PathType]]
+
+# Passthrough mode copies record bodies in chunks this large so that each file costs only a handful of syscalls.
+PASSTHROUGH_BUFFER_SIZE = 1024 * 1024
+# This is the line terminator csv.writer uses by default.  Passthrough output is normalized to it so that it can't be
+# told apart from output that went through the csv module.
+OUTPUT_LINE_TERMINATOR = b"\r\n"
+# Pipelined merges hand rows from the readers to the writer in batches this large.
+PIPELINE_CHUNK_ROWS = 4096
+
 
+class MergeResult(NamedTuple):
+    # What a merge did.  Rejected files are the candidates that were found but not merged.  The merged and rejected
+    # paths are only kept when the caller asks for them with collect_paths, otherwise they are None and only counted,
+    # so that a merge of millions of files doesn't hold all their names.  Rows and bytes are counted for the files the
+    # merge read, not those the header check turned away ahead of it.  They are None where merge_file_paths doesn't
+    # collect per file numbers, and rows are None for passthrough merges.  Phases are the seconds spent in each phase,
+    # see MergeStats.
+    files_merged: int
+    files_rejected: int
+    merged_files: Optional[List[Path]]
+    rejected_files: Optional[List[Path]]
+    rows_read: Optional[int]
+    bytes_read: Optional[int]
+    seconds: float
+    phases: Dict[str, float]
 
-def merge_log_files(search_directory: PathType, output_file_path: PathType, recurse: bool = False,
+
+def merge_log_files(search_directory: PathType, output_file_path: OutputTarget, recurse: bool = False,
                     header_row: Optional[Sequence[str]] = None,
-                    archive_directory: Optional[PathType] = None) -> None:
+                    archive_directory: Optional[PathType] = None, passthrough: bool = False,
+                    state_file_path: Optional[PathType] = None, hash_contents: bool = False,
+                    max_depth: Optional[int] = None, include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS,
+                    exclude_patterns: Sequence[str] = (), discovery_threads: int = DEFAULT_DISCOVERY_THREADS,
+                    jobs: int = 1, files_per_shard: int = DEFAULT_FILES_PER_SHARD,
+                    probe_threads: int = DEFAULT_PROBE_THREADS,
+                    header_cache_path: Optional[PathType] = None,
+                    compression_level: Optional[int] = None, sort_columns: Sequence[str] = (),
+                    sort_memory: int = DEFAULT_SORT_MEMORY, deduplicate: bool = False,
+                    dedup_columns: Sequence[str] = (), dedup_memory: int = DEFAULT_DEDUP_MEMORY,
+                    dedup_bloom_filter_bytes: int = 0,
+                    section_headers: Optional[SectionHeaders] = None, max_part_bytes: int = 0,
+                    max_part_rows: int = 0, repeat_part_header: bool = True, writer_threads: int = 1,
+                    output_format: str = "csv", sqlite_table: str = DEFAULT_SQLITE_TABLE,
+                    sqlite_batch_size: int = DEFAULT_SQLITE_BATCH_SIZE,
+                    sqlite_journal_mode: str = DEFAULT_SQLITE_JOURNAL_MODE,
+                    sqlite_synchronous: str = DEFAULT_SQLITE_SYNCHRONOUS,
+                    sqlite_index_columns: Sequence[str] = (), archive_threads: int = DEFAULT_ARCHIVE_THREADS,
+                    archive_journal_path: Optional[PathType] = None, archive_recovery: str = "finish",
+                    checkpoint: bool = False, resume: bool = False,
+                    checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+                    checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+                    pipeline: bool = False, pipeline_readers: int = DEFAULT_PIPELINE_READERS,
+                    output_buffer_size: int = DEFAULT_OUTPUT_BUFFER_SIZE, fsync_policy: str = "never",
+                    header_variants: Sequence[Sequence[str]] = (), output_columns: Sequence[str] = (),
+                    where: Sequence[str] = (), shard: int = 1, shard_count: int = 1,
+                    file_list: Optional[FileList] = None, stats: Optional[MergeStats] = None,
+                    collect_paths: bool = False) -> MergeResult:
+    # The output is a path, or a stream or row sink as described for stream_log_file_combiner.  With stats, the time of
+    # each phase and the numbers of files, rows and bytes are collected into it as well as into the result.
+    # Header variants are accepted along with header_row and their rows are mapped onto its columns.  With output
+    # columns only those columns of header_row are written, see ColumnProjection.  Only rows that meet every where
+    # condition are merged, see RowFilter.
+    # A merge split over shard_count hosts only merges the files of its shard, numbered from 1, see shard_of.
+    # With a file list the listed files are merged instead of the ones a search finds, see get_csv_paths_from_list.
+    # With collect_paths the result lists the merged and rejected files, which costs memory for every file found.
     search_directory = Path(search_directory)
-    output_file_path = Path(output_file_path)
+    if not 1 <= shard <= shard_count:
+        raise ValueError(f"Shard {shard} of {shard_count} doesn't exist, shards are numbered from 1 to {shard_count}.")
+    output_is_path = is_path(output_file_path)
+    output_file_path = Path(output_file_path) if output_is_path else output_file_path
+    # The result's numbers come from stats, so a merge always collects them.  Without per file numbers that only costs
+    # a clock reading and a stat call per file.
+    stats = MergeStats(per_file=False) if stats is None else stats
     archive_directory = Path(archive_directory) if archive_directory is not None else None
-    csv_file_iterator = get_csv_paths_in_directory(search_directory, output_file_path, recurse)
-    combiner = log_file_combiner(output_file_path, header_row)
-    iterator_of_merged_files = combiner(csv_file_iterator)
-    for file_path in iterator_of_merged_files:
-        if archive_directory is not None:
-            move_file_to_archive(search_directory, archive_directory, file_path)
+    archive_journal_path = Path(archive_journal_path) if archive_journal_path is not None else None
+    # A journal left behind means an earlier run was interrupted while archiving.  Its moves are settled before this run
+    # looks for files, so they are either all archived or all merged again.  Journals of runs that are still archiving
+    # are locked, and left to them.
+    if archive_journal_path is not None:
+        recovered = recover_archive_journals(archive_journal_path, archive_recovery)
+        stats.count("archive_moves_recovered", recovered)
+    projection = None
+    if header_variants or output_columns:
+        if not header_row:
+            raise ValueError("Header variants and output columns need a header to map the columns onto.")
+        projection = ColumnProjection(header_row, output_columns, header_variants)
+    row_filter = RowFilter(where, header_row) if where else None
+    # The state store remembers files that were merged by earlier runs.  It is only useful when files are left in place.
+    merge_state = MergeStateStore(Path(state_file_path), hash_contents) if state_file_path is not None else None
+    # Rejected files are never archived, so without this cache they would be opened again on every run.
+    verdict_cache = HeaderVerdictCache(Path(header_cache_path), header_row, header_variants) if (
+            header_cache_path is not None and header_row) else None
+    # Digests that don't fit in memory are spilled next to the output, like every other temporary file, or to the
+    # system's temporary directory for a stream.  Rows are deduplicated after projection, so key columns are those of
+    # the output.
+    deduplicator = RecordDeduplicator(dedup_columns, projection.output_header if projection else header_row,
+                                      dedup_memory, dedup_bloom_filter_bytes,
+                                      output_file_path.parent if output_is_path else None) if deduplicate else None
+    # Candidates are forgotten as they are merged, so what is left at the end are the rejected files.
+    unmerged_file_paths = {}  # type: Dict[Path, None]
+    merged_file_paths = []  # type: List[Path]
+    header_probe = None
+    list_file = None
+    try:
+        ignore = output_file_path if output_is_path else output_file_descriptor(output_file_path)
+        if file_list is None:
+            csv_file_iterator = get_csv_paths_in_directory(search_directory, ignore, recurse, merge_state, max_depth,
+                                                           include_patterns, exclude_patterns, discovery_threads)
+        elif is_path(file_list):
+            list_file = Path(file_list).open(mode="rb")
+            csv_file_iterator = get_csv_paths_from_list(read_path_list(list_file), search_directory, ignore,
+                                                        merge_state)
+        else:
+            names = read_path_list(file_list) if hasattr(file_list, "read") else file_list
+            csv_file_iterator = get_csv_paths_from_list(names, search_directory, ignore, merge_state)
+        csv_file_iterator = stats.timed("discovery", csv_file_iterator)
+        # Other shards' files are left out before anything else looks at them, so they aren't counted as rejected.
+        csv_file_iterator = count_paths(shard_file_paths(csv_file_iterator, search_directory, shard, shard_count),
+                                        stats, unmerged_file_paths if collect_paths else None)
+        # Most candidates usually fail the header check, so headers are probed concurrently ahead of the merge.
+        # A split merge accepts any of several headers, so it checks them itself.
+        if header_row and not section_headers and (probe_threads > 1 or verdict_cache is not None):
+            header_probe = HeaderProbe(header_row, max(1, probe_threads), verdict_cache, header_variants)
+            csv_file_iterator = stats.timed("header_check", header_probe(csv_file_iterator))
+
+        def forget_merged_path(file_path: Path) -> None:
+            unmerged_file_paths.pop(file_path, None)
+            merged_file_paths.append(file_path)
+
+        merge_file_paths(csv_file_iterator, search_directory, output_file_path, header_row,
+                         archive_directory, passthrough, merge_state, jobs=jobs,
+                         files_per_shard=files_per_shard, compression_level=compression_level,
+                         sort_columns=sort_columns, sort_memory=sort_memory,
+                         deduplicator=deduplicator, section_headers=section_headers,
+                         max_part_bytes=max_part_bytes, max_part_rows=max_part_rows,
+                         repeat_part_header=repeat_part_header, writer_threads=writer_threads,
+                         output_format=output_format, sqlite_table=sqlite_table,
+                         sqlite_batch_size=sqlite_batch_size,
+                         sqlite_journal_mode=sqlite_journal_mode,
+                         sqlite_synchronous=sqlite_synchronous,
+                         sqlite_index_columns=sqlite_index_columns, archive_threads=archive_threads,
+                         archive_journal_path=archive_journal_path, checkpoint=checkpoint,
+                         resume=resume, checkpoint_files=checkpoint_files,
+                         checkpoint_seconds=checkpoint_seconds, pipeline=pipeline,
+                         pipeline_readers=pipeline_readers, output_buffer_size=output_buffer_size,
+                         fsync_policy=fsync_policy, projection=projection, row_filter=row_filter,
+                         stats=stats, on_merged=forget_merged_path if collect_paths else None)
+    finally:
+        if header_probe is not None:
+            stats.count("headers_accepted", header_probe.accepted)
+            stats.count("headers_rejected", header_probe.rejected)
+            stats.count("header_verdicts_cached", header_probe.cached)
+        if deduplicator is not None:
+            stats.count("rows_kept", deduplicator.kept)
+            stats.count("duplicate_rows_dropped", deduplicator.dropped)
+        stats.finish()
+        if deduplicator is not None:
+            logger.info(f"Dropped {deduplicator.dropped} duplicate rows and kept {deduplicator.kept}")
+            deduplicator.close()
+        if merge_state is not None:
+            merge_state.close()
+        if verdict_cache is not None:
+            verdict_cache.close()
+        if list_file is not None:
+            list_file.close()
+    files_merged = stats.counters["files_merged"]
+    return MergeResult(files_merged, stats.counters["files_found"] - files_merged,
+                       merged_file_paths if collect_paths else None,
+                       list(unmerged_file_paths) if collect_paths else None, stats.counters.get("rows_read"),
+                       stats.counters.get("bytes_read"), stats.seconds,
+                       {name: totals[0] for name, totals in stats.phases.items()})
+
+
+def is_path(target: Union[OutputTarget, FileList]) -> bool:
+    return isinstance(target, (str, bytes, PathLike))
+
+
+def output_file_descriptor(output: Union[IO, RowSink]) -> Optional[int]:
+    # A stream that is a file in the search directory must not be merged into itself either.  Its descriptor identifies
+    # it just as well as a path would.
+    try:
+        return output.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def count_paths(file_paths: Iterator[Path], stats: MergeStats,
+                remembered: Optional[Dict[Path, None]] = None) -> Iterator[Path]:
+    for file_path in file_paths:
+        stats.count("files_found")
+        if remembered is not None:
+            remembered[file_path] = None
+        yield file_path
+
+
+def merge_file_paths(file_paths: Iterator[Path], search_directory: Path, output_file_path: OutputTarget,
+                     header_row: Optional[Sequence[str]] = None, archive_directory: Optional[Path] = None,
+                     passthrough: bool = False, merge_state: Optional[MergeStateStore] = None,
+                     append: bool = False, jobs: int = 1,
+                     files_per_shard: int = DEFAULT_FILES_PER_SHARD,
+                     compression_level: Optional[int] = None, sort_columns: Sequence[str] = (),
+                     sort_memory: int = DEFAULT_SORT_MEMORY,
+                     deduplicator: Optional[RecordDeduplicator] = None,
+                     section_headers: Optional[SectionHeaders] = None, max_part_bytes: int = 0,
+                     max_part_rows: int = 0, repeat_part_header: bool = True,
+                     writer_threads: int = 1, output_format: str = "csv",
+                     sqlite_table: str = DEFAULT_SQLITE_TABLE, sqlite_batch_size: int = DEFAULT_SQLITE_BATCH_SIZE,
+                     sqlite_journal_mode: str = DEFAULT_SQLITE_JOURNAL_MODE,
+                     sqlite_synchronous: str = DEFAULT_SQLITE_SYNCHRONOUS,
+                     sqlite_index_columns: Sequence[str] = (), archive_threads: int = DEFAULT_ARCHIVE_THREADS,
+                     archive_journal_path: Optional[Path] = None, checkpoint: bool = False,
+                     resume: bool = False, checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+                     checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+                     pipeline: bool = False, pipeline_readers: int = DEFAULT_PIPELINE_READERS,
+                     output_buffer_size: int = DEFAULT_OUTPUT_BUFFER_SIZE, fsync_policy: str = "never",
+                     projection: Optional[ColumnProjection] = None, row_filter: Optional[RowFilter] = None,
+                     stats: Optional[MergeStats] = None,
+                     on_merged: Optional[Callable[[Path], object]] = None) -> int:
+    # This is the part of a merge that comes after discovery.  It is shared by every way of finding input files.
+    # With a part size or row limit the output is written as numbered part files named after output_file_path.
+    # Per file numbers are only collected by the combiners that read files in this process, not by worker processes,
+    # ordered merges, split sections or SQLite loads.  Their time still counts towards the merge phase.
+    # The output buffer size and fsync policy apply to plain and pipelined merges into one csv output.
+    # An output that isn't a path is a stream or row sink, see stream_log_file_combiner.  Those take plain merges only.
+    # Each merged file is handed to on_merged once it has been archived or recorded.  Returns how many were merged.
+    files_merged = 0
+    rotate = max_part_bytes > 0 or max_part_rows > 0
+    streaming = not isinstance(output_file_path, PurePath)
+    # Resuming only makes sense for a checkpointed merge, so it turns checkpoints on.
+    checkpoint = checkpoint or resume
+    if checkpoint and (output_format != "csv" or jobs > 1 or sort_columns or section_headers or rotate or append):
+        raise ValueError("Checkpoints can only be used by a plain merge into one csv output.")
+    if rotate and (passthrough or jobs > 1 or sort_columns or section_headers or append):
+        raise ValueError("Part files can't be combined with passthrough mode, multiple jobs, ordering, sections or "
+                         "appending.")
+    if deduplicator is not None and (passthrough or jobs > 1):
+        raise ValueError("Deduplication can't be combined with passthrough mode or multiple jobs.")
+    if fsync_policy not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy {fsync_policy}, it must be one of {', '.join(FSYNC_POLICIES)}.")
+    if projection is not None:
+        if passthrough or jobs > 1 or sort_columns or section_headers or output_format != "csv":
+            raise ValueError("Header variants and output columns can't be combined with passthrough mode, multiple "
+                             "jobs, ordering, sections or SQLite.")
+        # The projection checks headers itself.  What the combiners are given is the header they write.
+        header_row = projection.output_header
+    if row_filter is not None and (passthrough or jobs > 1 or sort_columns or section_headers or
+                                   output_format != "csv"):
+        raise ValueError("Filtering rows can't be combined with passthrough mode, multiple jobs, ordering, sections or "
+                         "SQLite.")
+    if pipeline and (output_format != "csv" or jobs > 1 or sort_columns or section_headers or rotate or checkpoint or
+                     deduplicator is not None):
+        raise ValueError("A pipelined merge can only be used by a plain merge into one csv output.")
+    if streaming and (output_format != "csv" or jobs > 1 or sort_columns or section_headers or rotate or checkpoint or
+                      pipeline or append or fsync_policy != "never"):
+        raise ValueError("Merging into a stream can't be combined with multiple jobs, ordering, sections, part files, "
+                         "SQLite, checkpoints, a pipeline, appending or syncing.")
+    if streaming:
+        combiner = stream_log_file_combiner(output_file_path, header_row, passthrough, deduplicator, stats, projection,
+                                            row_filter)
+    elif output_format == "sqlite":
+        # The database output takes the place of the csv output entirely.
+        if not header_row:
+            raise ValueError("Loading into SQLite needs a header to name the table's columns.")
+        if passthrough or jobs > 1 or sort_columns or section_headers or rotate:
+            raise ValueError("Loading into SQLite can't be combined with passthrough mode, multiple jobs, ordering, "
+                             "sections or part files.")
+        combiner = sqlite_log_file_combiner(output_file_path, header_row, sqlite_table, sqlite_batch_size,
+                                            sqlite_journal_mode, sqlite_synchronous, sqlite_index_columns,
+                                            deduplicator)
+    elif output_format != "csv":
+        raise ValueError(f"Unknown output format {output_format}")
+    elif section_headers:
+        if passthrough or jobs > 1 or sort_columns:
+            raise ValueError("Splitting sections can't be combined with passthrough mode, multiple jobs or ordering.")
+        combiner = section_log_file_combiner(output_file_path, section_headers, append, compression_level,
+                                             deduplicator)
+    elif sort_columns:
+        if passthrough or jobs > 1:
+            raise ValueError("An ordered merge can't be combined with passthrough mode or multiple jobs.")
+        combiner = sorted_log_file_combiner(output_file_path, header_row, sort_columns, sort_memory, append,
+                                            compression_level, deduplicator)
+    elif rotate:
+        combiner = rotating_log_file_combiner(output_file_path, header_row, max_part_bytes, max_part_rows,
+                                              repeat_part_header, writer_threads, compression_level, deduplicator,
+                                              stats, projection, row_filter)
+    elif checkpoint:
+        combiner = checkpointed_log_file_combiner(output_file_path, header_row, passthrough, resume, checkpoint_files,
+                                                  checkpoint_seconds, deduplicator, stats, projection, row_filter)
+    elif pipeline:
+        combiner = pipelined_log_file_combiner(output_file_path, header_row, passthrough, append, compression_level,
+                                               pipeline_readers, stats, output_buffer_size, fsync_policy, projection,
+                                               row_filter)
+    elif jobs > 1:
+        combiner = parallel_log_file_combiner(output_file_path, header_row, passthrough, append, jobs, files_per_shard,
+                                              compression_level)
+    else:
+        combiner = log_file_combiner(output_file_path, header_row, passthrough, append, compression_level,
+                                     deduplicator, stats, output_buffer_size, fsync_policy, projection, row_filter)
+    archiver = Archiver(search_directory, archive_directory, archive_threads,
+                        run_journal_path(archive_journal_path) if archive_journal_path is not None else None) if (
+            archive_directory is not None) else None
+    snapshots = {}  # type: Dict[Path, FileSnapshot]
+    if archiver is None and merge_state is not None:
+        file_paths = snapshot_file_paths(file_paths, merge_state, snapshots)
+    merged_paths = combiner(file_paths) if stats is None else stats.timed("merge", combiner(file_paths))
+    try:
+        for file_path in merged_paths:
+            if archiver is not None:
+                if stats is None:
+                    archiver.archive(file_path)
+                else:
+                    with stats.phase("archive"):
+                        archiver.archive(file_path)
+            elif merge_state is not None:
+                snapshot = snapshots.pop(file_path, None)
+                if snapshot is None:
+                    merge_state.record_merged(file_path)
+                else:
+                    merge_state.record_merged(file_path, *snapshot)
+            files_merged += 1
+            if on_merged is not None:
+                on_merged(file_path)
+    except BaseException:
+        # Moves that were already journaled are left for the next run to recover.
+        if archiver is not None:
+            archiver.close(wait=False)
+        raise
+    if archiver is not None:
+        if stats is None:
+            archiver.close()
+        else:
+            # Most moves finish here, on the archive threads, while the merge waits for them.
+            with stats.phase("archive"):
+                archiver.close()
+            stats.count("files_archived", archiver.moved)
+    if stats is not None:
+        stats.count("files_merged", files_merged)
+    return files_merged
+
+
+def snapshot_file_paths(file_paths: Iterator[Path], merge_state: MergeStateStore,
+                        snapshots: Dict[Path, FileSnapshot]) -> Iterator[Path]:
+    # Snapshots each file as the combiner takes it, before any of it is read.  A file that can't be read is passed on
+    # without one and the combiner decides what to do with it.
+    for file_path in file_paths:
+        try:
+            snapshots[file_path] = merge_state.snapshot(file_path)
+        except OSError:
+            pass
+        yield file_path
 
 
 # The context manager won't keep the file open for the inner function.
 def log_file_combiner(output_file_path: Path,
                       header_row: Optional[Sequence[str]] =
-                      None) -> Callable[[Iterator[Path]], Iterator[Path]]:
-    with output_file_path.open(mode="w", newline='') as output_file:
+                      None, passthrough: bool = False,
+                      append: bool = False,
+                      compression_level: Optional[int] = None,
+                      deduplicator: Optional[RecordDeduplicator] = None,
+                      stats: Optional[MergeStats] = None,
+                      buffer_size: int = DEFAULT_OUTPUT_BUFFER_SIZE,
+                      fsync_policy: str = "never",
+                      projection: Optional[ColumnProjection] = None,
+                      row_filter: Optional[RowFilter] = None) -> Callable[[Iterator[Path]], Iterator[Path]]:
+    # In append mode an existing output keeps its contents, and the header is only written if the file is empty.
+    # The output is compressed if its name ends in a compression suffix such as .gz.
+    # Rows reach the output file in writes of about buffer_size bytes.  With the "file" fsync policy a file is only
+    # yielded, and so archived, once its rows are on disk.  Compressed output can only be synced at the end.
+    # With a projection, header_row is the header written to the output and the projection decides which files match.
+    output_is_empty = not (append and output_file_path.exists() and output_file_path.stat().st_size > 0)
+    with open_output_file(output_file_path, "a" if append else "w", compression_level) as output_file:
         log_writer = writer(output_file)
-        if header_row:
+        if header_row and output_is_empty:
             log_writer.writerow(header_row)
 
         def log_file_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
-            with output_file_path.open(mode="a", newline="") as combiner_output_file:
-                combiner_writer = writer(combiner_output_file)
-                for input_file_path in input_file_paths:
-                    with input_file_path.open(newline='') as input_file:
-                        log_reader = reader(input_file)
-                        was_merged = log_record_combiner(combiner_writer, log_reader, header_row)
-                    if was_merged:
-                        yield input_file_path
+            with open_combiner_output(output_file_path, passthrough, compression_level=compression_level,
+                                      buffer_size=buffer_size) as combiner_output_file:
+                for input_file_path in combine_files_into(combiner_output_file, input_file_paths, header_row,
+                                                          passthrough, deduplicator, stats, projection,
+                                                          row_filter):
+                    if fsync_policy == "file":
+                        sync_output_file(combiner_output_file)
+                    yield input_file_path
+            if fsync_policy != "never":
+                sync_path(output_file_path)
 
         return log_file_combiner_closure
 
 
+def stream_log_file_combiner(output: Union[IO, RowSink], header_row: Optional[Sequence[str]] = None,
+                             passthrough: bool = False, deduplicator: Optional[RecordDeduplicator] = None,
+                             stats: Optional[MergeStats] = None,
+                             projection: Optional[ColumnProjection] = None,
+                             row_filter: Optional[RowFilter] = None) -> Callable[[Iterator[Path]], Iterator[Path]]:
+    # Like log_file_combiner, but into a stream the caller opened, such as standard output or a pipe.  The stream is
+    # flushed at the end and left open.  A binary stream gets rows encoded like files are and passthrough bytes as they
+    # are.  A text stream gets rows as they are, so it should be opened with newline="", and passthrough bytes go to its
+    # buffer, which sys.stdout has.  Anything without a write method is a row sink.  It is called with every merged row,
+    # after projection, but not with the header, and it can't take passthrough bytes.
+    if passthrough and not hasattr(output, "write"):
+        raise ValueError("Passthrough mode writes bytes, it needs a stream rather than a row sink.")
+    if passthrough and isinstance(output, TextIOBase) and not hasattr(output, "buffer"):
+        raise ValueError("Passthrough mode writes bytes, it needs a binary stream or a text stream with a buffer.")
+
+    def stream_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
+        with stream_output(output, passthrough) as (output_file, row_writer):
+            if header_row and output_file is not None:
+                if row_writer is not None:
+                    row_writer.writerow(header_row)
+                else:
+                    output_file.write(encode_row(header_row))
+            yield from combine_files_into(output_file, input_file_paths, header_row, passthrough, deduplicator, stats,
+                                          projection, row_filter, row_writer)
+
+    return stream_combiner_closure
+
+
+class RowSinkWriter:
+    # Stands in for csv.writer, handing rows to a callable rather than writing them out.
+    def __init__(self, sink: RowSink):
+        self.sink = sink
+
+    def writerow(self, row: Sequence[str]) -> None:
+        self.sink(row)
+
+    def writerows(self, rows: Iterator[Sequence[str]]) -> None:
+        deque(map(self.sink, rows), maxlen=0)
+
+
+@contextmanager
+def stream_output(output: Union[IO, RowSink],
+                  passthrough: bool = False) -> Iterator[Tuple[Optional[IO], Optional[Union[writer, RowSinkWriter]]]]:
+    # Yields the file object to write to and the writer for rows, which passthrough mode doesn't have.  A row sink has
+    # no file object.
+    if not hasattr(output, "write"):
+        yield None, RowSinkWriter(output)
+        return
+    if isinstance(output, TextIOBase):
+        if not passthrough:
+            try:
+                yield output, writer(output)
+            finally:
+                output.flush()
+            return
+        # Whatever was written as text has to reach the buffer before the bytes do.
+        output.flush()
+        output = output.buffer
+    if passthrough:
+        try:
+            yield output, None
+        finally:
+            output.flush()
+        return
+    text_output = TextIOWrapper(output, encoding=getpreferredencoding(False), newline="")
+    try:
+        yield text_output, writer(text_output)
+    finally:
+        # Closing the wrapper would close the caller's stream, detaching it leaves the stream open.
+        text_output.flush()
+        text_output.detach()
+
+
+def encode_row(row: Sequence[str]) -> bytes:
+    # A row as csv.writer writes it, encoded the way the text path encodes files.
+    buffer = StringIO()
+    writer(buffer).writerow(row)
+    return buffer.getvalue().encode(getpreferredencoding(False))
+
+
+def rotating_log_file_combiner(output_file_path: Path, header_row: Optional[Sequence[str]] = None,
+                               max_bytes: int = 0, max_rows: int = 0, repeat_header: bool = True,
+                               writer_threads: int = 1, compression_level: Optional[int] = None,
+                               deduplicator: Optional[RecordDeduplicator] = None,
+                               stats: Optional[MergeStats] = None,
+                               projection: Optional[ColumnProjection] = None,
+                               row_filter: Optional[RowFilter] = None) -> Callable[[Iterator[Path]], Iterator[Path]]:
+    # Like log_file_combiner, but the output is split into part files at row boundaries.
+    def rotating_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
+        with RotatingOutput(output_file_path, header_row, max_bytes, max_rows, repeat_header, writer_threads,
+                            compression_level) as rotating_output:
+            yield from combine_files_into(rotating_output, input_file_paths, header_row, deduplicator=deduplicator,
+                                          stats=stats, projection=projection, row_filter=row_filter)
+
+    return rotating_combiner_closure
+
+
+def checkpointed_log_file_combiner(output_file_path: Path, header_row: Optional[Sequence[str]] = None,
+                                   passthrough: bool = False, resume: bool = False,
+                                   checkpoint_files: int = DEFAULT_CHECKPOINT_FILES,
+                                   checkpoint_seconds: float = DEFAULT_CHECKPOINT_SECONDS,
+                                   deduplicator: Optional[RecordDeduplicator] = None,
+                                   stats: Optional[MergeStats] = None,
+                                   projection: Optional[ColumnProjection] = None,
+                                   row_filter: Optional[RowFilter] = None) -> Callable[[Iterator[Path]],
+                                                                                       Iterator[Path]]:
+    # Like log_file_combiner, but crash safe.  A file is only yielded, and so archived, once a checkpoint or the final
+    # commit covers it.  When resuming, inputs the checkpoint says were already written are yielded without being
+    # written again, so the ones an interrupted run didn't get to archive still are.
+    merge_checkpoint = MergeCheckpoint(output_file_path, resume)
+
+    def checkpointed_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
+        covered_file_paths = []
+
+        def unmerged_file_paths() -> Iterator[Path]:
+            for input_file_path in input_file_paths:
+                if merge_checkpoint.is_merged(input_file_path):
+                    covered_file_paths.append(input_file_path)
+                else:
+                    yield input_file_path
+
+        output_file = merge_checkpoint.open_output(header_row, passthrough)
+        try:
+            written_file_paths = []
+            last_checkpoint_time = time.monotonic()
+            for input_file_path in combine_files_into(output_file, unmerged_file_paths(), header_row, passthrough,
+                                                      deduplicator, stats, projection, row_filter):
+                written_file_paths.append(input_file_path)
+                if (len(written_file_paths) >= checkpoint_files or
+                        time.monotonic() - last_checkpoint_time >= checkpoint_seconds):
+                    merge_checkpoint.record(output_file, written_file_paths)
+                    covered_file_paths.extend(written_file_paths)
+                    written_file_paths = []
+                    last_checkpoint_time = time.monotonic()
+                    yield from covered_file_paths
+                    covered_file_paths.clear()
+            merge_checkpoint.commit(output_file)
+        finally:
+            # After a failure the partial output and the checkpoint log are left for --resume.
+            output_file.close()
+            merge_checkpoint.close()
+        yield from covered_file_paths
+        yield from written_file_paths
+
+    return checkpointed_combiner_closure
+
+
+def parallel_log_file_combiner(output_file_path: Path, header_row: Optional[Sequence[str]] = None,
+                               passthrough: bool = False, append: bool = False, jobs: int = 2,
+                               files_per_shard: int = DEFAULT_FILES_PER_SHARD,
+                               compression_level: Optional[int] = None) -> Callable[[Iterator[Path]],
+                                                                                    Iterator[Path]]:
+    # Input files are split into runs of consecutive files.  Each run is merged into its own temporary shard by a worker
+    # process, then the shards are appended to the output in input order.  A file is only yielded once the shard that
+    # holds it has been committed to the output.
+    log_file_combiner(output_file_path, header_row, passthrough, append, compression_level)
+
+    def parallel_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
+        input_file_paths = iter(input_file_paths)
+        chunks = iter(lambda: list(islice(input_file_paths, files_per_shard)), [])
+        # Shards live next to the output so that committing them never crosses a filesystem.
+        shard_directory = Path(tempfile.mkdtemp(prefix=".logmerge-shards-", dir=str(output_file_path.parent)))
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as pool, \
+                    open_output_file(output_file_path, "ab", compression_level) as output_file:
+                # Only a couple of shards per worker are allowed to wait for commit, which bounds the temporary space.
+                in_flight_shards = deque()
+                for shard_number, chunk in enumerate(chunks):
+                    shard_path = Path(shard_directory, f"{shard_number}.shard")
+                    in_flight_shards.append((pool.submit(merge_files_to_shard, chunk, shard_path, header_row,
+                                                         passthrough), shard_path))
+                    if len(in_flight_shards) >= jobs * 2:
+                        yield from commit_shard(output_file, *in_flight_shards.popleft())
+                while in_flight_shards:
+                    yield from commit_shard(output_file, *in_flight_shards.popleft())
+        finally:
+            shutil.rmtree(shard_directory, ignore_errors=True)
+
+    return parallel_combiner_closure
+
+
+def merge_files_to_shard(input_file_paths: List[Path], shard_path: Path, header_row: Optional[Sequence[str]] = None,
+                         passthrough: bool = False) -> List[Path]:
+    # This runs in a worker process, so everything it takes and returns has to be picklable.
+    with open_combiner_output(shard_path, passthrough, create=True) as shard_file:
+        return list(combine_files_into(shard_file, input_file_paths, header_row, passthrough))
+
+
+def commit_shard(output_file: BinaryIO, shard_future: Future, shard_path: Path) -> List[Path]:
+    merged_file_paths = shard_future.result()
+    with shard_path.open(mode="rb") as shard_file:
+        copy_bytes_verbatim(output_file, shard_file, 0)
+    shard_path.unlink()
+    return merged_file_paths
+
+
+def pipelined_log_file_combiner(output_file_path: Path, header_row: Optional[Sequence[str]] = None,
+                                passthrough: bool = False, append: bool = False,
+                                compression_level: Optional[int] = None, readers: int = DEFAULT_PIPELINE_READERS,
+                                stats: Optional[MergeStats] = None, buffer_size: int = DEFAULT_OUTPUT_BUFFER_SIZE,
+                                fsync_policy: str = "never",
+                                projection: Optional[ColumnProjection] = None,
+                                row_filter: Optional[RowFilter] = None) -> Callable[[Iterator[Path]],
+                                                                                    Iterator[Path]]:
+    # Like log_file_combiner, but several files are opened, checked and parsed on reader threads while the ones before
+    # them are written, see AsyncMergePipeline.  Files are still written whole and in input order.  Passthrough files
+    # are always normalized here, they never take the kernel copy path.  Buffering, syncing, projection and filtering
+    # are as for log_file_combiner.
+    log_file_combiner(output_file_path, header_row, passthrough, append, compression_level)
+
+    def pipelined_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
+        # The readers fill this in, it is the only thing they share with this thread.
+        file_rows = {}
+
+        def read_file(input_file_path: Path) -> Iterator[Union[bool, bytes, str]]:
+            if passthrough:
+                return passthrough_file_chunks(input_file_path, header_row)
+            return record_file_chunks(input_file_path, header_row, file_rows, projection, row_filter)
+
+        with open_combiner_output(output_file_path, passthrough, compression_level=compression_level,
+                                  buffer_size=buffer_size) as output_file:
+            pipeline = AsyncMergePipeline(read_file, output_file.write, readers)
+            # Files overlap, so the time of a file is the time since the one before it was written.
+            last_finished = time.perf_counter()
+            for input_file_path, was_merged in pipeline(input_file_paths):
+                rows = file_rows.pop(input_file_path, None)
+                if stats is not None:
+                    finished = time.perf_counter()
+                    stats.record_file(input_file_path, file_size(input_file_path), rows, finished - last_finished,
+                                      was_merged)
+                    last_finished = finished
+                if was_merged:
+                    if fsync_policy == "file":
+                        sync_output_file(output_file)
+                    yield input_file_path
+        if fsync_policy != "never":
+            sync_path(output_file_path)
+
+    return pipelined_combiner_closure
+
+
+def record_file_chunks(input_file_path: Path, header_row: Optional[Sequence[str]] = None,
+                       file_rows: Optional[dict] = None,
+                       projection: Optional[ColumnProjection] = None,
+                       row_filter: Optional[RowFilter] = None) -> Iterator[Union[bool, str]]:
+    # Yields whether the file has the header, then its rows serialized by csv.writer in batches of PIPELINE_CHUNK_ROWS.
+    # The number of rows goes into file_rows once the file has been read.
+    with open_input_file(input_file_path) as input_file:
+        log_reader = open_record_reader(input_file, header_row, row_filter)
+        file_rows_to_write = accepted_rows(log_reader, header_row, projection=projection)
+        if file_rows_to_write is None:
+            if file_rows is not None:
+                file_rows[input_file_path] = 0
+            yield False
+            return
+        yield True
+        buffer = StringIO()
+        buffer_writer = writer(buffer)
+        for rows in iter(lambda: list(islice(file_rows_to_write, PIPELINE_CHUNK_ROWS)), []):
+            buffer_writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if file_rows is not None:
+            file_rows[input_file_path] = max(0, log_reader.line_num - (1 if header_row else 0))
+
+
+def passthrough_file_chunks(input_file_path: Path,
+                            header_row: Optional[Sequence[str]] = None) -> Iterator[Union[bool, bytes]]:
+    # Like log_bytes_combiner, but yields whether the file has the header and then its normalized body.
+    with open_input_file(input_file_path, binary=True) as input_file:
+        first_line = input_file.readline()
+        body_offset = 0
+        if header_row:
+            if not first_line or parse_header_line(first_line) != header_row:
+                yield False
+                return
+            body_offset = len(first_line)
+        yield True
+        yield from normalized_chunks(input_file, first_line[body_offset:])
+
+
+def open_combiner_output(output_file_path: Path, passthrough: bool = False, create: bool = False,
+                         compression_level: Optional[int] = None, buffer_size: int = -1) -> IO:
+    # Passthrough mode writes bytes and everything else goes through csv.writer.
+    return open_output_file(output_file_path, ("w" if create else "a") + ("b" if passthrough else ""),
+                            compression_level, buffer_size)
+
+
+def combine_files_into(output_file: IO, input_file_paths: Iterator[Path], header_row: Optional[Sequence[str]] = None,
+                       passthrough: bool = False,
+                       deduplicator: Optional[RecordDeduplicator] = None,
+                       stats: Optional[MergeStats] = None,
+                       projection: Optional[ColumnProjection] = None,
+                       row_filter: Optional[RowFilter] = None,
+                       row_writer: Optional[Union[writer, RowSinkWriter]] = None) -> Iterator[Path]:
+    # Passthrough mode only parses the header line.  The rest of each file is copied as raw bytes.
+    # Rows are counted by the csv reader as it goes, so stats cost nothing per row.  Passthrough never splits rows, so
+    # it has no row count.  Rows go to row_writer when there is one, instead of a csv.writer over output_file.
+    combiner_writer = None if passthrough else row_writer if row_writer is not None else writer(output_file)
+    for input_file_path in input_file_paths:
+        start = time.perf_counter() if stats is not None else 0.0
+        rows = None
+        if passthrough:
+            with open_input_file(input_file_path, binary=True) as input_file:
+                was_merged = log_bytes_combiner(output_file, input_file, header_row)
+        else:
+            with open_input_file(input_file_path) as input_file:
+                log_reader = open_record_reader(input_file, header_row, row_filter)
+                was_merged = log_record_combiner(combiner_writer, log_reader, header_row, deduplicator, projection)
+                # line_num counts lines, so it only overcounts rows with quoted line breaks in them.
+                rows = max(0, log_reader.line_num - (1 if header_row else 0)) if was_merged else 0
+        if stats is not None:
+            stats.record_file(input_file_path, file_size(input_file_path), rows, time.perf_counter() - start,
+                              was_merged)
+        if was_merged:
+            yield input_file_path
+
+
+def open_record_reader(input_file: IO, header_row: Optional[Sequence[str]] = None,
+                       row_filter: Optional[RowFilter] = None) -> Union[reader, FilteredReader]:
+    # Either way the result is iterated like a csv.reader and has its line_num.
+    return reader(input_file) if row_filter is None else row_filter.reader(input_file, bool(header_row))
+
+
+def file_size(file_path: Path) -> Optional[int]:
+    try:
+        return file_path.stat().st_size
+    except OSError:
+        return None
+
+
 def log_record_combiner(output_writer: writer, input_reader: reader,
-                        header_row: Optional[Sequence[str]] = None) -> bool:
+                        header_row: Optional[Sequence[str]] = None,
+                        deduplicator: Optional[RecordDeduplicator] = None,
+                        projection: Optional[ColumnProjection] = None) -> bool:
     res = False
-    if not header_row or next(input_reader) == header_row:
-        output_writer.writerows(input_reader)
+    rows = accepted_rows(input_reader, header_row, deduplicator, projection)
+    if rows is not None:
+        output_writer.writerows(rows)
         res = True
     return res
 
 
-def get_csv_paths_in_directory(directory: PathType, ignore: Optional[PathType] = None,
-                               recurse: bool = False) -> Iterator[Path]:
-    # Argument conversion.  This is where we convert the arguments we receive into the form that is most useful for us.
-    directory = Path(directory)
-    ignore = Path(ignore) if ignore is not None else None
-    glob_string = "*.csv" if not recurse else "**/*.csv"
-    # This acts as a filter on the list of files.  We don't want to append our output file to itself, so we exclude it
-    # from the listings.
-    return (path for path in directory.glob(glob_string) if
-            path.is_file() and not (ignore and path.samefile(ignore)))
+def accepted_rows(input_reader: Iterator[Sequence[str]], header_row: Optional[Sequence[str]] = None,
+                  deduplicator: Optional[RecordDeduplicator] = None,
+                  projection: Optional[ColumnProjection] = None) -> Optional[Iterator[Sequence[str]]]:
+    # Reads the header and returns the rows to write after it, or None when the file doesn't match.  With a projection
+    # the projection decides which headers match and header_row isn't used.
+    if projection is not None:
+        first_row = next(input_reader, None)
+        row_mapper = projection.row_mapper(first_row) if first_row is not None else None
+        if row_mapper is None:
+            return None
+        rows = iter(row_mapper(input_reader))
+    elif not header_row or next(input_reader, None) == header_row:
+        rows = input_reader
+    else:
+        return None
+    return rows if deduplicator is None else deduplicator.filter_rows(rows)
+
+
+def log_bytes_combiner(output_file: BinaryIO, input_file: BinaryIO,
+                       header_row: Optional[Sequence[str]] = None) -> bool:
+    first_line = input_file.readline()
+    body_offset = 0
+    if header_row:
+        if not first_line or parse_header_line(first_line) != header_row:
+            return False
+        body_offset = len(first_line)
+    # Files whose every line ending is already the output line terminator are copied verbatim, which lets the kernel do
+    # the writing.  The whole body is checked first, a first line that ends any other way rules the copy out at once.
+    # Anything else is streamed through a buffer and normalized on the way.  Decompressing readers can't seek cheaply,
+    # so they are always streamed and the part of the first line that was already read is passed along rather than read
+    # again.
+    if first_line.endswith(OUTPUT_LINE_TERMINATOR) and (is_plain_file(input_file) or isinstance(input_file, BytesIO)):
+        if has_only_output_line_endings(input_file, body_offset):
+            copy_bytes_verbatim(output_file, input_file, body_offset)
+        else:
+            input_file.seek(body_offset)
+            copy_bytes_normalized(output_file, input_file)
+    else:
+        copy_bytes_normalized(output_file, input_file, first_line[body_offset:])
+    return True
+
+
+def is_plain_file(file_object: IO) -> bool:
+    # True for ordinary buffered or unbuffered files.  Compressed file objects also have a fileno(), but it belongs to
+    # the compressed file underneath, so they must never be handed to the kernel.
+    return isinstance(file_object, (BufferedReader, BufferedWriter, BufferedRandom, FileIO, BatchedFileWriter))
+
+
+def parse_header_line(header_line: bytes) -> Sequence[str]:
+    # The text path reads input using the locale encoding, so the header is decoded the same way here.
+    # Undecodable bytes are replaced rather than raised, they simply make the header fail to match.
+    decoded_line = header_line.decode(getpreferredencoding(False), errors="replace")
+    return next(reader([decoded_line]), [])
+
+
+def has_only_output_line_endings(input_file: BinaryIO, offset: int) -> bool:
+    # True when every carriage return and line feed from offset on is part of an output line terminator, quoted or not.
+    input_file.seek(offset)
+    # A carriage return at the end of a chunk is carried over to see whether the next chunk starts with its line feed.
+    carried = b""
+    for chunk in iter(lambda: input_file.read(PASSTHROUGH_BUFFER_SIZE), b""):
+        chunk = carried + chunk
+        carried = b"\r" if chunk.endswith(b"\r") else b""
+        chunk = chunk[:len(chunk) - len(carried)]
+        terminators = chunk.count(OUTPUT_LINE_TERMINATOR)
+        if chunk.count(b"\r") != terminators or chunk.count(b"\n") != terminators:
+            return False
+    return not carried
+
+
+def copy_bytes_verbatim(output_file: BinaryIO, input_file: BinaryIO, offset: int) -> None:
+    input_size = input_file.seek(0, SEEK_END)
+    count = input_size - offset
+    if count <= 0:
+        return
+    copied = 0
+    # In-memory streams and compressed files have no file descriptor to hand to the kernel, they take the buffered path.
+    # So do pipes, since the output position has to be found again afterwards.
+    if is_plain_file(input_file) and is_plain_file(output_file) and output_file.seekable():
+        output_file.flush()
+        copied = kernel_copy(input_file.fileno(), output_file.fileno(), offset, count)
+        # The kernel copy moved the descriptor's position without telling the buffered file object, so resynchronize.
+        output_file.seek(0, SEEK_END)
+    if copied < count:
+        input_file.seek(offset + copied)
+        shutil.copyfileobj(input_file, output_file, PASSTHROUGH_BUFFER_SIZE)
+    input_file.seek(input_size - 1)
+    if input_file.read(1) != b"\n":
+        output_file.write(OUTPUT_LINE_TERMINATOR)
+
+
+def copy_bytes_normalized(output_file: BinaryIO, input_file: BinaryIO, already_read: bytes = b"") -> None:
+    for chunk in normalized_chunks(input_file, already_read):
+        output_file.write(chunk)
+
+
+def normalized_chunks(input_file: BinaryIO, already_read: bytes = b"") -> Iterator[bytes]:
+    # Yields the rest of input_file with every line ending turned into the output line terminator, and a terminator
+    # added after a last line that has none.  Line breaks inside quoted fields are field data, which the csv module
+    # keeps as it is, so they are left alone.  Quotes only ever come in pairs inside a quoted field, so whether a byte
+    # is inside quotes is given by the number of quotes before it.
+    last_byte = b""
+    in_quotes = False
+    # A carriage return at the end of a chunk might be the first half of a CRLF pair, so it is held back until the next
+    # chunk has been read.
+    pending_carriage_return = False
+    chunks = chain([already_read], iter(lambda: input_file.read(PASSTHROUGH_BUFFER_SIZE), b""))
+    for chunk in chunks:
+        if pending_carriage_return:
+            chunk = b"\r" + chunk
+        # The pieces between quotes alternate between outside and inside a quoted field.
+        pieces = chunk.split(b'"')
+        ends_in_quotes = in_quotes != (len(pieces) % 2 == 0)
+        pending_carriage_return = chunk.endswith(b"\r") and not ends_in_quotes
+        if pending_carriage_return:
+            pieces[-1] = pieces[-1][:-1]
+        chunk = b'"'.join(piece if in_quotes != (index % 2 == 1) else normalize_line_endings(piece)
+                          for index, piece in enumerate(pieces))
+        in_quotes = ends_in_quotes
+        if chunk:
+            yield chunk
+            last_byte = chunk[-1:]
+    if pending_carriage_return:
+        yield OUTPUT_LINE_TERMINATOR
+        last_byte = b"\n"
+    if last_byte and last_byte != b"\n":
+        yield OUTPUT_LINE_TERMINATOR
+
+
+def normalize_line_endings(data: bytes) -> bytes:
+    return data.replace(b"\r\n", b"\n").replace(b"\r", b"\n").replace(b"\n", OUTPUT_LINE_TERMINATOR)
+
+
+def kernel_copy(input_fd: int, output_fd: int, offset: int, count: int) -> int:
+    # Returns the number of bytes copied.  That may be less than count, or zero, when the platform or filesystem doesn't
+    # support in-kernel copies.  The caller is responsible for copying whatever is left.
+    copied = 0
+    copy_functions = []
+    if hasattr(os, "copy_file_range"):
+        copy_functions.append(lambda position, length: os.copy_file_range(input_fd, output_fd, length, position))
+    if hasattr(os, "sendfile"):
+        copy_functions.append(lambda position, length: os.sendfile(output_fd, input_fd, position, length))
+    for copy_function in copy_functions:
+        try:
+            while copied < count:
+                sent = copy_function(offset + copied, count - copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError as e:
+            logger.debug(f"In-kernel copy failed, trying the next method: {e}")
+            continue
+        break
+    return copied
+
+
+def get_csv_paths_in_directory(directory: PathType, ignore: Optional[Union[PathType, int]] = None,
+                               recurse: bool = False, merge_state: Optional[MergeStateStore] = None,
+                               max_depth: Optional[int] = None,
+                               include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS,
+                               exclude_patterns: Sequence[str] = (),
+                               threads: int = DEFAULT_DISCOVERY_THREADS) -> Iterator[Path]:
+    # max_depth only applies to recursive searches.  A flat search never leaves directory.
+    # The output file is excluded by comparing device and inode numbers, so we never append it to itself.  It can be
+    # given by its path or by an open file descriptor.
+    entries = walk_csv_files(directory, ignore, max_depth if recurse else 0, include_patterns, exclude_patterns,
+                             threads)
+    # Files that an earlier run already merged, and that haven't changed since, are skipped.
+    if merge_state is not None:
+        entries = (entry for entry in entries if not merge_state.is_unchanged(Path(entry.path), entry.stat()))
+    return (Path(entry.path) for entry in entries)
+
+
+def get_csv_paths_from_list(names: Iterable[PathType], directory: PathType,
+                            ignore: Optional[Union[PathType, int]] = None,
+                            merge_state: Optional[MergeStateStore] = None) -> Iterator[Path]:
+    # Like get_csv_paths_in_directory, but the files are the listed ones, in the order given, and no directory is
+    # searched.  Listed files don't have to match the include patterns.  Files outside directory are skipped, see
+    # listed_csv_files.
+    entries = listed_csv_files(names, directory, ignore)
+    if merge_state is not None:
+        entries = ((path, stat_result) for path, stat_result in entries if
+                   not merge_state.is_unchanged(Path(path), stat_result))
+    return (Path(path) for path, _ in entries)
 
 
 def move_file_to_archive(search_directory: Path, archive_directory: Path, file_to_move: Path) -> None:
     relative_path = file_to_move.relative_to(search_directory)
-    destination_path = Path(archive_directory, relative_path)
-    destination_path.parent.mkdir(parents=True, exist_ok=True)
-    if destination_path.exists():
-        logger.error(f"Destination file {destination_path} already exists.")
-        raise FileExistsError
-    file_to_move.replace(destination_path)
+    move_file(file_to_move, Path(archive_directory, relative_path))
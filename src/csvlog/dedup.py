@@ -0,0 +1,220 @@
+import hashlib
+import heapq
+import logging
+import mmap
+import shutil
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from csvlog.defaults import DEFAULT_DEDUP_MEMORY
+from csvlog.sorted_merge import resolve_key_columns
+
+logger = logging.getLogger(__name__)
+
+# Rows are remembered by a 16 byte digest.  At that width an accidental collision, which would drop a row that isn't
+# really a duplicate, is vanishingly unlikely even across billions of rows.
+DIGEST_SIZE = 16
+# The table is grown when it is half full, which keeps linear probe sequences short.
+INITIAL_TABLE_SLOTS = 1024
+# Spilled runs are merged into one whenever there are more than this many, so a lookup never searches many files.
+MAX_SPILLED_RUNS = 8
+BLOOM_HASH_COUNT = 7
+EMPTY_DIGEST = bytes(DIGEST_SIZE)
+
+
+class DigestTable:
+    # An open addressing hash set of fixed width digests held in a flat array of 64 bit words, two per slot.  That is
+    # 16 bytes per slot, where a Python set of bytes objects costs several times as much per entry.  An all zero slot
+    # is empty, so callers must never add the all zero digest.
+    def __init__(self, slots: int = INITIAL_TABLE_SLOTS):
+        self.slots = slots
+        self.words = array("Q", bytes(DIGEST_SIZE * slots))
+        self.count = 0
+
+    @property
+    def size_in_bytes(self) -> int:
+        return self.slots * DIGEST_SIZE
+
+    def add(self, digest: bytes) -> bool:
+        # Returns False if the digest was already present.
+        high = int.from_bytes(digest[:8], "big")
+        low = int.from_bytes(digest[8:], "big")
+        words = self.words
+        mask = self.slots - 1
+        slot = high & mask
+        while True:
+            slot_high = words[2 * slot]
+            slot_low = words[2 * slot + 1]
+            if slot_high == high and slot_low == low:
+                return False
+            if slot_high == 0 and slot_low == 0:
+                words[2 * slot] = high
+                words[2 * slot + 1] = low
+                self.count += 1
+                return True
+            slot = (slot + 1) & mask
+
+    def needs_to_grow(self) -> bool:
+        return self.count * 2 >= self.slots
+
+    def grown(self) -> "DigestTable":
+        bigger_table = DigestTable(self.slots * 2)
+        for digest in self.digests():
+            bigger_table.add(digest)
+        return bigger_table
+
+    def digests(self) -> Iterator[bytes]:
+        words = self.words
+        for slot in range(self.slots):
+            if words[2 * slot] or words[2 * slot + 1]:
+                yield words[2 * slot].to_bytes(8, "big") + words[2 * slot + 1].to_bytes(8, "big")
+
+
+class BloomFilter:
+    # Answers "definitely not seen" or "maybe seen" for a digest.  The digest is already a good hash, so the bit
+    # positions are derived from its two halves by double hashing rather than by hashing again.
+    def __init__(self, size_in_bytes: int, hash_count: int = BLOOM_HASH_COUNT):
+        self.bits = bytearray(size_in_bytes)
+        self.bit_count = size_in_bytes * 8
+        self.hash_count = hash_count
+
+    def bit_positions(self, digest: bytes) -> Iterator[int]:
+        first_hash = int.from_bytes(digest[:8], "big")
+        second_hash = int.from_bytes(digest[8:], "big") | 1
+        return ((first_hash + index * second_hash) % self.bit_count for index in range(self.hash_count))
+
+    def add(self, digest: bytes) -> None:
+        for position in self.bit_positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, digest: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.bit_positions(digest))
+
+
+class SpilledRun:
+    # A sorted file of digests that is searched in place through a memory map.
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = path.open(mode="rb")
+        self.length = path.stat().st_size // DIGEST_SIZE
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.length else None
+
+    def __contains__(self, digest: bytes) -> bool:
+        low, high = 0, self.length
+        while low < high:
+            middle = (low + high) // 2
+            middle_digest = self.map[middle * DIGEST_SIZE:(middle + 1) * DIGEST_SIZE]
+            if middle_digest == digest:
+                return True
+            if middle_digest < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return False
+
+    def digests(self) -> Iterator[bytes]:
+        for index in range(self.length):
+            yield self.map[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE]
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+class RecordDeduplicator:
+    # Drops rows whose key columns, or whole contents when no key columns are given, were already seen by this
+    # deduplicator, whichever file they came from.  The first copy of a row is kept.  Digests are held in a compact
+    # table until it reaches memory_budget, then written out as a sorted run and searched from disk.  An optional Bloom
+    # filter in front of the runs means most new rows never touch them.
+    def __init__(self, key_columns: Sequence[str] = (), header_row: Optional[Sequence[str]] = None,
+                 memory_budget: int = DEFAULT_DEDUP_MEMORY, bloom_filter_bytes: int = 0,
+                 spill_directory: Optional[Path] = None):
+        self.key_indexes = resolve_key_columns(key_columns, header_row) if key_columns else None
+        self.memory_budget = memory_budget
+        self.bloom_filter = BloomFilter(bloom_filter_bytes) if bloom_filter_bytes > 0 else None
+        self.spill_directory = spill_directory
+        self.run_directory = None
+        self.table = DigestTable()
+        self.runs = []  # type: List[SpilledRun]
+        self.spilled_run_count = 0
+        self.kept = 0
+        self.dropped = 0
+
+    def __enter__(self) -> "RecordDeduplicator":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        if self.run_directory is not None:
+            shutil.rmtree(self.run_directory, ignore_errors=True)
+            self.run_directory = None
+
+    def filter_rows(self, rows: Iterable[Sequence[str]]) -> Iterator[Sequence[str]]:
+        for row in rows:
+            if self.is_new(row):
+                yield row
+
+    def is_new(self, row: Sequence[str]) -> bool:
+        digest = self.row_digest(row)
+        # The table is checked first because it is cheap.  A digest that turns out to be in a run is left in the table,
+        # which costs a slot but nothing else.
+        if not self.table.add(digest) or self.seen_in_runs(digest):
+            self.dropped += 1
+            return False
+        if self.bloom_filter is not None:
+            self.bloom_filter.add(digest)
+        self.kept += 1
+        if self.table.needs_to_grow():
+            if self.table.size_in_bytes * 2 > self.memory_budget:
+                self.spill()
+            else:
+                self.table = self.table.grown()
+        return True
+
+    def row_digest(self, row: Sequence[str]) -> bytes:
+        if self.key_indexes is not None:
+            row = [row[index] if index < len(row) else "" for index in self.key_indexes]
+        # Fields are separated by a NUL, which doesn't appear in real exports, so different rows can't run together.
+        digest = hashlib.blake2b("\0".join(row).encode("utf-8", errors="surrogatepass"),
+                                 digest_size=DIGEST_SIZE).digest()
+        # The all zero digest marks an empty slot in the table.
+        return digest if digest != EMPTY_DIGEST else bytes(DIGEST_SIZE - 1) + b"\x01"
+
+    def seen_in_runs(self, digest: bytes) -> bool:
+        if not self.runs:
+            return False
+        if self.bloom_filter is not None and not self.bloom_filter.might_contain(digest):
+            return False
+        return any(digest in run for run in self.runs)
+
+    def spill(self) -> None:
+        if self.run_directory is None:
+            self.run_directory = Path(tempfile.mkdtemp(prefix=".logmerge-dedup-",
+                                                       dir=str(self.spill_directory) if self.spill_directory else None))
+        run_path = self.write_run(sorted(self.table.digests()))
+        logger.debug(f"Spilled {self.table.count} row digests to {run_path}")
+        self.runs.append(SpilledRun(run_path))
+        self.table = DigestTable()
+        if len(self.runs) > MAX_SPILLED_RUNS:
+            merged_run_path = self.write_run(heapq.merge(*(run.digests() for run in self.runs)))
+            for run in self.runs:
+                run.close()
+                run.path.unlink()
+            self.runs = [SpilledRun(merged_run_path)]
+
+    def write_run(self, digests: Iterable[bytes]) -> Path:
+        run_path = Path(self.run_directory, f"{self.spilled_run_count}.digests")
+        self.spilled_run_count += 1
+        with run_path.open(mode="wb") as run_file:
+            for digest in digests:
+                run_file.write(digest)
+        return run_path
+
@@ -0,0 +1,37 @@
+from csvlog.compression import compressed_include_patterns
+
+# The defaults the configuration file and the command line need.  They live here, rather than in the modules that use
+# them, so that starting up doesn't import the whole merge machinery just to read a few numbers.
+
+# Compressed exports are decompressed on the fly, so they are found along with plain ones.
+DEFAULT_INCLUDE_PATTERNS = ("*.csv",) + compressed_include_patterns("*.csv")
+# Listing a directory on a network share is mostly waiting, so more threads than cores is reasonable.
+DEFAULT_DISCOVERY_THREADS = 8
+# Opening a file on high-latency storage is mostly waiting, so this can be well above the number of cores.
+DEFAULT_PROBE_THREADS = 8
+# Parallel merges hand each worker this many consecutive input files at a time.
+DEFAULT_FILES_PER_SHARD = 64
+# Rows are sorted in memory until their estimated size passes this budget, then they are written out as a sorted run.
+DEFAULT_SORT_MEMORY = 256 * 1024 * 1024
+# The in-memory digest table may grow to this many bytes before its contents are spilled to a sorted run on disk.
+DEFAULT_DEDUP_MEMORY = 256 * 1024 * 1024
+DEFAULT_SQLITE_TABLE = "records"
+# Rows are inserted with one executemany call and one commit per batch of this many rows.
+DEFAULT_SQLITE_BATCH_SIZE = 50000
+# The database is a rebuildable copy of the merged files, so durability is traded for load speed by default.
+DEFAULT_SQLITE_JOURNAL_MODE = "WAL"
+DEFAULT_SQLITE_SYNCHRONOUS = "NORMAL"
+# Renames are mostly waiting on the filesystem, and a cross-device move is a copy, so a few threads go a long way.
+DEFAULT_ARCHIVE_THREADS = 8
+RECOVERY_MODES = ("finish", "rollback")
+# A checkpoint is taken after this many merged files or this many seconds, whichever comes first.  Each one costs an
+# fsync of the output and of the checkpoint log.
+DEFAULT_CHECKPOINT_FILES = 1000
+DEFAULT_CHECKPOINT_SECONDS = 60.0
+# Pipelined merges read this many files at once while the previous ones are written.
+DEFAULT_PIPELINE_READERS = 8
+# Merged output is written to disk in chunks of about this many bytes.  Every write to a network volume is a round trip,
+# so this is far larger than Python's default buffer.
+DEFAULT_OUTPUT_BUFFER_SIZE = 1024 * 1024
+# When merged output is synced to disk: never, after every merged file, or once at the end of the merge.
+FSYNC_POLICIES = ("never", "file", "end")
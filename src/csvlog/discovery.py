@@ -0,0 +1,159 @@
+import logging
+import os
+import stat
+from fnmatch import fnmatch
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from csvlog.defaults import DEFAULT_DISCOVERY_THREADS, DEFAULT_INCLUDE_PATTERNS
+
+logger = logging.getLogger(__name__)
+
+# A directory listing is the matching file entries and the (path, relative path) of each subdirectory to descend into.
+DirectoryListing = Tuple[List[os.DirEntry], List[Tuple[str, str]]]
+# File lists are read in chunks this large.  It is far longer than any path, so a NUL separated list always has a NUL in
+# its first chunk.
+PATH_LIST_CHUNK_SIZE = 64 * 1024
+
+
+def walk_csv_files(directory, ignore=None, max_depth: Optional[int] = 0,
+                   include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS, exclude_patterns: Sequence[str] = (),
+                   threads: int = DEFAULT_DISCOVERY_THREADS) -> Iterator[os.DirEntry]:
+    # Yields a DirEntry for every matching file under directory, in sorted depth first order, so callers can reuse
+    # the type and stat information the directory listing already paid for.  A max_depth of 0 only lists directory
+    # itself and None has no limit.  Patterns are matched against both the file name and its path relative to
+    # directory.  Excluded directories are not entered at all.
+    root = os.fspath(directory)
+    # This runs on the first call to next(), not when the generator is created.  That matters because the output file
+    # the caller wants ignored might not exist until then.
+    ignore_identity = get_file_identity(ignore) if ignore is not None else None
+
+    def is_ignored(entry: os.DirEntry) -> bool:
+        # inode() is free on POSIX, so the device number is only fetched when the inode already matches.
+        return (ignore_identity is not None and entry.inode() == ignore_identity[1] and
+                entry.stat().st_dev == ignore_identity[0])
+
+    def list_directory(path: str, relative_path: str) -> DirectoryListing:
+        file_entries, subdirectories = [], []
+        try:
+            with os.scandir(path) as entries:
+                sorted_entries = sorted(entries, key=lambda directory_entry: directory_entry.name)
+        except OSError as e:
+            logger.warning(f"Cannot list directory {path}: {e}")
+            return file_entries, subdirectories
+        for entry in sorted_entries:
+            entry_relative_path = f"{relative_path}/{entry.name}" if relative_path else entry.name
+            if matches_patterns(entry.name, entry_relative_path, exclude_patterns):
+                continue
+            try:
+                # Symbolic links to directories aren't followed, so a link cycle can't trap the walk.
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append((entry.path, entry_relative_path))
+                elif (entry.is_file() and matches_patterns(entry.name, entry_relative_path, include_patterns) and
+                      not is_ignored(entry)):
+                    file_entries.append(entry)
+            except OSError as e:
+                logger.warning(f"Cannot examine {entry.path}: {e}")
+        return file_entries, subdirectories
+
+    def should_descend(depth: int) -> bool:
+        return max_depth is None or depth < max_depth
+
+    if threads <= 1 or max_depth == 0:
+        stack = [(root, "", 0)]
+        while stack:
+            path, relative_path, depth = stack.pop()
+            file_entries, subdirectories = list_directory(path, relative_path)
+            yield from file_entries
+            if should_descend(depth):
+                stack.extend((subdirectory, relative_subdirectory, depth + 1) for subdirectory, relative_subdirectory
+                             in reversed(subdirectories))
+        return
+
+    # Imported here so that flat searches, and runs with nothing to merge, don't pay for it.
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Subdirectories are listed ahead of time by the pool while the caller consumes results in order.
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending_listings = [(pool.submit(list_directory, root, ""), 0)]
+        try:
+            while pending_listings:
+                listing, depth = pending_listings.pop()
+                file_entries, subdirectories = listing.result()
+                if should_descend(depth):
+                    child_listings = [(pool.submit(list_directory, subdirectory, relative_subdirectory), depth + 1)
+                                      for subdirectory, relative_subdirectory in subdirectories]
+                    pending_listings.extend(reversed(child_listings))
+                yield from file_entries
+        finally:
+            # If the caller stops early there is no reason to wait for listings nobody will read.
+            for listing, _ in pending_listings:
+                listing.cancel()
+
+
+def has_candidate_files(directory, ignore=None, max_depth: Optional[int] = 0,
+                        include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS,
+                        exclude_patterns: Sequence[str] = ()) -> bool:
+    # A serial walk that stops at the first matching file.  It lets a run with nothing to merge finish without doing
+    # any of the setup a merge needs.
+    return next(walk_csv_files(directory, ignore, max_depth, include_patterns, exclude_patterns, threads=1),
+                None) is not None
+
+
+def matches_patterns(name: str, relative_path: str, patterns: Sequence[str]) -> bool:
+    return any(fnmatch(name, pattern) or fnmatch(relative_path, pattern) for pattern in patterns)
+
+
+def get_file_identity(path) -> Optional[Tuple[int, int]]:
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat_result.st_dev, stat_result.st_ino
+
+
+def read_path_list(list_file: BinaryIO) -> Iterator[str]:
+    # Yields the paths in a list of them, one per line or separated by NUL bytes as find -print0 writes them.  No path
+    # can contain a NUL, so a list with one in its first chunk is NUL separated.  The list is read a chunk at a time, so
+    # it can be as long as it likes.  Names are decoded like os.listdir decodes them, and blank entries are skipped.
+    chunk = list_file.read(PATH_LIST_CHUNK_SIZE)
+    separator = b"\0" if b"\0" in chunk else b"\n"
+    pending = b""
+    while chunk:
+        entries = (pending + chunk).split(separator)
+        pending = entries.pop()
+        for entry in entries:
+            if separator == b"\n":
+                entry = entry.rstrip(b"\r")
+            if entry:
+                yield os.fsdecode(entry)
+        chunk = list_file.read(PATH_LIST_CHUNK_SIZE)
+    pending = pending.rstrip(b"\r") if separator == b"\n" else pending
+    if pending:
+        yield os.fsdecode(pending)
+
+
+def listed_csv_files(names: Iterable[Union[str, os.PathLike]], directory,
+                     ignore=None) -> Iterator[Tuple[str, os.stat_result]]:
+    # Yields the path and stat result of each listed file, in the order they are listed, without listing any
+    # directories.  Relative names are relative to directory.  Every file has to be inside directory, as it is written,
+    # so that it can be archived under the same relative path.  Anything outside it, missing or not a regular file is
+    # left out with a warning.  Like walk_csv_files, ignore names the output so that it is never merged into itself.
+    root = os.path.abspath(os.fspath(directory))
+    root_prefix = root if root.endswith(os.sep) else root + os.sep
+    ignore_identity = get_file_identity(ignore) if ignore is not None else None
+    for name in names:
+        full_path = os.path.normpath(os.path.join(root, os.fspath(name)))
+        if not full_path.startswith(root_prefix):
+            logger.warning(f"Skipping {name}, it isn't in {directory}")
+            continue
+        try:
+            stat_result = os.stat(full_path)
+        except OSError as e:
+            logger.warning(f"Skipping {name}: {e}")
+            continue
+        if not stat.S_ISREG(stat_result.st_mode):
+            logger.warning(f"Skipping {name}, it isn't a file")
+            continue
+        if ignore_identity == (stat_result.st_dev, stat_result.st_ino):
+            continue
+        yield os.path.join(os.fspath(directory), full_path[len(root_prefix):]), stat_result
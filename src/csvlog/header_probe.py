@@ -0,0 +1,83 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from csv import Error as CSVError, reader
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Tuple
+
+from csvlog.compression import open_input_file
+from csvlog.defaults import DEFAULT_PROBE_THREADS
+from csvlog.merge_state import HeaderVerdictCache
+
+logger = logging.getLogger(__name__)
+
+
+class HeaderProbe:
+    # Reads the first row of each candidate file on a bounded pool of threads and passes on, in their original order,
+    # only the files whose header matches.  Probes run ahead of the consumer so that the latency of opening files is
+    # hidden, but never by more than a few probes per thread.  With a verdict cache, files whose verdict is already
+    # known aren't opened at all.  Files with one of the header variants pass as well.
+    def __init__(self, header_row: Sequence[str], threads: int = DEFAULT_PROBE_THREADS,
+                 verdict_cache: Optional[HeaderVerdictCache] = None, header_variants: Sequence[Sequence[str]] = ()):
+        self.header_row = header_row
+        self.header_variants = [list(header) for header in header_variants]
+        self.threads = threads
+        self.verdict_cache = verdict_cache
+        self.accepted = 0
+        self.rejected = 0
+        self.cached = 0
+
+    def __call__(self, file_paths: Iterator[Path]) -> Iterator[Path]:
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            in_flight_probes = deque()
+            try:
+                for file_path in file_paths:
+                    in_flight_probes.append(self.start_probe(pool, file_path))
+                    if len(in_flight_probes) >= self.threads * 4:
+                        yield from self.take_result(*in_flight_probes.popleft())
+                while in_flight_probes:
+                    yield from self.take_result(*in_flight_probes.popleft())
+            finally:
+                for _, probe, _ in in_flight_probes:
+                    probe.cancel()
+        logger.info(f"Header probe accepted {self.accepted} files and rejected {self.rejected}, "
+                    f"{self.cached} verdicts came from the cache")
+
+    def start_probe(self, pool: ThreadPoolExecutor, file_path: Path) -> Tuple[Path, Future, Optional[os.stat_result]]:
+        # The cache is only touched from this thread because sqlite connections can't be shared between threads.
+        stat_result = None
+        if self.verdict_cache is not None:
+            try:
+                stat_result = file_path.stat()
+            except OSError:
+                stat_result = None
+            verdict = self.verdict_cache.cached_verdict(file_path, stat_result) if stat_result is not None else None
+            if verdict is not None:
+                self.cached += 1
+                probe = Future()
+                probe.set_result(verdict)
+                return file_path, probe, None
+        probe = pool.submit(file_has_header, file_path, self.header_row, self.header_variants)
+        return file_path, probe, stat_result
+
+    def take_result(self, file_path: Path, probe: Future, stat_result: Optional[os.stat_result]) -> Iterator[Path]:
+        verdict = probe.result()
+        if stat_result is not None:
+            self.verdict_cache.record_verdict(file_path, verdict, stat_result)
+        if verdict:
+            self.accepted += 1
+            yield file_path
+        else:
+            self.rejected += 1
+
+
+def file_has_header(file_path: Path, header_row: Sequence[str], header_variants: Sequence[Sequence[str]] = ()) -> bool:
+    # The file is read the same way the merge reads it, so the two can't disagree about what the header is.
+    try:
+        with open_input_file(file_path) as input_file:
+            first_row = next(reader(input_file), None)
+            return first_row == header_row or (first_row is not None and first_row in header_variants)
+    except (OSError, EOFError, UnicodeDecodeError, CSVError) as e:
+        logger.warning(f"Cannot read the header of {file_path}: {e}")
+        return False
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Content hashes are computed in chunks this large so that hashing a big file doesn't hold it all in memory.
+HASH_BUFFER_SIZE = 1024 * 1024
+# Merged files are recorded inside one transaction that is committed every so often.  Committing after every file would
+# cost an fsync per file.
+COMMIT_INTERVAL = 1000
+
+# A file's stat and, when contents are hashed, its content hash, as taken by MergeStateStore.snapshot.
+FileSnapshot = Tuple[os.stat_result, Optional[str]]
+
+
+class MergeStateStore:
+    # Remembers which files have already been merged so that runs without archiving don't merge them again.
+    # A file is identified by its path, inode, size and modification time.  When hash_contents is set a file whose
+    # metadata changed but whose contents didn't is also treated as already merged.
+    def __init__(self, database_path: Path, hash_contents: bool = False):
+        self.database_path = Path(database_path)
+        self.hash_contents = hash_contents
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.database_path))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS merged_files ("
+                                "path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime_ns INTEGER, "
+                                "content_hash TEXT, merged_at TEXT)")
+        self.connection.commit()
+        self.pending_records = 0
+
+    def __enter__(self) -> "MergeStateStore":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def is_unchanged(self, path: Path, stat_result: Optional[os.stat_result] = None) -> bool:
+        stat_result = stat_result if stat_result is not None else path.stat()
+        row = self.connection.execute("SELECT inode, size, mtime_ns, content_hash FROM merged_files WHERE path = ?",
+                                      (state_key(path),)).fetchone()
+        if row is None:
+            return False
+        inode, size, mtime_ns, content_hash = row
+        if (inode, size, mtime_ns) == (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns):
+            return True
+        # The size check is free, so it is done before paying for a hash.
+        if self.hash_contents and content_hash is not None and size == stat_result.st_size:
+            if hash_file_contents(path) == content_hash:
+                logger.debug(f"{path} was touched but its contents are unchanged")
+                self.record_merged(path, stat_result, content_hash)
+                return True
+        return False
+
+    def snapshot(self, path: Path) -> FileSnapshot:
+        # Taken just before a file is merged and recorded once it has been, so a file that grows during its merge
+        # is seen as changed by the next run.  The hash reads the file ahead of the merge, which then finds it cached.
+        stat_result = path.stat()
+        return stat_result, hash_file_contents(path) if self.hash_contents else None
+
+    def record_merged(self, path: Path, stat_result: Optional[os.stat_result] = None,
+                      content_hash: Optional[str] = None) -> None:
+        stat_result = stat_result if stat_result is not None else path.stat()
+        if self.hash_contents and content_hash is None:
+            content_hash = hash_file_contents(path)
+        self.connection.execute("INSERT OR REPLACE INTO merged_files VALUES (?, ?, ?, ?, ?, ?)",
+                                (state_key(path), stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns,
+                                 content_hash, datetime.now().isoformat()))
+        self.pending_records += 1
+        if self.pending_records >= COMMIT_INTERVAL:
+            self.connection.commit()
+            self.pending_records = 0
+
+
+def state_key(path: Path) -> str:
+    # Paths are stored in absolute form so the same file is recognized no matter which directory the program runs from.
+    return os.path.abspath(str(path))
+
+
+def hash_file_contents(path: Path) -> str:
+    content_hash = hashlib.sha256()
+    with path.open(mode="rb") as input_file:
+        for chunk in iter(lambda: input_file.read(HASH_BUFFER_SIZE), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+class HeaderVerdictCache:
+    # Remembers whether each file passed the header check, so a file that was rejected and hasn't changed since is
+    # skipped without being opened.  Every verdict carries a fingerprint of the header it was checked against.  Changing
+    # the configured header discards the old verdicts the next time the cache is opened.
+    def __init__(self, database_path: Path, header_row: Sequence[str], header_variants: Sequence[Sequence[str]] = ()):
+        self.database_path = Path(database_path)
+        self.header_fingerprint = fingerprint_header(header_row, header_variants)
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.database_path))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS header_verdicts ("
+                                "path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime_ns INTEGER, "
+                                "header_fingerprint TEXT, accepted INTEGER)")
+        stale_verdicts = self.connection.execute("DELETE FROM header_verdicts WHERE header_fingerprint != ?",
+                                                 (self.header_fingerprint,)).rowcount
+        if stale_verdicts:
+            logger.info(f"Discarded {stale_verdicts} header verdicts made against a different header")
+        self.connection.commit()
+        self.pending_records = 0
+
+    def __enter__(self) -> "HeaderVerdictCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def cached_verdict(self, path: Path, stat_result: Optional[os.stat_result] = None) -> Optional[bool]:
+        # Returns None when there is no verdict for the file as it is now.
+        stat_result = stat_result if stat_result is not None else path.stat()
+        row = self.connection.execute("SELECT accepted FROM header_verdicts WHERE path = ? AND inode = ? AND size = ? "
+                                      "AND mtime_ns = ? AND header_fingerprint = ?",
+                                      (state_key(path), stat_result.st_ino, stat_result.st_size,
+                                       stat_result.st_mtime_ns, self.header_fingerprint)).fetchone()
+        return bool(row[0]) if row is not None else None
+
+    def record_verdict(self, path: Path, accepted: bool, stat_result: Optional[os.stat_result] = None) -> None:
+        stat_result = stat_result if stat_result is not None else path.stat()
+        self.connection.execute("INSERT OR REPLACE INTO header_verdicts VALUES (?, ?, ?, ?, ?, ?)",
+                                (state_key(path), stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns,
+                                 self.header_fingerprint, int(accepted)))
+        self.pending_records += 1
+        if self.pending_records >= COMMIT_INTERVAL:
+            self.connection.commit()
+            self.pending_records = 0
+
+
+def fingerprint_header(header_row: Sequence[str], header_variants: Sequence[Sequence[str]] = ()) -> str:
+    # Accepting more headers changes every verdict.  Without variants the fingerprint is the one earlier caches used.
+    headers = [list(header_row)] + [list(header) for header in header_variants] if header_variants else list(header_row)
+    return hashlib.sha256(repr(headers).encode("utf-8")).hexdigest()
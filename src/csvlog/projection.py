@@ -0,0 +1,94 @@
+import logging
+from collections import Counter
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from csvlog.sorted_merge import resolve_key_columns
+
+logger = logging.getLogger(__name__)
+
+Row = Sequence[str]
+# Turns the rows of one file into rows of the output layout.
+RowMapper = Callable[[Iterable[Row]], Iterable[Row]]
+
+
+class ColumnProjection:
+    # Rewrites rows from files with any accepted header into one canonical layout.  The canonical header is the
+    # configured one, header_variants are other headers that are accepted as well.  A variant's columns are matched to
+    # the canonical ones by name, in any order.  Canonical columns it doesn't have are left empty and columns only it
+    # has are dropped.  Of the canonical columns only those listed in columns are kept, in that order, named by their
+    # header or given as zero based column numbers.  No columns keeps them all.
+    # The mapping for each distinct header is worked out once, as a tuple of column indexes, so every row after that
+    # costs a single itemgetter call.
+    def __init__(self, canonical_header: Sequence[str], columns: Sequence[str] = (),
+                 header_variants: Sequence[Sequence[str]] = ()):
+        self.canonical_header = list(canonical_header)
+        self.column_indexes = resolve_key_columns(columns, self.canonical_header) if columns else tuple(
+            range(len(self.canonical_header)))
+        for column, index in zip(columns, self.column_indexes):
+            if index >= len(self.canonical_header):
+                raise ValueError(f"Column {column!r} is not in the header {self.canonical_header}")
+        self.output_header = [self.canonical_header[index] for index in self.column_indexes]
+        self.header_variants = [list(header) for header in header_variants]
+        self.row_mappers = {}  # type: Dict[Tuple[str, ...], Optional[RowMapper]]
+
+    def row_mapper(self, header: Sequence[str]) -> Optional[RowMapper]:
+        # Returns None for a header that isn't accepted.
+        key = tuple(header)
+        try:
+            return self.row_mappers[key]
+        except KeyError:
+            pass
+        column_indexes = self.compile(header)
+        row_mapper = make_row_mapper(column_indexes, len(header)) if column_indexes is not None else None
+        self.row_mappers[key] = row_mapper
+        if column_indexes is not None:
+            logger.debug(f"Mapping header {list(header)} to columns {column_indexes}")
+        return row_mapper
+
+    def compile(self, header: Sequence[str]) -> Optional[Tuple[Optional[int], ...]]:
+        # Returns the index of each output column in rows with this header, None for columns the header lacks.
+        header = list(header)
+        if header != self.canonical_header and header not in self.header_variants:
+            return None
+        canonical_positions = match_columns(self.canonical_header, header)
+        return tuple(canonical_positions[index] for index in self.column_indexes)
+
+
+def match_columns(canonical_header: Sequence[str], header: Sequence[str]) -> Tuple[Optional[int], ...]:
+    # Returns where each canonical column is in header, matched by name, or None where header doesn't have it.  Repeated
+    # names, like the empty ones in the default header, are matched by how many times they came before.
+    positions = {}  # type: Dict[Tuple[str, int], int]
+    occurrences = Counter()
+    for index, name in enumerate(header):
+        positions[(name, occurrences[name])] = index
+        occurrences[name] += 1
+    canonical_positions = []
+    occurrences.clear()
+    for name in canonical_header:
+        canonical_positions.append(positions.get((name, occurrences[name])))
+        occurrences[name] += 1
+    return tuple(canonical_positions)
+
+
+def make_row_mapper(column_indexes: Tuple[Optional[int], ...], header_width: int) -> RowMapper:
+    # Rows of the canonical header with every column kept are passed through untouched, short or long rows included.
+    if column_indexes == tuple(range(header_width)):
+        return lambda rows: rows
+    # Missing columns read a field past the end of the row, which padding makes empty.
+    indexes = tuple(header_width if index is None else index for index in column_indexes)
+    width = max(indexes) + 1
+    if len(indexes) == 1:
+        only_index = indexes[0]
+
+        def getter(row: Row) -> Row:
+            return row[only_index],
+    else:
+        getter = itemgetter(*indexes)
+
+    def project(row: Row) -> Row:
+        if len(row) < width:
+            row = list(row) + [""] * (width - len(row))
+        return getter(row)
+
+    return lambda rows: map(project, rows)
@@ -0,0 +1,152 @@
+import io
+import logging
+import queue
+import threading
+from collections import deque
+from csv import writer
+from locale import getpreferredencoding
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from csvlog.compression import name_with_suffix, open_output_file
+
+logger = logging.getLogger(__name__)
+
+# Formatted rows are collected into blocks this large before they are handed to a part's writer.
+PART_BLOCK_SIZE = 1024 * 1024
+# How many blocks may wait for a part writer thread before the merge has to wait for it.
+PART_QUEUE_DEPTH = 4
+
+
+def part_output_path(output_file_path: Path, part_number: int) -> Path:
+    # merged.csv becomes merged_part0001.csv, merged_part0002.csv and so on.
+    return name_with_suffix(output_file_path, f"_part{part_number:04}")
+
+
+class PartFile:
+    # One part file.  Blocks of formatted text are written as they come, or, with a writer thread, encoded, compressed
+    # and written on that thread while the merge carries on filling the next block or the next part.
+    def __init__(self, path: Path, compression_level: Optional[int] = None, threaded: bool = False):
+        self.path = path
+        self.encoding = getpreferredencoding(False)
+        self.output_file = open_output_file(path, "wb", compression_level)
+        self.blocks = queue.Queue(maxsize=PART_QUEUE_DEPTH) if threaded else None
+        self.error = None
+        self.worker = None
+        if threaded:
+            self.worker = threading.Thread(target=self.write_blocks, name=f"write {path.name}", daemon=True)
+            self.worker.start()
+
+    def write(self, block: str) -> None:
+        if self.worker is None:
+            self.output_file.write(block.encode(self.encoding))
+            return
+        self.raise_worker_error()
+        self.blocks.put(block)
+
+    def close(self) -> None:
+        if self.worker is not None:
+            self.blocks.put(None)
+            self.worker.join()
+        self.output_file.close()
+        self.raise_worker_error()
+
+    def raise_worker_error(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def write_blocks(self) -> None:
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                return
+            # After a failure the remaining blocks are drained and dropped, so the merge never blocks on a full queue.
+            if self.error is None:
+                try:
+                    self.output_file.write(block.encode(self.encoding))
+                except Exception as e:
+                    self.error = e
+
+
+class RotatingOutput:
+    # A write-only text file that spreads what is written to it over numbered part files.  It relies on csv.writer
+    # making exactly one write() call per row, so a part only ever ends between rows.  A part is finished once it holds
+    # max_rows rows or at least max_bytes characters.  The header is written at the top of the first part, and of every
+    # part when repeat_header is set.  With more than one writer thread, up to that many parts are written at once.
+    def __init__(self, output_file_path: Path, header_row: Optional[Sequence[str]] = None, max_bytes: int = 0,
+                 max_rows: int = 0, repeat_header: bool = True, writer_threads: int = 1,
+                 compression_level: Optional[int] = None):
+        self.output_file_path = output_file_path
+        self.header_row = header_row
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.repeat_header = repeat_header
+        self.writer_threads = writer_threads
+        self.compression_level = compression_level
+        self.part_paths = []  # type: List[Path]
+        self.closing_parts = deque()
+        self.part = None
+        self.block = io.StringIO()
+        self.part_rows = 0
+        self.part_bytes = 0
+        self.closed = False
+
+    def __enter__(self) -> "RotatingOutput":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def write(self, row_text: str) -> int:
+        if self.part is None or self.part_is_full():
+            self.start_part()
+        self.block.write(row_text)
+        self.part_rows += 1
+        self.part_bytes += len(row_text)
+        if self.block.tell() >= PART_BLOCK_SIZE:
+            self.flush_block()
+        return len(row_text)
+
+    def part_is_full(self) -> bool:
+        return ((self.max_rows > 0 and self.part_rows >= self.max_rows) or
+                (self.max_bytes > 0 and self.part_bytes >= self.max_bytes))
+
+    def start_part(self) -> None:
+        if self.part is not None:
+            self.finish_part()
+        part_path = part_output_path(self.output_file_path, len(self.part_paths) + 1)
+        self.part = PartFile(part_path, self.compression_level, threaded=self.writer_threads > 1)
+        self.part_paths.append(part_path)
+        self.part_rows = 0
+        self.part_bytes = 0
+        if self.header_row and (self.repeat_header or len(self.part_paths) == 1):
+            writer(self.block).writerow(self.header_row)
+
+    def finish_part(self) -> None:
+        self.flush_block()
+        # The finished part's thread keeps writing in the background.  Only the oldest is waited for, and only once
+        # every writer thread is busy.
+        self.closing_parts.append(self.part)
+        self.part = None
+        while len(self.closing_parts) >= self.writer_threads:
+            self.closing_parts.popleft().close()
+
+    def flush_block(self) -> None:
+        if self.block.tell():
+            self.part.write(self.block.getvalue())
+            self.block = io.StringIO()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        # Without any rows there is still one part, so a merge always leaves an output behind.
+        if self.part is None and not self.part_paths:
+            self.start_part()
+        if self.part is not None:
+            self.flush_block()
+            self.closing_parts.append(self.part)
+            self.part = None
+        while self.closing_parts:
+            self.closing_parts.popleft().close()
+        logger.info(f"Wrote {len(self.part_paths)} part files")
@@ -0,0 +1,135 @@
+import logging
+import re
+from csv import reader
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from csvlog.projection import match_columns
+from csvlog.sorted_merge import resolve_key_columns
+
+logger = logging.getLogger(__name__)
+
+Row = Sequence[str]
+FieldTest = Callable[[str], bool]
+RowPredicate = Callable[[Row], bool]
+# Conditions are COLUMN=VALUE, COLUMN^=PREFIX or COLUMN~=REGEX.  The first = in the condition is the operator.
+CONDITION_PATTERN = re.compile(r"(?P<column>[^=]*?)(?P<operator>\^=|~=|=)(?P<value>.*)", re.DOTALL)
+# An equals condition matches any of several values separated by this.
+VALUE_SEPARATOR = "|"
+
+
+def parse_condition(condition: str) -> Tuple[str, str, str]:
+    match = CONDITION_PATTERN.fullmatch(condition)
+    if match is None or not match.group("column"):
+        raise ValueError(f"{condition!r} is not a filter condition.  Use COLUMN=VALUE, COLUMN=VALUE|VALUE, "
+                         f"COLUMN^=PREFIX or COLUMN~=REGEX.")
+    return match.group("column"), match.group("operator"), match.group("value")
+
+
+def make_field_test(operator: str, value: str) -> FieldTest:
+    if operator == "^=":
+        return lambda field: field.startswith(value)
+    if operator == "~=":
+        try:
+            return re.compile(value).search
+        except re.error as e:
+            raise ValueError(f"{value!r} is not a valid regular expression: {e}")
+    values = frozenset(value.split(VALUE_SEPARATOR))
+    return values.__contains__
+
+
+class RowFilter:
+    # Keeps only rows that meet every condition.  Columns are named by their header or given as zero based column
+    # numbers, both resolved against the configured header.  Files with a header variant are matched to it by column
+    # name, and columns they don't have count as empty.
+    # The conditions are compiled once per distinct header.  Lines with no quotes in them split on commas exactly like
+    # the csv module would split them, so they are tested before they are parsed and rejected lines are never parsed.
+    def __init__(self, conditions: Sequence[str], header_row: Optional[Sequence[str]] = None):
+        self.header_row = list(header_row) if header_row else None
+        parsed_conditions = [parse_condition(condition) for condition in conditions]
+        self.column_indexes = resolve_key_columns([column for column, _, _ in parsed_conditions], self.header_row)
+        self.field_tests = [make_field_test(operator, value) for _, operator, value in parsed_conditions]
+        self.predicates = {}  # type: Dict[Optional[Tuple[str, ...]], Tuple[RowPredicate, int]]
+
+    def predicate(self, header: Optional[Sequence[str]] = None) -> Tuple[RowPredicate, int]:
+        # Returns the predicate for rows of files with this header, and how many fields of a row it looks at.
+        key = tuple(header) if header is not None else None
+        try:
+            return self.predicates[key]
+        except KeyError:
+            pass
+        column_indexes = self.column_indexes
+        if header is not None and self.header_row is not None and list(header) != self.header_row:
+            positions = match_columns(self.header_row, header)
+            column_indexes = tuple(positions[index] if index < len(positions) else None for index in column_indexes)
+        predicate = make_row_predicate(list(zip(column_indexes, self.field_tests)))
+        fields_needed = max((index + 1 for index in column_indexes if index is not None), default=0)
+        self.predicates[key] = predicate, fields_needed
+        return predicate, fields_needed
+
+    def reader(self, input_file: TextIO, has_header: bool = True) -> "FilteredReader":
+        return FilteredReader(input_file, self, has_header)
+
+
+def make_row_predicate(conditions: List[Tuple[Optional[int], FieldTest]]) -> RowPredicate:
+    # Fields past the end of a row, or in columns the file doesn't have, are empty.
+    def predicate(row: Row) -> bool:
+        row_length = len(row)
+        for column_index, field_test in conditions:
+            field = row[column_index] if column_index is not None and column_index < row_length else ""
+            if not field_test(field):
+                return False
+        return True
+
+    return predicate
+
+
+class FilteredReader:
+    # A csv.reader over input_file that only yields rows the filter keeps.  The header row, when there is one, is
+    # yielded as it is and decides how the conditions are compiled.  line_num counts every line read, including those
+    # that were rejected without being parsed.
+    def __init__(self, input_file: TextIO, row_filter: RowFilter, has_header: bool = True):
+        self.row_filter = row_filter
+        self.line_predicate = None  # type: Optional[RowPredicate]
+        self.fields_needed = 0
+        self.skipped_lines = 0
+        self.rows = reader(self.lines(input_file))
+        self.filtered_rows = None  # type: Optional[Iterator[Row]]
+        if not has_header:
+            self.compile(None)
+
+    @property
+    def line_num(self) -> int:
+        return self.rows.line_num + self.skipped_lines
+
+    def compile(self, header: Optional[Row]) -> None:
+        predicate, self.fields_needed = self.row_filter.predicate(header)
+        self.line_predicate = predicate
+        self.filtered_rows = filter(predicate, self.rows)
+
+    def __iter__(self) -> Iterator[Row]:
+        # After the header the rows come straight from filter, without a Python call per row in between.
+        return self if self.filtered_rows is None else self.filtered_rows
+
+    def __next__(self) -> Row:
+        if self.filtered_rows is None:
+            header = next(self.rows)
+            self.compile(header)
+            return header
+        return next(self.filtered_rows)
+
+    def lines(self, input_file: TextIO) -> Iterator[str]:
+        # A line with an odd number of quotes starts or ends a quoted field that spans lines.  Lines inside one are
+        # passed on untouched.
+        in_quoted_field = False
+        for line in input_file:
+            if '"' in line:
+                if line.count('"') % 2:
+                    in_quoted_field = not in_quoted_field
+                yield line
+            elif in_quoted_field or self.line_predicate is None:
+                yield line
+            # Only the fields the conditions look at are split off, the rest of the line stays in one piece.
+            elif self.line_predicate(line.rstrip("\r\n").split(",", self.fields_needed)):
+                yield line
+            else:
+                self.skipped_lines += 1
@@ -0,0 +1,71 @@
+import logging
+from contextlib import ExitStack
+from csv import reader, writer
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Mapping, Optional, Sequence, Tuple
+
+from csvlog.compression import name_with_suffix, open_input_file, open_output_file
+
+if TYPE_CHECKING:
+    from csvlog.dedup import RecordDeduplicator
+
+logger = logging.getLogger(__name__)
+
+SectionHeaders = Mapping[str, Sequence[str]]
+
+
+def section_output_path(output_file_path: Path, section_name: str) -> Path:
+    return name_with_suffix(output_file_path, f"_{section_name}")
+
+
+def section_log_file_combiner(output_file_path: Path, section_headers: SectionHeaders, append: bool = False,
+                              compression_level: Optional[int] = None,
+                              deduplicator: Optional["RecordDeduplicator"] = None) -> Callable[[Iterator[Path]],
+                                                                                                Iterator[Path]]:
+    # Splits files made of several sections, each starting with its own header row, into one output per section in a
+    # single read.  A row that equals one of the known section headers starts that section, and every row after it
+    # goes to that section's output until the next known header.  A file is only merged if its first row is a known
+    # section header.
+    header_lookup = {tuple(header): name for name, header in section_headers.items()}
+    # Comparing whole rows against every header would cost a tuple per row.  Checking the first field rules out
+    # nearly every data row for the price of a set lookup.
+    header_first_fields = {header[0] for header in section_headers.values() if header}
+    output_paths = {name: section_output_path(output_file_path, name) for name in section_headers}
+    for name, header in section_headers.items():
+        output_path = output_paths[name]
+        output_is_empty = not (append and output_path.exists() and output_path.stat().st_size > 0)
+        with open_output_file(output_path, "a" if append else "w", compression_level) as output_file:
+            if output_is_empty:
+                writer(output_file).writerow(header)
+
+    def section_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
+        with ExitStack() as stack:
+            section_writers = {name: writer(stack.enter_context(open_output_file(output_path, "a", compression_level)))
+                               for name, output_path in output_paths.items()}
+            for input_file_path in input_file_paths:
+                with open_input_file(input_file_path) as input_file:
+                    was_merged = route_sections(input_file, header_lookup, header_first_fields, section_writers,
+                                                deduplicator)
+                if was_merged:
+                    yield input_file_path
+
+    return section_combiner_closure
+
+
+def route_sections(input_file, header_lookup: Dict[Tuple[str, ...], str], header_first_fields: set,
+                   section_writers: Dict[str, writer], deduplicator: Optional["RecordDeduplicator"] = None) -> bool:
+    log_reader = reader(input_file)
+    first_row = next(log_reader, None)
+    section_name = header_lookup.get(tuple(first_row)) if first_row is not None else None
+    if section_name is None:
+        return False
+    section_writer = section_writers[section_name]
+    for row in log_reader:
+        if row and row[0] in header_first_fields:
+            next_section_name = header_lookup.get(tuple(row))
+            if next_section_name is not None:
+                section_writer = section_writers[next_section_name]
+                continue
+        if deduplicator is None or deduplicator.is_new(row):
+            section_writer.writerow(row)
+    return True
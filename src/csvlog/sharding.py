@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import re
+from pathlib import Path, PurePath
+from typing import Iterator, List, Sequence, Tuple
+
+from csvlog.compression import name_with_suffix, open_input_file, open_output_file
+
+logger = logging.getLogger(__name__)
+
+# The merge names each shard's output after its shard, and the concatenation finds the shards by these names.
+SHARD_NAME_PATTERN = re.compile(r"_shard(?P<shard>\d+)of(?P<shard_count>\d+)")
+# Hashes are taken over this many bytes of a blake2b digest, which spreads paths evenly over any sensible shard count.
+SHARD_DIGEST_SIZE = 8
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    # Shards are written K/N and numbered from 1, so a merge split over four hosts runs 1/4, 2/4, 3/4 and 4/4.
+    shard, separator, shard_count = spec.partition("/")
+    try:
+        shard, shard_count = int(shard), int(shard_count)
+    except ValueError:
+        raise ValueError(f"{spec!r} is not a shard.  Use K/N, for example 2/4.")
+    if not separator or shard_count < 1 or not 1 <= shard <= shard_count:
+        raise ValueError(f"{spec!r} is not a shard.  Use K/N with K from 1 to N, for example 2/4.")
+    return shard, shard_count
+
+
+def shard_of(relative_path: PurePath, shard_count: int) -> int:
+    # The hash only depends on the path below the input directory, written with forward slashes, so every host agrees
+    # on it wherever it mounts the share.  Names that aren't valid in the filesystem encoding hash as their raw bytes.
+    name = relative_path.as_posix().encode("utf-8", errors="surrogateescape")
+    digest = hashlib.blake2b(name, digest_size=SHARD_DIGEST_SIZE).digest()
+    return int.from_bytes(digest, "big") % shard_count + 1
+
+
+def shard_file_paths(file_paths: Iterator[Path], search_directory: Path, shard: int,
+                     shard_count: int) -> Iterator[Path]:
+    # Keeps the paths that belong to this shard.  Every path belongs to exactly one of the shard_count shards.
+    if shard_count <= 1:
+        yield from file_paths
+        return
+    for file_path in file_paths:
+        if shard_of(file_path.relative_to(search_directory), shard_count) == shard:
+            yield file_path
+
+
+def shard_output_path(output_file_path: Path, shard: int, shard_count: int) -> Path:
+    # merged.csv becomes merged_shard2of4.csv.
+    return name_with_suffix(output_file_path, f"_shard{shard}of{shard_count}")
+
+
+def ordered_shard_paths(shard_paths: Sequence[Path]) -> List[Path]:
+    # Puts shard outputs in shard order.  Every shard of a split has to be there, once, or the result would quietly be
+    # missing rows.
+    numbered_paths = []
+    shard_counts = set()
+    for shard_path in shard_paths:
+        match = SHARD_NAME_PATTERN.search(shard_path.name)
+        if match is None:
+            raise ValueError(f"{shard_path} is not named like a shard output, NAME_shardKofN.csv.")
+        numbered_paths.append((int(match.group("shard")), shard_path))
+        shard_counts.add(int(match.group("shard_count")))
+    if len(shard_counts) > 1:
+        raise ValueError(f"The shard outputs come from splits into different numbers of shards, "
+                         f"{sorted(shard_counts)}.")
+    numbered_paths.sort()
+    shard_numbers = [shard for shard, _ in numbered_paths]
+    if shard_counts and shard_numbers != list(range(1, shard_counts.pop() + 1)):
+        raise ValueError(f"The shard outputs are shards {shard_numbers}, each shard must be given exactly once.")
+    return [shard_path for _, shard_path in numbered_paths]
+
+
+def concatenate_shards(output_file_path: Path, shard_paths: Sequence[Path], has_header: bool = True) -> int:
+    # Writes the shard outputs one after another, in shard order, into a new output.  The header of the first shard is
+    # kept and every other shard must start with the same one, which is dropped.  Rows are copied as bytes, see
+    # log_bytes_combiner, and files are compressed or not according to their names.  Returns the number of shards.
+    # Imported here because csv_merge imports this module.
+    from csvlog.csv_merge import log_bytes_combiner, parse_header_line
+
+    ordered_paths = ordered_shard_paths(shard_paths)
+    if output_file_path.exists():
+        raise FileExistsError(f"The file {output_file_path} already exists and will not be overwritten.")
+    header_line = b""
+    if has_header and ordered_paths:
+        with open_input_file(ordered_paths[0], binary=True) as first_shard:
+            header_line = first_shard.readline()
+    header_row = parse_header_line(header_line) if header_line else None
+    with open_output_file(output_file_path, "wb") as output_file:
+        output_file.write(header_line)
+        for shard_path in ordered_paths:
+            with open_input_file(shard_path, binary=True) as shard_file:
+                if not log_bytes_combiner(output_file, shard_file, header_row):
+                    raise ValueError(f"{shard_path} doesn't start with the header of {ordered_paths[0]}.")
+            logger.info(f"Added {shard_path} to {output_file_path}")
+    return len(ordered_paths)
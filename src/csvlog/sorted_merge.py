@@ -0,0 +1,141 @@
+import heapq
+import logging
+import shutil
+import tempfile
+from contextlib import ExitStack
+from csv import reader, writer
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from csvlog.compression import open_input_file, open_output_file
+from csvlog.defaults import DEFAULT_SORT_MEMORY
+
+if TYPE_CHECKING:
+    from csvlog.dedup import RecordDeduplicator
+
+logger = logging.getLogger(__name__)
+
+# The most sorted runs that are merged at once.  More runs than this are merged in several passes so the process
+# doesn't run out of file descriptors.
+MAX_MERGE_FAN_IN = 128
+# Rough per-row and per-field costs of holding a parsed row in memory, beyond the characters themselves.
+ROW_OVERHEAD_BYTES = 120
+FIELD_OVERHEAD_BYTES = 50
+
+SortKey = Callable[[Sequence[str]], Tuple[str, ...]]
+
+
+def resolve_key_columns(key_columns: Sequence[str], header_row: Optional[Sequence[str]] = None) -> Tuple[int, ...]:
+    # Key columns are named by their header, or given as zero based column numbers.
+    key_indexes = []
+    for key_column in key_columns:
+        if header_row and key_column in header_row:
+            key_indexes.append(list(header_row).index(key_column))
+        elif str(key_column).isdigit():
+            key_indexes.append(int(key_column))
+        else:
+            raise ValueError(f"Column {key_column!r} is not in the header {header_row}")
+    return tuple(key_indexes)
+
+
+def make_sort_key(key_indexes: Tuple[int, ...]) -> SortKey:
+    # Short rows sort as though the missing fields were empty.
+    def sort_key(row: Sequence[str]) -> Tuple[str, ...]:
+        return tuple(row[index] if index < len(row) else "" for index in key_indexes)
+
+    return sort_key
+
+
+def estimate_row_size(row: Sequence[str]) -> int:
+    return ROW_OVERHEAD_BYTES + sum(FIELD_OVERHEAD_BYTES + len(field) for field in row)
+
+
+def sorted_log_file_combiner(output_file_path: Path, header_row: Optional[Sequence[str]] = None,
+                             key_columns: Sequence[str] = (), memory_budget: int = DEFAULT_SORT_MEMORY,
+                             append: bool = False,
+                             compression_level: Optional[int] = None,
+                             deduplicator: Optional["RecordDeduplicator"] = None) -> Callable[[Iterator[Path]],
+                                                                                               Iterator[Path]]:
+    # Produces the merged output ordered by key_columns.  Every input is read and sorted first, spilling sorted runs to
+    # temporary files whenever the memory budget is reached, and the runs are then merged into the output as a stream.
+    # Rows with equal keys keep their input order.  Nothing is yielded until the output is complete, because no input
+    # can be archived before every row it holds has been written.
+    sort_key = make_sort_key(resolve_key_columns(key_columns, header_row))
+
+    def sorted_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
+        merged_file_paths = []
+        # Runs live next to the output so they are on a filesystem that is known to have room for it.
+        run_directory = Path(tempfile.mkdtemp(prefix=".logmerge-runs-", dir=str(output_file_path.parent)))
+        try:
+            run_paths = []
+            buffered_rows = []
+            buffered_bytes = 0
+            for input_file_path in input_file_paths:
+                with open_input_file(input_file_path) as input_file:
+                    log_reader = reader(input_file)
+                    if header_row and next(log_reader, None) != header_row:
+                        continue
+                    # Duplicates are dropped as rows are read, so the copy that is kept is the first in input order.
+                    rows = log_reader if deduplicator is None else deduplicator.filter_rows(log_reader)
+                    for row in rows:
+                        buffered_rows.append(row)
+                        buffered_bytes += estimate_row_size(row)
+                        if buffered_bytes >= memory_budget:
+                            run_paths.append(write_sorted_run(buffered_rows, sort_key, run_directory, len(run_paths)))
+                            buffered_rows, buffered_bytes = [], 0
+                merged_file_paths.append(input_file_path)
+            buffered_rows.sort(key=sort_key)
+            write_merged_output(output_file_path, header_row, run_paths, buffered_rows, sort_key, run_directory,
+                                append, compression_level)
+        finally:
+            shutil.rmtree(run_directory, ignore_errors=True)
+        yield from merged_file_paths
+
+    return sorted_combiner_closure
+
+
+def write_sorted_run(rows: List[Sequence[str]], sort_key: SortKey, run_directory: Path, run_number: int) -> Path:
+    rows.sort(key=sort_key)
+    run_path = Path(run_directory, f"{run_number}.run")
+    with run_path.open(mode="w", newline="", encoding="utf-8") as run_file:
+        writer(run_file).writerows(rows)
+    logger.debug(f"Spilled {len(rows)} sorted rows to {run_path}")
+    return run_path
+
+
+def merge_runs(run_paths: List[Path], sort_key: SortKey, run_directory: Path) -> List[Path]:
+    # Merges groups of runs into bigger runs until few enough remain to be opened at once.
+    pass_number = 0
+    while len(run_paths) > MAX_MERGE_FAN_IN:
+        merged_run_paths = []
+        run_path_iterator = iter(run_paths)
+        for group in iter(lambda: list(islice(run_path_iterator, MAX_MERGE_FAN_IN)), []):
+            merged_run_path = Path(run_directory, f"pass{pass_number}-{len(merged_run_paths)}.run")
+            with ExitStack() as stack, merged_run_path.open(mode="w", newline="", encoding="utf-8") as merged_file:
+                run_readers = [reader(stack.enter_context(run_path.open(newline="", encoding="utf-8")))
+                               for run_path in group]
+                writer(merged_file).writerows(heapq.merge(*run_readers, key=sort_key))
+            for run_path in group:
+                run_path.unlink()
+            merged_run_paths.append(merged_run_path)
+        run_paths = merged_run_paths
+        pass_number += 1
+    return run_paths
+
+
+def write_merged_output(output_file_path: Path, header_row: Optional[Sequence[str]], run_paths: List[Path],
+                        in_memory_rows: List[Sequence[str]], sort_key: SortKey, run_directory: Path,
+                        append: bool = False, compression_level: Optional[int] = None) -> None:
+    run_paths = merge_runs(run_paths, sort_key, run_directory)
+    output_is_empty = not (append and output_file_path.exists() and output_file_path.stat().st_size > 0)
+    with ExitStack() as stack:
+        output_file = stack.enter_context(open_output_file(output_file_path, "a" if append else "w",
+                                                           compression_level))
+        log_writer = writer(output_file)
+        if header_row and output_is_empty:
+            log_writer.writerow(header_row)
+        # The rows still in memory act as one more run.  They come last so that ties keep their input order.
+        run_readers = [reader(stack.enter_context(run_path.open(newline="", encoding="utf-8")))
+                       for run_path in run_paths]
+        log_writer.writerows(heapq.merge(*run_readers, iter(in_memory_rows), key=sort_key))
@@ -0,0 +1,114 @@
+import logging
+import sqlite3
+from csv import reader
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Sequence
+
+from csvlog.compression import open_input_file
+from csvlog.defaults import (DEFAULT_SQLITE_BATCH_SIZE, DEFAULT_SQLITE_JOURNAL_MODE, DEFAULT_SQLITE_SYNCHRONOUS,
+                             DEFAULT_SQLITE_TABLE)
+from csvlog.sorted_merge import resolve_key_columns
+
+if TYPE_CHECKING:
+    from csvlog.dedup import RecordDeduplicator
+
+logger = logging.getLogger(__name__)
+
+# Pragma values can't be passed as parameters, so they are checked against these before being put in the statement.
+SQLITE_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SQLITE_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def column_names_for_header(header_row: Sequence[str]) -> List[str]:
+    # Exported headers have blank and repeated names, which a table can't.  Blank names become column_<number> and
+    # repeats get a numbered suffix.
+    column_names = []
+    for index, name in enumerate(header_row):
+        name = name.strip() or f"column_{index}"
+        unique_name = name
+        repeat = 2
+        while unique_name.lower() in (column_name.lower() for column_name in column_names):
+            unique_name = f"{name}_{repeat}"
+            repeat += 1
+        column_names.append(unique_name)
+    return column_names
+
+
+class SQLiteSink:
+    # Loads rows into one table of a SQLite database.  Every column is TEXT, since csv fields carry no type.  Rows that
+    # are shorter than the table are padded with NULLs and longer ones are cut short.  Indexes are built by close(),
+    # after the load, because maintaining them during the inserts would cost far more.
+    def __init__(self, database_path: Path, header_row: Sequence[str], table_name: str = DEFAULT_SQLITE_TABLE,
+                 batch_size: int = DEFAULT_SQLITE_BATCH_SIZE, journal_mode: str = DEFAULT_SQLITE_JOURNAL_MODE,
+                 synchronous: str = DEFAULT_SQLITE_SYNCHRONOUS, index_columns: Sequence[str] = ()):
+        if journal_mode.upper() not in SQLITE_JOURNAL_MODES:
+            raise ValueError(f"{journal_mode} is not a SQLite journal mode")
+        if synchronous.upper() not in SQLITE_SYNCHRONOUS_MODES:
+            raise ValueError(f"{synchronous} is not a SQLite synchronous setting")
+        self.database_path = Path(database_path)
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.column_names = column_names_for_header(header_row)
+        self.index_columns = [self.column_names[index] for index in resolve_key_columns(index_columns, header_row)]
+        self.rows_loaded = 0
+        self.connection = sqlite3.connect(str(self.database_path))
+        self.connection.execute(f"PRAGMA journal_mode = {journal_mode.upper()}")
+        self.connection.execute(f"PRAGMA synchronous = {synchronous.upper()}")
+        columns = ", ".join(f"{quote_identifier(name)} TEXT" for name in self.column_names)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(table_name)} ({columns})")
+        self.connection.commit()
+        self.insert_statement = (f"INSERT INTO {quote_identifier(table_name)} VALUES "
+                                 f"({', '.join('?' for _ in self.column_names)})")
+
+    def __enter__(self) -> "SQLiteSink":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def load_rows(self, rows: Iterable[Sequence[str]]) -> None:
+        width = len(self.column_names)
+        fitted_rows = (row if len(row) == width else (list(row) + [None] * width)[:width] for row in rows)
+        for batch in iter(lambda: list(islice(fitted_rows, self.batch_size)), []):
+            with self.connection:
+                self.connection.executemany(self.insert_statement, batch)
+            self.rows_loaded += len(batch)
+
+    def close(self) -> None:
+        try:
+            for column_name in self.index_columns:
+                index_name = f"{self.table_name}_{column_name}_index"
+                logger.debug(f"Building index {index_name}")
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} ON "
+                                        f"{quote_identifier(self.table_name)} ({quote_identifier(column_name)})")
+            self.connection.commit()
+        finally:
+            self.connection.close()
+        logger.info(f"Loaded {self.rows_loaded} rows into {self.database_path}")
+
+
+def sqlite_log_file_combiner(database_path: Path, header_row: Sequence[str], table_name: str = DEFAULT_SQLITE_TABLE,
+                             batch_size: int = DEFAULT_SQLITE_BATCH_SIZE,
+                             journal_mode: str = DEFAULT_SQLITE_JOURNAL_MODE,
+                             synchronous: str = DEFAULT_SQLITE_SYNCHRONOUS, index_columns: Sequence[str] = (),
+                             deduplicator: Optional["RecordDeduplicator"] = None) -> Callable[[Iterator[Path]],
+                                                                                               Iterator[Path]]:
+    # Merges straight into a database table instead of a csv file.  The table's columns are named after header_row,
+    # which is also the header every input has to start with.
+    def sqlite_combiner_closure(input_file_paths: Iterator[Path]) -> Iterator[Path]:
+        with SQLiteSink(database_path, header_row, table_name, batch_size, journal_mode, synchronous,
+                        index_columns) as sink:
+            for input_file_path in input_file_paths:
+                with open_input_file(input_file_path) as input_file:
+                    log_reader = reader(input_file)
+                    if next(log_reader, None) != header_row:
+                        continue
+                    sink.load_rows(log_reader if deduplicator is None else deduplicator.filter_rows(log_reader))
+                yield input_file_path
+
+    return sqlite_combiner_closure
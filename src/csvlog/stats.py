@@ -0,0 +1,134 @@
+import cProfile
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class MergeStats:
+    # Collects timings and counters for one merge.  Phases can nest, for example the merge pulls file names through the
+    # header check, which pulls them from discovery.  A phase's time excludes the time of phases nested inside it, so
+    # the phase times add up to the time the merge actually spent.  Timers must only be used from one thread.
+    def __init__(self, per_file: bool = True):
+        self.per_file = per_file
+        self.phases = {}  # type: Dict[str, List[float]]
+        self.counters = Counter()
+        self.files = []  # type: List[Dict]
+        self.timer_stack = []  # type: List[List[float]]
+        self.started = time.perf_counter()
+        self.seconds = None  # type: Optional[float]
+        self.peak_memory_bytes = None  # type: Optional[int]
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        # Each frame on the stack is [start, time spent in nested phases].
+        frame = [time.perf_counter(), 0.0]
+        self.timer_stack.append(frame)
+        try:
+            yield
+        finally:
+            self.timer_stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            if self.timer_stack:
+                self.timer_stack[-1][1] += elapsed
+            totals = self.phases.setdefault(name, [0.0, 0])
+            totals[0] += elapsed - frame[1]
+            totals[1] += 1
+
+    def timed(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        # Charges the time spent producing each item to the named phase, but not the time the consumer spends on it.
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def record_file(self, path: Path, size: Optional[int], rows: Optional[int], seconds: float,
+                    merged: bool) -> None:
+        # Files the merge yields are counted as files_merged by merge_file_paths, which sees every combiner.
+        self.count("files_read" if merged else "files_rejected")
+        if size is not None:
+            self.count("bytes_read", size)
+        if rows is not None:
+            self.count("rows_read", rows)
+        if self.per_file:
+            self.files.append({"path": str(path), "bytes": size, "rows": rows, "seconds": seconds, "merged": merged})
+
+    def finish(self) -> None:
+        self.seconds = time.perf_counter() - self.started
+
+    def to_dict(self) -> Dict:
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.started
+        report = {"seconds": seconds,
+                  "phases": {name: {"seconds": totals[0], "calls": totals[1]} for name, totals in self.phases.items()},
+                  "counters": dict(self.counters)}
+        if seconds > 0 and "rows_read" in self.counters:
+            report["rows_per_second"] = self.counters["rows_read"] / seconds
+        if seconds > 0 and "bytes_read" in self.counters:
+            report["megabytes_per_second"] = self.counters["bytes_read"] / (1024 * 1024) / seconds
+        if self.peak_memory_bytes is not None:
+            report["peak_memory_bytes"] = self.peak_memory_bytes
+        if self.per_file:
+            report["files"] = self.files
+        return report
+
+    def write_json(self, destination: str) -> None:
+        # A destination of - writes the report to standard output.
+        if destination == "-":
+            json.dump(self.to_dict(), sys.stdout, indent=2)
+            sys.stdout.write("\n")
+            return
+        with Path(destination).open(mode="w") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+
+
+@contextmanager
+def profiling(profile_path: Optional[Path]) -> Iterator[None]:
+    # Runs the body under cProfile and saves the profile where pstats or snakeviz can read it.  Does nothing without a
+    # path.
+    if profile_path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(str(profile_path))
+        logger.info(f"Saved a profile of the run to {profile_path}")
+
+
+@contextmanager
+def tracing_memory(snapshot_path: Optional[Path], stats: Optional[MergeStats] = None) -> Iterator[None]:
+    # Traces allocations while the body runs and saves a tracemalloc snapshot at the end, which
+    # tracemalloc.Snapshot.load can read back.  The peak traced memory goes into stats.  Does nothing without a path.
+    if snapshot_path is None:
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak_memory_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot.dump(str(snapshot_path))
+        if stats is not None:
+            stats.peak_memory_bytes = peak_memory_bytes
+        logger.info(f"Saved a memory snapshot of the run to {snapshot_path}, peak {peak_memory_bytes} bytes")
@@ -0,0 +1,410 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from csvlog.compression import name_with_suffix
+from csvlog.csv_merge import PathType, merge_file_paths
+from csvlog.defaults import DEFAULT_INCLUDE_PATTERNS
+from csvlog.discovery import matches_patterns
+
+logger = logging.getLogger(__name__)
+
+# Constants from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 64 * 1024
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# Some filesystems only keep modification times to the nearest second or two.
+MTIME_GRANULARITY_NS = 2 * 10 ** 9
+
+# A file is reported as (path, size in bytes).  The size feeds the batch size window.
+FileArrival = Tuple[Path, int]
+
+
+class DirectoryWatcher:
+    # What both watchers share: which files and directories they look at.  Files and directories are chosen the way
+    # walk_csv_files chooses them for a one-off merge, by the include and exclude patterns matched against the name and
+    # the path relative to directory, and by max_depth for recursive watches.
+    def __init__(self, directory: Path, ignore: Optional[Path] = None, recurse: bool = False,
+                 max_depth: Optional[int] = None, include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS,
+                 exclude_patterns: Sequence[str] = ()):
+        self.directory = directory
+        self.ignored = set()  # type: Set[str]
+        if ignore is not None:
+            self.ignore_path(ignore)
+        self.recurse = recurse
+        self.max_depth = max_depth
+        self.include_patterns = include_patterns
+        self.exclude_patterns = exclude_patterns
+
+    def ignore_path(self, path: Path) -> None:
+        # Outputs are never reported, including ones that only appear once the output rolls.
+        self.ignored.add(os.path.abspath(str(path)))
+
+    def relative_path(self, path: str) -> str:
+        # Written with forward slashes, as walk_csv_files writes the paths it matches patterns against.
+        return Path(os.path.relpath(path, str(self.directory))).as_posix()
+
+    def wants_file(self, path: str) -> bool:
+        name = os.path.basename(path)
+        relative_path = self.relative_path(path)
+        return (matches_patterns(name, relative_path, self.include_patterns) and
+                not matches_patterns(name, relative_path, self.exclude_patterns) and
+                os.path.abspath(path) not in self.ignored)
+
+    def wants_directory(self, path: str) -> bool:
+        relative_path = self.relative_path(path)
+        depth = relative_path.count("/") + 1
+        return (self.recurse and (self.max_depth is None or depth <= self.max_depth) and
+                not matches_patterns(os.path.basename(path), relative_path, self.exclude_patterns))
+
+
+class PollingWatcher(DirectoryWatcher):
+    # Finds new files by rescanning the directory tree.  Directories whose modification time hasn't changed are not
+    # listed again, since adding or renaming a file always updates the directory it lands in.  A new file is only
+    # reported once its size and modification time have held still for one poll interval, so half-written files
+    # aren't merged.  Files that are rewritten in place after they settle are not noticed.
+    # Known files are kept per directory and forgotten once a listing shows they are gone, so a long-running watch
+    # only remembers the files that are still there.
+    def __init__(self, directory: Path, ignore: Optional[Path] = None, recurse: bool = False,
+                 poll_interval: float = 2.0, max_depth: Optional[int] = None,
+                 include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS, exclude_patterns: Sequence[str] = ()):
+        super().__init__(directory, ignore, recurse, max_depth, include_patterns, exclude_patterns)
+        self.poll_interval = poll_interval
+        self.directory_mtimes = {}  # type: Dict[str, Optional[int]]
+        self.subdirectories = {}  # type: Dict[str, List[str]]
+        self.known_files = {}  # type: Dict[str, Dict[str, Tuple[int, int]]]
+        self.pending_files = {}  # type: Dict[str, Tuple[int, int]]
+
+    def prime(self) -> List[FileArrival]:
+        # Records the files that are already present and returns them so the caller can merge them.
+        self.scan()
+        existing_files = [(Path(path), size) for path, (size, _) in self.pending_files.items()]
+        for path, signature in self.pending_files.items():
+            self.remember(path, signature)
+        self.pending_files.clear()
+        return existing_files
+
+    def remember(self, path: str, signature: Tuple[int, int]) -> None:
+        self.known_files.setdefault(os.path.dirname(path), {})[path] = signature
+
+    def close(self) -> None:
+        pass
+
+    def wait_for_files(self, timeout: float) -> List[FileArrival]:
+        time.sleep(max(0.0, min(timeout, self.poll_interval)))
+        settled_files = []
+        for path, signature in list(self.pending_files.items()):
+            try:
+                stat_result = os.stat(path)
+            except FileNotFoundError:
+                del self.pending_files[path]
+                continue
+            current_signature = (stat_result.st_size, stat_result.st_mtime_ns)
+            if current_signature == signature:
+                settled_files.append((Path(path), stat_result.st_size))
+                self.remember(path, current_signature)
+                del self.pending_files[path]
+            else:
+                self.pending_files[path] = current_signature
+        self.scan()
+        return settled_files
+
+    def scan(self) -> None:
+        directories = [str(self.directory)]
+        while directories:
+            directory = directories.pop()
+            try:
+                directory_mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                self.forget_directory(directory)
+                continue
+            if self.directory_mtimes.get(directory) != directory_mtime:
+                subdirectories = self.list_directory(directory)
+                # Subdirectories that were removed are never visited again, so what was known about them goes now.
+                for removed_directory in set(self.subdirectories.get(directory, ())) - set(subdirectories):
+                    self.forget_directory(removed_directory)
+                self.subdirectories[directory] = subdirectories
+                # Coarse filesystem timestamps can hide a change made in the same tick as the listing.  A directory
+                # that changed very recently isn't trusted yet and is listed again on the next poll.
+                recently_modified = time.time() * 1e9 - directory_mtime < MTIME_GRANULARITY_NS
+                self.directory_mtimes[directory] = None if recently_modified else directory_mtime
+            if self.recurse:
+                directories.extend(self.subdirectories[directory])
+
+    def forget_directory(self, directory: str) -> None:
+        self.directory_mtimes.pop(directory, None)
+        self.known_files.pop(directory, None)
+        for subdirectory in self.subdirectories.pop(directory, ()):
+            self.forget_directory(subdirectory)
+
+    def list_directory(self, directory: str) -> List[str]:
+        subdirectories = []
+        known_files = self.known_files.pop(directory, {})
+        # Only the files this listing still finds stay known.
+        still_known_files = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if self.wants_directory(entry.path):
+                        subdirectories.append(entry.path)
+                elif entry.is_file() and self.wants_file(entry.path):
+                    stat_result = entry.stat()
+                    signature = (stat_result.st_size, stat_result.st_mtime_ns)
+                    known_signature = known_files.get(entry.path)
+                    if known_signature is not None:
+                        still_known_files[entry.path] = known_signature
+                    if known_signature != signature and entry.path not in self.pending_files:
+                        self.pending_files[entry.path] = signature
+        if still_known_files:
+            self.known_files[directory] = still_known_files
+        return subdirectories
+
+
+class InotifyWatcher(DirectoryWatcher):
+    # Finds new files through Linux inotify events.  A file is reported when it is closed after writing or moved into a
+    # watched directory, which means it is complete.  Watches are added for new subdirectories as they appear.
+    def __init__(self, directory: Path, ignore: Optional[Path] = None, recurse: bool = False,
+                 max_depth: Optional[int] = None, include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS,
+                 exclude_patterns: Sequence[str] = ()):
+        super().__init__(directory, ignore, recurse, max_depth, include_patterns, exclude_patterns)
+        self.libc = load_inotify_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watch_descriptors = {}  # type: Dict[int, str]
+        try:
+            self.add_watches(str(directory))
+        except OSError:
+            self.close()
+            raise
+
+    def add_watches(self, directory: str) -> None:
+        directories = [directory]
+        while directories:
+            current_directory = directories.pop()
+            watch_descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(current_directory), WATCH_MASK)
+            if watch_descriptor < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {current_directory}")
+            self.watch_descriptors[watch_descriptor] = current_directory
+            if self.recurse:
+                with os.scandir(current_directory) as entries:
+                    directories.extend(entry.path for entry in entries if
+                                       entry.is_dir(follow_symlinks=False) and self.wants_directory(entry.path))
+
+    def prime(self) -> List[FileArrival]:
+        # Watches are in place before this scan, so a file that arrives during it is reported at least once.
+        return self.scan_directory(str(self.directory))
+
+    def scan_directory(self, directory: str) -> List[FileArrival]:
+        arrived_files = []
+        directories = [directory]
+        while directories:
+            with os.scandir(directories.pop()) as entries:
+                for entry in sorted(entries, key=lambda directory_entry: directory_entry.name):
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.wants_directory(entry.path):
+                            directories.append(entry.path)
+                    elif entry.is_file() and self.wants_file(entry.path):
+                        arrived_files.append((Path(entry.path), entry.stat().st_size))
+        return arrived_files
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def wait_for_files(self, timeout: float) -> List[FileArrival]:
+        readable, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not readable:
+            return []
+        arrived_files = []
+        buffer = os.read(self.fd, INOTIFY_READ_SIZE)
+        offset = 0
+        while offset < len(buffer):
+            watch_descriptor, mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + name_length].rstrip(b"\0"))
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so the only safe thing to do is look at everything again.
+                logger.warning("inotify event queue overflowed, rescanning the input directory")
+                arrived_files.extend(self.prime())
+                continue
+            if mask & IN_IGNORED:
+                self.watch_descriptors.pop(watch_descriptor, None)
+                continue
+            directory = self.watch_descriptors.get(watch_descriptor)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.wants_directory(path):
+                    # Files can land in a new directory before its watch exists, so it is scanned once by hand.
+                    self.add_watches(path)
+                    arrived_files.extend(self.scan_directory(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and self.wants_file(path):
+                try:
+                    arrived_files.append((Path(path), os.stat(path).st_size))
+                except FileNotFoundError:
+                    pass
+        return arrived_files
+
+
+def load_inotify_libc() -> ctypes.CDLL:
+    library_name = ctypes.util.find_library("c")
+    if library_name is None:
+        raise OSError("Cannot find the C library")
+    libc = ctypes.CDLL(library_name, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify is not available on this platform")
+    return libc
+
+
+def create_watcher(directory: Path, ignore: Optional[Path] = None, recurse: bool = False,
+                   poll_interval: float = 2.0, use_inotify: bool = True, max_depth: Optional[int] = None,
+                   include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS,
+                   exclude_patterns: Sequence[str] = ()) -> DirectoryWatcher:
+    if use_inotify:
+        try:
+            return InotifyWatcher(directory, ignore, recurse, max_depth, include_patterns, exclude_patterns)
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify is unavailable, falling back to polling: {e}")
+    return PollingWatcher(directory, ignore, recurse, poll_interval, max_depth, include_patterns, exclude_patterns)
+
+
+class BatchCollector:
+    # Groups arriving files into batches.  A batch is ready when its oldest file has waited max_seconds, or when it
+    # holds max_files files or max_bytes bytes, whichever comes first.
+    def __init__(self, max_seconds: float = 10.0, max_files: int = 1000, max_bytes: int = 256 * 1024 * 1024):
+        self.max_seconds = max_seconds
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.file_paths = {}  # type: Dict[Path, None]
+        self.total_bytes = 0
+        self.opened_at = None  # type: Optional[float]
+
+    def add(self, file_path: Path, size: int, now: Optional[float] = None) -> None:
+        if file_path in self.file_paths:
+            return
+        if self.opened_at is None:
+            self.opened_at = now if now is not None else time.monotonic()
+        self.file_paths[file_path] = None
+        self.total_bytes += size
+
+    def is_ready(self, now: Optional[float] = None) -> bool:
+        if not self.file_paths:
+            return False
+        now = now if now is not None else time.monotonic()
+        return (len(self.file_paths) >= self.max_files or self.total_bytes >= self.max_bytes or
+                now - self.opened_at >= self.max_seconds)
+
+    def time_until_ready(self, now: Optional[float] = None) -> Optional[float]:
+        if not self.file_paths:
+            return None
+        now = now if now is not None else time.monotonic()
+        return max(0.0, self.opened_at + self.max_seconds - now)
+
+    def take(self) -> List[Path]:
+        batch = list(self.file_paths)
+        self.file_paths = {}
+        self.total_bytes = 0
+        self.opened_at = None
+        return batch
+
+
+def rolled_output_path(output_file_path: Path, date_format_string: str = '%y%m%d%H%M%S') -> Path:
+    # The time goes before the extension and any compression suffix, merged.csv.gz becomes merged_<time>.csv.gz.  A
+    # second roll within the same second is numbered rather than written over the first.
+    timestamp = datetime.now().strftime(date_format_string)
+    rolled_path = name_with_suffix(output_file_path, f"_{timestamp}")
+    number = 0
+    while rolled_path.exists():
+        number += 1
+        rolled_path = name_with_suffix(output_file_path, f"_{timestamp}_{number}")
+    return rolled_path
+
+
+def watch_and_merge(search_directory: PathType, output_file_path: PathType, recurse: bool = False,
+                    header_row: Optional[Sequence[str]] = None, archive_directory: Optional[PathType] = None,
+                    passthrough: bool = False, poll_interval: float = 2.0, batch_seconds: float = 10.0,
+                    batch_max_files: int = 1000, batch_max_bytes: int = 256 * 1024 * 1024,
+                    roll_seconds: float = 3600.0, use_inotify: bool = True,
+                    stop_event: Optional[threading.Event] = None, max_depth: Optional[int] = None,
+                    include_patterns: Sequence[str] = DEFAULT_INCLUDE_PATTERNS, exclude_patterns: Sequence[str] = (),
+                    jobs: int = 1, compression_level: Optional[int] = None) -> None:
+    # Files are chosen like a one-off merge chooses them, see DirectoryWatcher, and each batch is merged by
+    # merge_file_paths with the given jobs and compression level.
+    search_directory = Path(search_directory)
+    output_file_path = Path(output_file_path)
+    archive_directory = Path(archive_directory) if archive_directory is not None else None
+    stop_event = stop_event if stop_event is not None else threading.Event()
+    watcher = create_watcher(search_directory, output_file_path, recurse, poll_interval, use_inotify, max_depth,
+                             include_patterns, exclude_patterns)
+    batch = BatchCollector(batch_seconds, batch_max_files, batch_max_bytes)
+    # When files are not archived they stay where they are, so this remembers what has already been merged.
+    merged_signatures = {}  # type: Dict[Path, Tuple[int, int]]
+    current_output_path = output_file_path
+    output_opened_at = time.monotonic()
+    logger.info(f"Watching {search_directory} for new log files")
+
+    def merge_batch(file_paths: List[Path]) -> None:
+        nonlocal current_output_path, output_opened_at
+        if time.monotonic() - output_opened_at >= roll_seconds and current_output_path.exists():
+            current_output_path = rolled_output_path(output_file_path)
+            output_opened_at = time.monotonic()
+            # The new output may be inside the watched directory too, it must never be merged into itself.
+            watcher.ignore_path(current_output_path)
+        output_path = os.path.abspath(str(current_output_path))
+        signatures = {}
+        for file_path in file_paths:
+            if os.path.abspath(str(file_path)) == output_path:
+                continue
+            try:
+                stat_result = file_path.stat()
+            except FileNotFoundError:
+                continue
+            signature = (stat_result.st_size, stat_result.st_mtime_ns)
+            if merged_signatures.get(file_path) != signature:
+                signatures[file_path] = signature
+        if not signatures:
+            return
+        merged_file_paths = []  # type: List[Path]
+        merge_file_paths(iter(signatures), search_directory, current_output_path, header_row, archive_directory,
+                         passthrough, append=True, jobs=jobs, compression_level=compression_level,
+                         on_merged=merged_file_paths.append)
+        logger.info(f"Merged {len(merged_file_paths)} of {len(signatures)} new files into {current_output_path}")
+        if archive_directory is None:
+            merged_signatures.update((file_path, signatures[file_path]) for file_path in merged_file_paths)
+
+    try:
+        for file_path, size in watcher.prime():
+            batch.add(file_path, size)
+        while not stop_event.is_set():
+            if batch.is_ready():
+                merge_batch(batch.take())
+            wait_time = batch.time_until_ready()
+            for file_path, size in watcher.wait_for_files(poll_interval if wait_time is None else wait_time):
+                batch.add(file_path, size)
+    except KeyboardInterrupt:
+        logger.info("Stopping, merging the files that have already arrived")
+    finally:
+        watcher.close()
+    if batch.file_paths:
+        merge_batch(batch.take())
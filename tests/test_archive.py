@@ -0,0 +1,184 @@
+import errno
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from csvlog import archive
+from csvlog.archive import (Archiver, find_archive_journals, lock_journal, move_file, recover_archive_journal,
+                            recover_archive_journals, run_journal_path)
+
+needs_locks = pytest.mark.skipif(archive.fcntl is None, reason="journals can't be locked on this platform")
+
+
+class TestMoveFile:
+    def test_move(self, archive_test_directory):
+        source = Path(archive_test_directory, "input", "one.csv")
+        destination = Path(archive_test_directory, "archive", "nested", "one.csv")
+        move_file(source, destination)
+        assert not source.exists()
+        assert destination.read_text() == "one\n"
+
+    def test_destination_exists(self, archive_test_directory):
+        source = Path(archive_test_directory, "input", "one.csv")
+        destination = Path(archive_test_directory, "archive", "one.csv")
+        destination.parent.mkdir()
+        destination.write_text("other\n")
+        with pytest.raises(FileExistsError):
+            move_file(source, destination)
+        assert source.exists()
+
+    def test_cross_device(self, archive_test_directory, monkeypatch):
+        original_replace = os.replace
+
+        def replace_within_device(source, destination):
+            # Renaming the finished copy into place stays on one device, the move itself doesn't.
+            if not source.endswith(archive.PARTIAL_SUFFIX):
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            original_replace(source, destination)
+
+        monkeypatch.setattr(archive.os, "replace", replace_within_device)
+        source = Path(archive_test_directory, "input", "one.csv")
+        destination = Path(archive_test_directory, "archive", "one.csv")
+        move_file(source, destination)
+        assert not source.exists()
+        assert destination.read_text() == "one\n"
+        assert not Path(archive_test_directory, "archive", "one.csv" + archive.PARTIAL_SUFFIX).exists()
+
+    def test_created_directories_are_cached(self, archive_test_directory):
+        created_directories = {Path(archive_test_directory, "missing")}
+        with pytest.raises(FileNotFoundError):
+            move_file(Path(archive_test_directory, "input", "one.csv"),
+                      Path(archive_test_directory, "missing", "one.csv"), created_directories)
+
+
+class TestArchiver:
+    def test_archive(self, archive_test_directory, monkeypatch):
+        monkeypatch.setattr(archive, "ARCHIVE_BATCH_SIZE", 2)
+        journal_path = Path(archive_test_directory, "journal.jsonl")
+        input_directory = Path(archive_test_directory, "input")
+        with Archiver(input_directory, Path(archive_test_directory, "archive"), threads=3,
+                      journal_path=journal_path) as archiver:
+            for file_path in sorted(input_directory.rglob("*.csv")):
+                archiver.archive(file_path)
+        assert archiver.moved == 5
+        assert sorted(path.relative_to(archive_test_directory).as_posix()
+                      for path in Path(archive_test_directory, "archive").rglob("*.csv")) == [
+                   "archive/five.csv", "archive/four.csv", "archive/one.csv", "archive/sub/three.csv",
+                   "archive/sub/two.csv"]
+        assert not journal_path.exists()
+
+    def test_failed_move_keeps_journal(self, archive_test_directory):
+        journal_path = Path(archive_test_directory, "journal.jsonl")
+        Path(archive_test_directory, "archive").mkdir()
+        Path(archive_test_directory, "archive", "one.csv").write_text("other\n")
+        archiver = Archiver(Path(archive_test_directory, "input"), Path(archive_test_directory, "archive"),
+                            journal_path=journal_path)
+        archiver.archive(Path(archive_test_directory, "input", "one.csv"))
+        with pytest.raises(FileExistsError):
+            archiver.close()
+        assert journal_path.exists()
+
+    @needs_locks
+    def test_journal_is_locked_while_open(self, archive_test_directory):
+        journal_path = Path(archive_test_directory, "journal.jsonl")
+        with Archiver(Path(archive_test_directory, "input"), Path(archive_test_directory, "archive"),
+                      journal_path=journal_path) as archiver:
+            archiver.archive(Path(archive_test_directory, "input", "one.csv"))
+            archiver.start_pending_moves()
+            assert recover_archive_journal(journal_path, "rollback") == 0
+            assert journal_path.exists()
+        assert Path(archive_test_directory, "archive", "one.csv").exists()
+        assert not journal_path.exists()
+        # Only the journal is left in the directory, not the name it was created under.
+        assert sorted(path.name for path in archive_test_directory.iterdir()) == ["archive", "input"]
+
+
+class TestRecoverArchiveJournal:
+    def test_finish(self, interrupted_archive):
+        directory, journal_path = interrupted_archive
+        assert recover_archive_journal(journal_path, "finish") == 2
+        assert sorted(path.name for path in Path(directory, "archive").iterdir()) == ["four.csv", "one.csv",
+                                                                                     "two.csv"]
+        assert not Path(directory, "input", "two.csv").exists()
+        assert Path(directory, "input", "five.csv").exists()
+        assert not journal_path.exists()
+
+    def test_rollback(self, interrupted_archive):
+        directory, journal_path = interrupted_archive
+        assert recover_archive_journal(journal_path, "rollback") == 2
+        assert list(Path(directory, "archive").iterdir()) == []
+        assert sorted(path.name for path in Path(directory, "input").glob("*.csv")) == [
+            "five.csv", "four.csv", "one.csv", "two.csv"]
+        assert not journal_path.exists()
+
+    def test_differing_files_are_left_alone(self, interrupted_archive):
+        directory, journal_path = interrupted_archive
+        Path(directory, "archive", "two.csv").write_text("changed\n")
+        recover_archive_journal(journal_path, "finish")
+        assert Path(directory, "input", "two.csv").exists()
+        assert Path(directory, "archive", "two.csv").read_text() == "changed\n"
+
+    @needs_locks
+    def test_locked_journal_is_left_alone(self, interrupted_archive):
+        directory, journal_path = interrupted_archive
+        with journal_path.open() as journal:
+            assert lock_journal(journal)
+            assert recover_archive_journal(journal_path, "finish") == 0
+        assert journal_path.exists()
+        assert Path(directory, "input", "four.csv").exists()
+
+    def test_every_run_journal(self, interrupted_archive):
+        directory, journal_path = interrupted_archive
+        run_path = run_journal_path(journal_path)
+        journal_path.replace(run_path)
+        Path(directory, "journal.jsonl.old").mkdir()
+        Path(directory, "journal.jsonlx").touch()
+        assert find_archive_journals(journal_path) == [run_path]
+        assert recover_archive_journals(journal_path, "finish") == 2
+        assert find_archive_journals(journal_path) == []
+        assert Path(directory, "journal.jsonlx").exists()
+
+    def test_missing_journal(self, archive_test_directory):
+        assert recover_archive_journal(Path(archive_test_directory, "journal.jsonl")) == 0
+
+    def test_bad_mode(self, archive_test_directory):
+        with pytest.raises(ValueError):
+            recover_archive_journal(Path(archive_test_directory, "journal.jsonl"), "undo")
+
+
+@pytest.fixture
+def archive_test_directory(tmp_path):
+    input_directory = Path(tmp_path, "input")
+    Path(input_directory, "sub").mkdir(parents=True)
+    for name in ("one.csv", "four.csv", "five.csv", "sub/two.csv", "sub/three.csv"):
+        Path(input_directory, name).write_text(f"{Path(name).stem}\n")
+    return tmp_path
+
+
+@pytest.fixture
+def interrupted_archive(tmp_path):
+    # one.csv was moved, two.csv was copied across devices but not removed, four.csv hadn't been moved yet and a partial
+    # copy of it was left behind.  five.csv was never journaled.
+    input_directory = Path(tmp_path, "input")
+    archive_directory = Path(tmp_path, "archive")
+    input_directory.mkdir()
+    archive_directory.mkdir()
+    Path(archive_directory, "one.csv").write_text("one\n")
+    Path(input_directory, "two.csv").write_text("two\n")
+    Path(archive_directory, "two.csv").write_text("two\n")
+    Path(input_directory, "four.csv").write_text("four\n")
+    Path(archive_directory, "four.csv" + archive.PARTIAL_SUFFIX).write_text("fo")
+    Path(input_directory, "five.csv").write_text("five\n")
+    journal_path = Path(tmp_path, "journal.jsonl")
+    with journal_path.open(mode="w") as journal:
+        for name in ("one.csv", "two.csv", "four.csv"):
+            journal.write(json.dumps({"operation": "move", "source": str(Path(input_directory, name)),
+                                      "destination": str(Path(archive_directory, name))}) + "\n")
+        journal.write('{"operation": "mo')
+    return tmp_path, journal_path
+
+
+if __name__ == '__main__':
+    pytest.main()
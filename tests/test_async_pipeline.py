@@ -0,0 +1,115 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from csvlog.async_pipeline import AsyncMergePipeline
+
+
+def chunked_reader(accepted=lambda file_path: True, chunks=3):
+    def read_file(file_path):
+        if not accepted(file_path):
+            yield False
+            return
+        yield True
+        for chunk_number in range(chunks):
+            yield f"{file_path.name}:{chunk_number};"
+
+    return read_file
+
+
+class TestAsyncMergePipeline:
+    def test_order(self):
+        # Later files finish reading first, they are still written after the ones before them.
+        def read_file(file_path):
+            yield True
+            time.sleep(0.01 * (10 - int(file_path.name)))
+            yield file_path.name + ";"
+
+        written = []
+        pipeline = AsyncMergePipeline(read_file, written.append, readers=4)
+        file_paths = [Path(str(number)) for number in range(10)]
+        assert list(pipeline(file_paths)) == [(file_path, True) for file_path in file_paths]
+        assert "".join(written) == "".join(f"{number};" for number in range(10))
+
+    def test_rejected_files(self):
+        written = []
+        pipeline = AsyncMergePipeline(chunked_reader(lambda file_path: file_path.name != "b"), written.append)
+        res = list(pipeline([Path("a"), Path("b"), Path("c")]))
+        assert res == [(Path("a"), True), (Path("b"), False), (Path("c"), True)]
+        assert "".join(written) == "a:0;a:1;a:2;c:0;c:1;c:2;"
+
+    def test_no_files(self):
+        written = []
+        assert list(AsyncMergePipeline(chunked_reader(), written.append)([])) == []
+        assert written == []
+
+    def test_read_error(self):
+        def read_file(file_path):
+            if file_path.name == "b":
+                raise OSError("unreadable")
+            yield True
+            yield file_path.name
+
+        written = []
+        pipeline = AsyncMergePipeline(read_file, written.append)
+        res = []
+        with pytest.raises(OSError):
+            for item in pipeline([Path("a"), Path("b"), Path("c")]):
+                res.append(item)
+        # Files before the one that failed are written and reported, nothing after it is.
+        assert res == [(Path("a"), True)]
+        assert written == ["a"]
+
+    def test_write_error(self):
+        def write_chunk(chunk):
+            raise OSError("disk full")
+
+        with pytest.raises(OSError):
+            list(AsyncMergePipeline(chunked_reader(), write_chunk)([Path("a"), Path("b")]))
+
+    def test_input_error(self):
+        def file_paths():
+            yield Path("a")
+            raise ValueError("discovery failed")
+
+        written = []
+        with pytest.raises(ValueError):
+            list(AsyncMergePipeline(chunked_reader(), written.append)(file_paths()))
+
+    def test_early_close(self):
+        closed = []
+
+        def read_file(file_path):
+            try:
+                yield True
+                # Every file but the first one never ends.
+                while file_path.name != "a":
+                    yield "chunk"
+                yield "a"
+            finally:
+                closed.append(file_path.name)
+
+        merged = AsyncMergePipeline(read_file, lambda chunk: None, readers=2)([Path("a"), Path("b"), Path("c")])
+        assert next(merged) == (Path("a"), True)
+        merged.close()
+        # Closing stops the readers that were still going and closes their files.
+        assert "b" in closed
+
+    def test_backpressure(self):
+        produced = []
+        lags = []
+
+        def read_file(file_path):
+            yield True
+            for chunk_number in range(50):
+                produced.append(chunk_number)
+                yield chunk_number
+
+        def write_chunk(chunk):
+            time.sleep(0.001)
+            lags.append(len(produced) - chunk)
+
+        list(AsyncMergePipeline(read_file, write_chunk, readers=1, queue_depth=2)([Path("a")]))
+        # The reader is never more than the queue, the chunk waiting to go in it and the one being read ahead.
+        assert max(lags) <= 2 + 3
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import pytest
+
+from csvlog.benchmark.corpus import MATERIAL_ORDER_HEADER, SCENARIOS, CorpusShape, generate_corpus, scaled_shape
+from csvlog.benchmark.runner import PHASES, compare_results, load_results, run_benchmarks, save_results
+from csvlog.benchmark.startup import STARTUP_PHASES, run_startup_benchmark
+from csvlog.header_probe import file_has_header
+
+
+class TestCorpus:
+    def test_reproducible(self, tmp_path):
+        shape = CorpusShape(files=5, items=3, depth=2, rejected_fraction=0.5)
+        generate_corpus(Path(tmp_path, "first"), shape, seed=7)
+        generate_corpus(Path(tmp_path, "second"), shape, seed=7)
+        first_directory = Path(tmp_path, "first")
+        first_files = sorted(path.relative_to(first_directory) for path in first_directory.rglob("*.csv"))
+        assert len(first_files) == 5
+        for relative_path in first_files:
+            assert (Path(tmp_path, "first", relative_path).read_bytes() ==
+                    Path(tmp_path, "second", relative_path).read_bytes())
+
+    def test_rejected_headers(self, tmp_path):
+        generate_corpus(tmp_path, CorpusShape(files=40, items=1, rejected_fraction=0.5))
+        accepted = [file_has_header(path, MATERIAL_ORDER_HEADER) for path in Path(tmp_path).glob("*.csv")]
+        assert 0 < sum(accepted) < 40
+
+    def test_scaled_shape(self):
+        assert scaled_shape(SCENARIOS["tiny_files"], 0.5).files == SCENARIOS["tiny_files"].files // 2
+        assert scaled_shape(SCENARIOS["huge_files"], 0.5).items == SCENARIOS["huge_files"].items // 2
+
+
+class TestRunner:
+    def test_run_and_compare(self, tmp_path):
+        results = run_benchmarks(["tiny_files", "deep_tree"], scale=0.01, work_directory=tmp_path)
+        assert set(results["scenarios"]) == {"tiny_files", "deep_tree"}
+        tiny_files_result = results["scenarios"]["tiny_files"]
+        assert tiny_files_result["merged_files"] == tiny_files_result["files"] == 20
+        assert tiny_files_result["rows"] == 20 * 7
+        assert set(tiny_files_result["phases"]) == set(PHASES)
+        # Corpora are removed once they have been timed.
+        assert list(Path(tmp_path).iterdir()) == []
+
+        results_path = Path(tmp_path, "results.json")
+        save_results(results, results_path)
+        assert compare_results(load_results(results_path), results) == []
+
+    def test_regression(self):
+        baseline = {"scale": 1.0, "scenarios": {"tiny_files": {"phases": {
+            "discovery": 1.0, "header_check": 1.0, "merge": 1.0, "archive": 0.01}}}}
+        current = {"scale": 1.0, "scenarios": {"tiny_files": {"phases": {
+            "discovery": 1.05, "header_check": 0.5, "merge": 1.5, "archive": 0.5}}}}
+        regressions = compare_results(baseline, current, threshold=0.1)
+        # The archive phase was too short in the baseline to be compared.
+        assert [(regression.phase, round(regression.slowdown, 2)) for regression in regressions] == [("merge", 0.5)]
+
+    def test_startup_regression(self):
+        baseline = {"scale": 1.0, "scenarios": {}, "startup": {"interpreter": 0.01, "import": 0.05,
+                                                               "empty_run": 0.06}}
+        current = {"scale": 1.0, "scenarios": {}, "startup": {"interpreter": 0.01, "import": 0.05,
+                                                              "empty_run": 0.09}}
+        regressions = compare_results(baseline, current)
+        assert [(regression.scenario, regression.phase) for regression in regressions] == [("startup", "empty_run")]
+        # Results without startup times compare as before.
+        assert compare_results({"scale": 1.0, "scenarios": {}}, current) == []
+
+    def test_different_scales(self):
+        with pytest.raises(ValueError):
+            compare_results({"scale": 1.0, "scenarios": {}}, {"scale": 0.5, "scenarios": {}})
+
+
+class TestStartup:
+    def test_run_startup_benchmark(self, tmp_path):
+        timings = run_startup_benchmark(runs=1, work_directory=tmp_path)
+        assert set(timings) == set(STARTUP_PHASES)
+        assert 0 < timings["interpreter"] < timings["empty_run"]
+        assert list(Path(tmp_path).iterdir()) == []
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,106 @@
+import csv
+from pathlib import Path
+
+import pytest
+
+from csvlog.checkpoint import MergeCheckpoint, checkpoint_log_path, find_resumable_output, partial_output_path
+from csvlog.csv_merge import checkpointed_log_file_combiner, merge_log_files
+
+HEADER_LIST = ["Record Type", "Job number", "Record key"]
+
+
+class TestMergeCheckpoint:
+    def test_record_and_load(self, checkpoint_test_directory):
+        output_path = Path(checkpoint_test_directory, "output", "merged.csv")
+        merge_checkpoint = MergeCheckpoint(output_path)
+        output_file = merge_checkpoint.open_output(HEADER_LIST)
+        output_file.write("INIB,1,1\r\n")
+        merge_checkpoint.record(output_file, [Path(checkpoint_test_directory, "input_0.csv")])
+        output_file.write("INIB,2,2\r\n")
+        output_file.close()
+        merge_checkpoint.close()
+
+        resumed_checkpoint = MergeCheckpoint(output_path, resume=True)
+        assert resumed_checkpoint.is_merged(Path(checkpoint_test_directory, "input_0.csv"))
+        assert not resumed_checkpoint.is_merged(Path(checkpoint_test_directory, "input_1.csv"))
+        # Whatever was written after the checkpoint is thrown away.
+        resumed_checkpoint.open_output(HEADER_LIST).close()
+        resumed_checkpoint.close()
+        assert read_rows(partial_output_path(output_path)) == [HEADER_LIST, ["INIB", "1", "1"]]
+
+    def test_torn_last_line(self, checkpoint_test_directory):
+        output_path = Path(checkpoint_test_directory, "output", "merged.csv")
+        partial_output_path(output_path).write_bytes(b"a,b\r\nc,d\r\n")
+        checkpoint_log_path(output_path).write_text('{"offset": 5, "merged": ["/x.csv"]}\n{"offset": 1')
+        merge_checkpoint = MergeCheckpoint(output_path, resume=True)
+        assert merge_checkpoint.offset == 5
+        assert merge_checkpoint.is_merged(Path("/x.csv"))
+
+    def test_nothing_to_resume(self, checkpoint_test_directory):
+        with pytest.raises(FileNotFoundError):
+            MergeCheckpoint(Path(checkpoint_test_directory, "output", "merged.csv"), resume=True)
+
+    def test_compressed_output(self, checkpoint_test_directory):
+        with pytest.raises(ValueError):
+            MergeCheckpoint(Path(checkpoint_test_directory, "output", "merged.csv.gz"))
+
+    def test_find_resumable_output(self, checkpoint_test_directory):
+        output_directory = Path(checkpoint_test_directory, "output")
+        assert find_resumable_output(output_directory) is None
+        output_path = Path(output_directory, "merged.csv")
+        partial_output_path(output_path).touch()
+        checkpoint_log_path(output_path).touch()
+        assert find_resumable_output(output_directory) == output_path
+
+
+class TestCheckpointedLogFileCombiner:
+    def test_interrupted_and_resumed(self, checkpoint_test_directory):
+        output_path = Path(checkpoint_test_directory, "output", "merged.csv")
+        input_paths = sorted(Path(checkpoint_test_directory).glob("input_*.csv"))
+        combiner = checkpointed_log_file_combiner(output_path, HEADER_LIST, checkpoint_files=2)
+        merged_file_paths = combiner(iter(input_paths))
+        # Files only come out once a checkpoint covers them.
+        assert [next(merged_file_paths), next(merged_file_paths)] == input_paths[:2]
+        # The run dies after its second checkpoint, while input_2.csv and input_3.csv are still waiting to be archived.
+        next(merged_file_paths)
+        merged_file_paths.close()
+        assert not output_path.exists()
+
+        resumed_combiner = checkpointed_log_file_combiner(output_path, HEADER_LIST, resume=True, checkpoint_files=2)
+        assert list(resumed_combiner(iter(input_paths))) == input_paths
+        assert read_rows(output_path) == [HEADER_LIST] + [row for path in input_paths for row in read_rows(path)[1:]]
+        assert not partial_output_path(output_path).exists()
+        assert not checkpoint_log_path(output_path).exists()
+
+    def test_passthrough(self, checkpoint_test_directory):
+        output_path = Path(checkpoint_test_directory, "output", "merged.csv")
+        input_paths = sorted(Path(checkpoint_test_directory).glob("input_*.csv"))
+        list(checkpointed_log_file_combiner(output_path, HEADER_LIST, passthrough=True)(iter(input_paths)))
+        assert read_rows(output_path) == [HEADER_LIST] + [row for path in input_paths for row in read_rows(path)[1:]]
+
+    def test_merge_log_files(self, checkpoint_test_directory):
+        output_path = Path(checkpoint_test_directory, "output", "merged.csv")
+        merge_log_files(checkpoint_test_directory, output_path, header_row=HEADER_LIST,
+                        archive_directory=Path(checkpoint_test_directory, "archive"), checkpoint=True,
+                        checkpoint_files=1)
+        assert len(read_rows(output_path)) == 1 + 5 * 3
+        assert len(list(Path(checkpoint_test_directory, "archive").iterdir())) == 5
+
+
+def read_rows(path: Path):
+    with path.open(newline="") as csv_file:
+        return list(csv.reader(csv_file))
+
+
+@pytest.fixture
+def checkpoint_test_directory(tmp_path):
+    Path(tmp_path, "output").mkdir()
+    for file_number in range(5):
+        with Path(tmp_path, f"input_{file_number}.csv").open(mode="w", newline="") as input_file:
+            csv.writer(input_file).writerows([HEADER_LIST] + [["INIB", f"yy-{file_number}", str(row_number)]
+                                                              for row_number in range(3)])
+    return tmp_path
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -4,9 +4,10 @@ from pathlib import Path
 
 import pytest
 
-from csvlog.command_line import (create_csv_merge_argument_parser, DEFAULT_OBJECT as CMD_DEFAULT,
-                                 update_configuration_from_args)
+from csvlog.command_line import (concat_main, create_csv_merge_argument_parser, DEFAULT_OBJECT as CMD_DEFAULT,
+                                 nothing_to_merge, run_merge, update_configuration_from_args)
 from csvlog.config_file import create_default_config, LogmergeConfig, default_header
+from csvlog.discovery import DEFAULT_INCLUDE_PATTERNS
 
 
 class TestArgumentParser:
@@ -15,7 +16,9 @@ class TestArgumentParser:
     """
 
     def test_defaults(self, arg_parser):
-        all_args = set("archive header input_directory output_location recursive silent verbose".split())
+        all_args = set("archive checkpoint compress compression_level dedup dedup_by exclude files_from header header_cache include incremental input_directory jobs max_depth max_part_bytes max_part_rows output_location passthrough pipeline pipeline_readers profile recursive resume rollback_archive "
+                       "shard sort_by silent split_sections sqlite sqlite_index stats trace_memory verbose watch where "
+                       "writer_threads".split())
 
         args = arg_parser.parse_args([])
         # This assertion is made using set.symmetric_difference so that the output, if it fails, is more readable.
@@ -25,6 +28,36 @@ class TestArgumentParser:
         assert args.input_directory is CMD_DEFAULT
         assert args.output_location is CMD_DEFAULT
         assert args.recursive == CMD_DEFAULT
+        assert args.passthrough is CMD_DEFAULT
+        assert args.incremental is CMD_DEFAULT
+        assert args.watch is False
+        assert args.max_depth is CMD_DEFAULT
+        assert args.include is None
+        assert args.exclude is None
+        assert args.jobs is CMD_DEFAULT
+        assert args.header_cache is CMD_DEFAULT
+        assert args.compress is CMD_DEFAULT
+        assert args.sort_by is None
+        assert args.dedup is CMD_DEFAULT
+        assert args.split_sections is CMD_DEFAULT
+        assert args.rollback_archive is CMD_DEFAULT
+        assert args.checkpoint is CMD_DEFAULT
+        assert args.resume is False
+        assert args.sqlite is CMD_DEFAULT
+        assert args.sqlite_index is None
+        assert args.max_part_bytes is CMD_DEFAULT
+        assert args.max_part_rows is CMD_DEFAULT
+        assert args.writer_threads is CMD_DEFAULT
+        assert args.dedup_by is None
+        assert args.compression_level is CMD_DEFAULT
+        assert args.where is None
+        assert args.shard is CMD_DEFAULT
+        assert args.files_from is CMD_DEFAULT
+        assert args.pipeline is CMD_DEFAULT
+        assert args.pipeline_readers is CMD_DEFAULT
+        assert args.stats is CMD_DEFAULT
+        assert args.profile is None
+        assert args.trace_memory is None
         assert args.silent == 0
         assert args.verbose == 0
 
@@ -283,6 +316,389 @@ class TestUpdateConfigurationFromArgs:
         configuration = update_configuration_from_args(configuration, args_namespace)
         assert configuration.recursive is False
 
+    def test_handle_incremental_argument_true(self, arg_parser, logmerge_config_object,
+                                              argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.incremental is False
+        args_namespace = arg_parser.parse_args(["-A", "--incremental"])
+        configuration = update_configuration_from_args(configuration, args_namespace)
+        assert configuration.incremental is True
+        assert configuration.archive is False
+
+    def test_handle_discovery_arguments_default(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args([]))
+        assert configuration.max_depth is None
+        assert configuration.include_patterns == list(DEFAULT_INCLUDE_PATTERNS)
+        assert configuration.exclude_patterns == []
+
+    def test_handle_discovery_arguments_custom(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        argument_list = ["--max-depth", "2", "--include", "*.txt", "--include", "*.csv", "--exclude", "old"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.max_depth == 2
+        assert configuration.include_patterns == ["*.txt", "*.csv"]
+        assert configuration.exclude_patterns == ["old"]
+
+    def test_handle_discovery_arguments_negative_depth(self, arg_parser, logmerge_config_object,
+                                                       argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--max-depth", "-1"]))
+
+    def test_handle_jobs_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.jobs == 1
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["-j", "4"]))
+        assert configuration.jobs == 4
+
+    def test_handle_jobs_argument_zero(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--jobs", "0"]))
+
+    def test_handle_compress_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        argument_list = ["-o", str(Path(argparse_test_dir, "output.csv")), "--compress", "gz",
+                         "--compression-level", "1"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.output_location == Path(argparse_test_dir, "output.csv.gz")
+        assert configuration.compression_level == 1
+
+    def test_handle_compress_argument_suffix_present(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        argument_list = ["-o", str(Path(argparse_test_dir, "output.csv.xz")), "--compress", "xz"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.output_location == Path(argparse_test_dir, "output.csv.xz")
+
+    def test_handle_compress_argument_exists(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        Path(argparse_test_dir, "output.csv.gz").touch()
+        configuration = LogmergeConfig(create_default_config())
+        argument_list = ["-o", str(Path(argparse_test_dir, "output.csv")), "--compress", "gz"]
+        with pytest.raises(FileExistsError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+
+    def test_handle_sort_by_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.sort_columns == []
+        argument_list = ["--sort-by", "Job number", "--sort-by", "Record key"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.sort_columns == ["Job number", "Record key"]
+
+    @pytest.mark.parametrize("argument_list", [["--sort-by", "Missing column"],
+                                               ["--no-header", "--sort-by", "Job number"]])
+    def test_handle_sort_by_argument_unknown_column(self, arg_parser, argument_list):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+
+    def test_handle_sort_by_argument_column_numbers(self, arg_parser):
+        configuration = LogmergeConfig(create_default_config())
+        argument_list = ["--no-header", "--sort-by", "2"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.sort_columns == ["2"]
+
+    def test_handle_sort_by_argument_with_jobs(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--sort-by", "1", "-j", "2"]))
+
+    def test_handle_sort_by_argument_with_watch(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--sort-by", "1", "--watch"]))
+
+    def test_handle_split_sections_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.split_sections is False
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["--split-sections"]))
+        assert configuration.split_sections is True
+        assert set(configuration.section_headers) == {"INMB", "INIB"}
+
+    def test_handle_split_sections_argument_with_sort_by(self, arg_parser, logmerge_config_object,
+                                                         argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration,
+                                           arg_parser.parse_args(["--split-sections", "--sort-by", "1"]))
+
+    def test_handle_split_sections_argument_with_watch(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--split-sections", "--watch"]))
+
+    def test_handle_part_arguments(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert (configuration.max_part_bytes, configuration.max_part_rows, configuration.writer_threads) == (0, 0, 1)
+        argument_list = ["--max-part-rows", "1000", "--writer-threads", "4"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert (configuration.max_part_bytes, configuration.max_part_rows, configuration.writer_threads) == (0, 1000, 4)
+
+    def test_handle_part_arguments_negative(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--max-part-bytes", "-1"]))
+
+    def test_handle_part_arguments_with_jobs(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--max-part-rows", "10", "-j", "2"]))
+
+    def test_handle_sqlite_arguments(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.output_format == "csv"
+        argument_list = ["-o", str(Path(argparse_test_dir, "output.csv")), "--sqlite", "--sqlite-index", "Job number"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.output_format == "sqlite"
+        assert configuration.output_location == Path(argparse_test_dir, "output.sqlite3")
+        assert configuration.sqlite_index_columns == ["Job number"]
+
+    def test_handle_sqlite_arguments_without_header(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--sqlite", "--no-header"]))
+
+    def test_handle_rollback_archive_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.archive_recovery == "finish"
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["--rollback-archive"]))
+        assert configuration.archive_recovery == "rollback"
+
+    def test_handle_resume_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        Path(argparse_test_dir, "201001120000.csv.partial").touch()
+        Path(argparse_test_dir, "201001120000.csv.checkpoint").touch()
+        configuration = LogmergeConfig(create_default_config())
+        configuration.output_location = Path(argparse_test_dir)
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["--resume"]))
+        assert configuration.resume is True
+        assert configuration.output_location == Path(argparse_test_dir, "201001120000.csv")
+
+    def test_handle_resume_argument_nothing_to_resume(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        configuration.output_location = Path(argparse_test_dir)
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--resume"]))
+
+    def test_handle_checkpoint_argument_with_jobs(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--checkpoint", "-j", "2"]))
+
+    def test_handle_stats_arguments(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.stats_file is None
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["--stats"]))
+        assert configuration.stats_file == "-"
+        stats_path = str(Path(argparse_test_dir, "stats.json"))
+        argument_list = ["--stats", stats_path, "--profile", "run.prof", "--trace-memory", "run.snapshot"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.stats_file == stats_path
+        assert configuration.profile_file == Path("run.prof")
+        assert configuration.trace_memory_file == Path("run.snapshot")
+
+    @pytest.mark.parametrize("setting", ["header_variants", "output_columns"])
+    def test_handle_watch_argument_with_columns(self, arg_parser, logmerge_config_object, argparse_test_dir,
+                                                setting):
+        configuration = LogmergeConfig(create_default_config())
+        setattr(configuration, setting, [["Record Type"]] if setting == "header_variants" else ["Record Type"])
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--watch"]))
+
+    @pytest.mark.parametrize("argument_list", [["--watch", "--incremental", "--no-archive"],
+                                               ["--watch", "--header-cache"]])
+    def test_handle_watch_argument_with_stores(self, arg_parser, logmerge_config_object, argparse_test_dir,
+                                               argument_list):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+
+    def test_handle_stats_argument_with_watch(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--stats", "--watch"]))
+
+    def test_handle_pipeline_arguments(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.pipeline is False
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["--pipeline"]))
+        assert configuration.pipeline is True
+        configuration = LogmergeConfig(create_default_config())
+        configuration = update_configuration_from_args(configuration,
+                                                       arg_parser.parse_args(["--pipeline-readers", "3"]))
+        assert configuration.pipeline is True
+        assert configuration.pipeline_readers == 3
+
+    @pytest.mark.parametrize("argument_list", [["--pipeline", "--jobs", "2"], ["--pipeline", "--dedup"],
+                                               ["--pipeline-readers", "0"]])
+    def test_handle_pipeline_arguments_invalid(self, arg_parser, logmerge_config_object, argparse_test_dir,
+                                               argument_list):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+
+    def test_handle_where_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.where == []
+        argument_list = ["--where", "Record Type=INIB", "--where", "Job number^=12"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.where == ["Record Type=INIB", "Job number^=12"]
+
+    @pytest.mark.parametrize("argument_list", [["--where", "Missing=1"], ["--where", "no condition"],
+                                               ["--where", "0=1", "--passthrough"], ["--where", "0=1", "--watch"]])
+    def test_handle_where_argument_invalid(self, arg_parser, logmerge_config_object, argparse_test_dir,
+                                           argument_list):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+
+    @pytest.mark.parametrize("setting, value", [("output_buffer_size", 0), ("output_buffer_size", -1),
+                                                ("fsync_policy", "always")])
+    def test_handle_output_settings_invalid(self, arg_parser, logmerge_config_object, argparse_test_dir, setting,
+                                            value):
+        configuration = LogmergeConfig(create_default_config())
+        setattr(configuration, setting, value)
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args([]))
+
+    def test_handle_standard_output_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.output_to_stdout is False
+        configuration.compression = "gz"
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["-o", "-"]))
+        assert configuration.output_to_stdout is True
+        # A compression format from the configuration file doesn't rename anything.
+        assert configuration.output_location == LogmergeConfig(create_default_config()).output_location
+
+    @pytest.mark.parametrize("argument_list", [["-o", "-", "--compress", "gz"], ["-o", "-", "--jobs", "2"],
+                                               ["-o", "-", "--sqlite"], ["-o", "-", "--pipeline"],
+                                               ["-o", "-", "--stats"], ["-o", "-", "--watch"]])
+    def test_handle_standard_output_argument_invalid(self, arg_parser, logmerge_config_object, argparse_test_dir,
+                                                     argument_list):
+        configuration = LogmergeConfig(create_default_config())
+        configuration.header = default_header
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+
+    def test_run_merge_to_standard_output(self, arg_parser, logmerge_config_object, argparse_test_dir, capsysbinary):
+        Path(argparse_test_dir, "subdirectory", "merge.csv").write_text("A,B\n1,2\n")
+        argument_list = ["-i", str(Path(argparse_test_dir, "subdirectory")), "-o", "-", "--header", "['A', 'B']",
+                         "--no-archive"]
+        configuration = update_configuration_from_args(logmerge_config_object, arg_parser.parse_args(argument_list))
+        run_merge(configuration)
+        assert capsysbinary.readouterr().out == b"A,B\r\n1,2\r\n"
+        assert Path(argparse_test_dir, "subdirectory", "merge.csv").exists()
+
+    def test_handle_shard_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.shard is None
+        argument_list = ["--shard", "2/4", "-o", str(Path(argparse_test_dir, "merged.csv")), "--compress", "gz"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.shard == "2/4"
+        assert configuration.output_location == Path(argparse_test_dir, "merged_shard2of4.csv.gz")
+
+    @pytest.mark.parametrize("argument_list", [["--shard", "5/4"], ["--shard", "two"], ["--shard", "1/2", "--watch"]])
+    def test_handle_shard_argument_invalid(self, arg_parser, logmerge_config_object, argparse_test_dir,
+                                           argument_list):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+
+    def test_handle_files_from_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.files_from is None
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["--files-from", "-"]))
+        assert configuration.files_from == "-"
+        # Nothing is searched for, so the list has to be read to know whether there is anything to merge.
+        assert not nothing_to_merge(configuration)
+
+    @pytest.mark.parametrize("argument_list", [["--files-from", "missing.txt"], ["--files-from", "-", "--watch"]])
+    def test_handle_files_from_argument_invalid(self, arg_parser, logmerge_config_object, argparse_test_dir,
+                                                argument_list):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+
+    def test_run_merge_files_from(self, arg_parser, logmerge_config_object, argparse_test_dir, capsysbinary):
+        for name in ("listed.csv", "unlisted.csv"):
+            Path(argparse_test_dir, "subdirectory", name).write_text(f"A,B\n{name},2\n")
+        Path(argparse_test_dir, "files.txt").write_text("listed.csv\n")
+        argument_list = ["-i", str(Path(argparse_test_dir, "subdirectory")), "-o", "-", "--header", "['A', 'B']",
+                         "--no-archive", "--files-from", "files.txt"]
+        configuration = update_configuration_from_args(logmerge_config_object, arg_parser.parse_args(argument_list))
+        run_merge(configuration)
+        assert capsysbinary.readouterr().out == b"A,B\r\nlisted.csv,2\r\n"
+
+    def test_concat_main(self, argparse_test_dir, monkeypatch):
+        for shard in (1, 2):
+            Path(argparse_test_dir, f"merged_shard{shard}of2.csv").write_text(f"A,B\r\n{shard},{shard}\r\n")
+        monkeypatch.setattr("sys.argv", ["logmerge-concat", "-o", "joined.csv", "merged_shard2of2.csv",
+                                         "merged_shard1of2.csv"])
+        concat_main()
+        assert Path(argparse_test_dir, "joined.csv").read_bytes() == b"A,B\r\n1,1\r\n2,2\r\n"
+        # Joining again would overwrite the output.
+        with pytest.raises(SystemExit):
+            concat_main()
+
+    def test_handle_dedup_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.deduplicate is False
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(["--dedup"]))
+        assert configuration.deduplicate is True
+        assert configuration.dedup_columns == []
+
+    def test_handle_dedup_by_argument(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        argument_list = ["--dedup-by", "Job number", "--dedup-by", "Record key"]
+        configuration = update_configuration_from_args(configuration, arg_parser.parse_args(argument_list))
+        assert configuration.deduplicate is True
+        assert configuration.dedup_columns == ["Job number", "Record key"]
+
+    def test_handle_dedup_argument_with_passthrough(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--dedup", "-p"]))
+
+    def test_handle_dedup_argument_with_watch(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        with pytest.raises(ArgumentTypeError):
+            update_configuration_from_args(configuration, arg_parser.parse_args(["--dedup", "--watch"]))
+
+    def test_handle_passthrough_argument_default(self, arg_parser, logmerge_config_object,
+                                                 argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        assert configuration.passthrough is False
+        args_namespace = arg_parser.parse_args([])
+        configuration = update_configuration_from_args(configuration, args_namespace)
+        assert configuration.passthrough is False
+
+    def test_handle_passthrough_argument_true(self, arg_parser, logmerge_config_object,
+                                              argparse_test_dir):
+        configuration = LogmergeConfig(create_default_config())
+        args_namespace = arg_parser.parse_args(["--passthrough"])
+        configuration = update_configuration_from_args(configuration, args_namespace)
+        assert configuration.passthrough is True
+
+
+class TestNothingToMerge:
+    def test_empty_directory(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        argument_list = ["-i", str(Path(argparse_test_dir, "subdirectory")), "-o", "output.csv"]
+        configuration = update_configuration_from_args(logmerge_config_object, arg_parser.parse_args(argument_list))
+        configuration.archive_journal_file = Path(argparse_test_dir, "journal.jsonl")
+        assert nothing_to_merge(configuration)
+        # An interrupted archive still has to be recovered.
+        configuration.archive_journal_file.touch()
+        assert not nothing_to_merge(configuration)
+
+    def test_files_to_merge(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        argument_list = ["-i", str(argparse_test_dir), "-o", "output.csv"]
+        configuration = update_configuration_from_args(logmerge_config_object, arg_parser.parse_args(argument_list))
+        assert not nothing_to_merge(configuration)
+
+    def test_stats_wanted(self, arg_parser, logmerge_config_object, argparse_test_dir):
+        argument_list = ["-i", str(Path(argparse_test_dir, "subdirectory")), "-o", "output.csv", "--stats"]
+        configuration = update_configuration_from_args(logmerge_config_object, arg_parser.parse_args(argument_list))
+        assert not nothing_to_merge(configuration)
+
 
 @pytest.fixture
 def arg_parser():
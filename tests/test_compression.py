@@ -0,0 +1,174 @@
+import bz2
+import csv
+import gzip
+import io
+import lzma
+from pathlib import Path
+
+import pytest
+
+from csvlog import compression
+from csvlog.compression import (BatchedFileWriter, compression_for_path, open_input_file, open_output_file,
+                                sync_output_file, sync_path)
+
+HEADER_LIST = "ALPHA BRAVO CHARLIE".split()
+NAME_LIST = [["Alice", "Betty", "Christine"], ["Adam", "Bob", "Christopher"]]
+DECOMPRESSORS = {".gz": gzip.decompress, ".bz2": bz2.decompress, ".xz": lzma.decompress}
+
+
+class TestCompressionForPath:
+    def test_plain(self):
+        assert compression_for_path(Path("log.csv")) is None
+
+    def test_compressed(self):
+        assert compression_for_path(Path("log.csv.gz")) == "gzip"
+        assert compression_for_path(Path("log.csv.BZ2")) == "bzip2"
+        assert compression_for_path(Path("log.csv.xz")) == "xz"
+
+
+class TestOpenInputFile:
+    @pytest.mark.parametrize("suffix, compress", [(".gz", gzip.compress), (".bz2", bz2.compress),
+                                                  (".xz", lzma.compress)])
+    def test_text(self, tmp_path, suffix, compress):
+        input_path = Path(tmp_path, f"input.csv{suffix}")
+        input_path.write_bytes(compress(b"ALPHA,BRAVO,CHARLIE\r\nAlice,Betty,Christine\r\n"))
+        with open_input_file(input_path) as input_file:
+            assert list(csv.reader(input_file)) == [HEADER_LIST, NAME_LIST[0]]
+
+    def test_binary(self, tmp_path):
+        input_path = Path(tmp_path, "input.csv.gz")
+        input_path.write_bytes(gzip.compress(b"ALPHA,BRAVO,CHARLIE\n"))
+        with open_input_file(input_path, binary=True) as input_file:
+            assert input_file.read() == b"ALPHA,BRAVO,CHARLIE\n"
+
+
+class TestOpenOutputFile:
+    @pytest.mark.parametrize("suffix", [".gz", ".bz2", ".xz"])
+    def test_round_trip(self, tmp_path, suffix):
+        output_path = Path(tmp_path, f"output.csv{suffix}")
+        with open_output_file(output_path, "w", compression_level=1) as output_file:
+            csv.writer(output_file).writerows([HEADER_LIST] + NAME_LIST)
+        with open_input_file(output_path) as input_file:
+            assert list(csv.reader(input_file)) == [HEADER_LIST] + NAME_LIST
+
+    @pytest.mark.parametrize("suffix", [".gz", ".bz2", ".xz"])
+    def test_append_adds_a_stream(self, tmp_path, suffix):
+        output_path = Path(tmp_path, f"output.csv{suffix}")
+        with open_output_file(output_path, "wb") as output_file:
+            output_file.write(b"first\r\n")
+        with open_output_file(output_path, "ab") as output_file:
+            output_file.write(b"second\r\n")
+        assert DECOMPRESSORS[suffix](output_path.read_bytes()) == b"first\r\nsecond\r\n"
+
+    def test_many_blocks(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(compression, "COMPRESSION_BLOCK_SIZE", 16)
+        output_path = Path(tmp_path, "output.csv.gz")
+        expected = b"".join(f"{number},row\r\n".encode() for number in range(1000))
+        with open_output_file(output_path, "wb") as output_file:
+            for number in range(1000):
+                output_file.write(f"{number},row\r\n".encode())
+        assert gzip.decompress(output_path.read_bytes()) == expected
+
+    def test_plain_output(self, tmp_path):
+        output_path = Path(tmp_path, "output.csv")
+        with open_output_file(output_path, "w") as output_file:
+            output_file.write("plain\r\n")
+        assert output_path.read_bytes() == b"plain\r\n"
+
+    @pytest.mark.parametrize("mode", ["w", "wb"])
+    def test_buffer_size(self, tmp_path, mode):
+        output_path = Path(tmp_path, "output.csv")
+        row = "buffered\r\n" if mode == "w" else b"buffered\r\n"
+        with open_output_file(output_path, mode, buffer_size=64 * 1024) as output_file:
+            for _ in range(1000):
+                output_file.write(row)
+            # Ten thousand bytes fit in the buffer, so none of them have been written yet.
+            assert output_path.stat().st_size == 0
+        assert output_path.stat().st_size == 10000
+
+
+class TestBatchedFileWriter:
+    def test_whole_chunks(self):
+        raw_file = RecordingFile()
+        with BatchedFileWriter(raw_file, 1000) as output_file:
+            for _ in range(25):
+                output_file.write(b"x" * 100)
+            assert raw_file.write_sizes == [1000, 1000]
+            output_file.flush()
+            assert raw_file.write_sizes == [1000, 1000, 500]
+            # A flush doesn't move the chunk boundaries.
+            output_file.write(b"x" * 1000)
+            assert raw_file.write_sizes == [1000, 1000, 500, 500]
+            assert raw_file.getvalue() == b"x" * 3000
+        assert raw_file.write_sizes == [1000, 1000, 500, 500, 500]
+
+    def test_appending_aligns_chunks(self):
+        raw_file = RecordingFile(b"y" * 300)
+        raw_file.seek(0, io.SEEK_END)
+        output_file = BatchedFileWriter(raw_file, 1000)
+        output_file.write(b"x" * 2500)
+        # The first chunk is cut short so later chunks end on multiples of the buffer size.  Whole chunks skip the
+        # buffer entirely.
+        assert raw_file.write_sizes == [700, 1000]
+        assert output_file.tell() == 2800
+        output_file.write(b"x" * 500)
+        assert raw_file.write_sizes == [700, 1000, 1000]
+        assert raw_file.getvalue() == b"y" * 300 + b"x" * 2700
+
+    @pytest.mark.parametrize("buffer_size, file_sizes", [(4096, [0, 0, 10000]), (1000, [1000, 2000, 10000])])
+    def test_buffer_size_sets_write_size(self, tmp_path, buffer_size, file_sizes):
+        output_path = Path(tmp_path, "output.csv")
+        seen_sizes = []
+        with open_output_file(output_path, "wb", buffer_size=buffer_size) as output_file:
+            assert isinstance(output_file, BatchedFileWriter)
+            for number in range(1, 1001):
+                output_file.write(b"buffered\r\n")
+                if number in (150, 250):
+                    seen_sizes.append(output_path.stat().st_size)
+        seen_sizes.append(output_path.stat().st_size)
+        assert seen_sizes == file_sizes
+
+    def test_text_output(self, tmp_path):
+        output_path = Path(tmp_path, "output.csv")
+        with open_output_file(output_path, "w", buffer_size=1000) as output_file:
+            assert isinstance(output_file.buffer, BatchedFileWriter)
+            csv.writer(output_file).writerows(["text", str(number)] for number in range(2))
+        assert output_path.read_bytes() == b"text,0\r\ntext,1\r\n"
+
+
+class RecordingFile(io.BytesIO):
+    def __init__(self, initial_bytes: bytes = b""):
+        super().__init__(initial_bytes)
+        self.write_sizes = []
+
+    def write(self, data) -> int:
+        self.write_sizes.append(len(data))
+        return super().write(data)
+
+
+class TestSync:
+    def test_sync_output_file(self, tmp_path, monkeypatch):
+        synced = []
+        monkeypatch.setattr(compression.os, "fsync", synced.append)
+        output_path = Path(tmp_path, "output.csv")
+        with open_output_file(output_path, "w", buffer_size=64 * 1024) as output_file:
+            output_file.write("synced\r\n")
+            sync_output_file(output_file)
+            assert output_path.read_bytes() == b"synced\r\n"
+            assert synced == [output_file.fileno()]
+
+    def test_compressed_output_is_synced_by_path(self, tmp_path, monkeypatch):
+        synced = []
+        monkeypatch.setattr(compression.os, "fsync", synced.append)
+        output_path = Path(tmp_path, "output.csv.gz")
+        with open_output_file(output_path, "w") as output_file:
+            output_file.write("compressed\r\n")
+            sync_output_file(output_file)
+            assert synced == []
+        sync_path(output_path)
+        assert len(synced) == 1
+        assert gzip.decompress(output_path.read_bytes()) == b"compressed\r\n"
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -5,7 +5,7 @@ import pytest
 
 from csvlog.config_file import (LogmergeConfig, default_header, default_archive_location, default_output_location,
                                 create_default_config, load_or_create_configparser, write_default_config,
-                                get_configuration)
+                                get_configuration, config_cache_path)
 
 
 class TestLogmergeConfig:
@@ -104,3 +104,31 @@ class TestGetConfiguration:
         assert config_file_path.exists()
         lmc = get_configuration(config_file_path)
         assert lmc.archive_folder == archive_path
+
+    def test_cached_config(self, tmp_path):
+        config_file_path = Path(tmp_path, "config.cfg")
+        parsed = get_configuration(config_file_path)
+        assert config_cache_path(config_file_path).exists()
+        cached = get_configuration(config_file_path)
+        # The cached settings are used without parsing the file again.
+        assert cached.cfg is None
+        assert {name: value for name, value in vars(cached).items() if name != "cfg"} == {
+            name: value for name, value in vars(parsed).items() if name != "cfg"}
+        assert isinstance(cached.archive_folder, Path)
+
+    def test_changed_config_is_parsed_again(self, tmp_path):
+        config_file_path = Path(tmp_path, "config.cfg")
+        get_configuration(config_file_path)
+        cfg = create_default_config()
+        cfg["SEARCH"]["AutoRecursive"] = str(True)
+        with config_file_path.open(mode="w") as cfg_outfile:
+            cfg.write(cfg_outfile)
+        lmc = get_configuration(config_file_path)
+        assert lmc.cfg is not None
+        assert lmc.recursive is True
+
+    def test_damaged_cache_is_ignored(self, tmp_path):
+        config_file_path = Path(tmp_path, "config.cfg")
+        get_configuration(config_file_path)
+        config_cache_path(config_file_path).write_bytes(b"not a cache")
+        assert get_configuration(config_file_path).header == default_header
@@ -1,13 +1,18 @@
 import csv
+import gzip
+import json
 import os
-from io import StringIO
+from io import BytesIO, StringIO
 from pathlib import Path
 from typing import Iterator, Sequence, Tuple
 
 import pytest
 
+from csvlog import compression
+from csvlog.archive import find_archive_journals
 from csvlog.csv_merge import (get_csv_paths_in_directory, log_record_combiner, log_file_combiner, move_file_to_archive,
-                              merge_log_files)
+                              merge_log_files, log_bytes_combiner, parallel_log_file_combiner)
+from csvlog.stats import MergeStats
 
 
 class TestGetCSVPathsInDirectory:
@@ -78,6 +83,12 @@ class TestLogRecordCombiner:
         assert function_returns == (False, False)
         assert tuple(csv.reader(stream.getvalue().splitlines())) == expected_results
 
+    def test_empty_input_with_header(self):
+        readers, writer, stream = self.csv_object_setup(([],))
+        function_returns = tuple(log_record_combiner(writer, reader, HEADER_LIST) for reader in readers)
+        assert function_returns == (False,)
+        assert stream.getvalue() == ""
+
     @staticmethod
     def csv_object_setup(data_sets: Iterator[Sequence[str]]) -> Tuple[Iterator[csv.reader], csv.writer, StringIO]:
         readers = (csv.reader(data) for data in data_sets)
@@ -109,6 +120,112 @@ class TestLogFileCombiner:
             [BAD_HEADER_LIST] + ANIMAL_LIST + [HEADER_LIST] + NAME_LIST + [HEADER_LIST] + PLACES_LIST)
 
 
+    def test_passthrough_custom_header(self, csv_merge_test_directory):
+        output_path = Path(csv_merge_test_directory, "test_out.csv")
+        input_paths = [Path(csv_merge_test_directory, name) for name in
+                       ("names.csv", "animals_bad_header.csv", "places.csv")]
+        log_merger = log_file_combiner(output_path, header_row=HEADER_LIST, passthrough=True)
+        merged_file_paths = log_merger(iter(input_paths))
+        assert list(merged_file_paths) == [input_paths[0], input_paths[2]]
+        assert tuple((*csv.reader(output_path.open(newline="")),)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+
+    def test_passthrough_matches_parsed_output(self, csv_merge_test_directory):
+        input_paths = [Path(csv_merge_test_directory, name) for name in
+                       ("names.csv", "animals_bad_header.csv", "places.csv")]
+        parsed_path = Path(csv_merge_test_directory, "parsed.csv")
+        passthrough_path = Path(csv_merge_test_directory, "passthrough.csv")
+        list(log_file_combiner(parsed_path, header_row=None)(iter(input_paths)))
+        list(log_file_combiner(passthrough_path, header_row=None, passthrough=True)(iter(input_paths)))
+        assert passthrough_path.read_bytes() == parsed_path.read_bytes()
+
+    def test_append_keeps_existing_output(self, csv_merge_test_directory):
+        output_path = Path(csv_merge_test_directory, "test_out.csv")
+        names_path = Path(csv_merge_test_directory, "names.csv")
+        places_path = Path(csv_merge_test_directory, "places.csv")
+        list(log_file_combiner(output_path, header_row=HEADER_LIST, append=True)(iter([names_path])))
+        list(log_file_combiner(output_path, header_row=HEADER_LIST, append=True)(iter([places_path])))
+        assert tuple((*csv.reader(output_path.open(newline="")),)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+
+
+class TestParallelLogFileCombiner:
+    @pytest.mark.parametrize("passthrough", [False, True])
+    def test_matches_serial_output(self, csv_merge_test_directory, passthrough):
+        input_paths = list(get_csv_paths_in_directory(csv_merge_test_directory, recurse=True))
+        serial_path = Path(csv_merge_test_directory, "archive", "serial.csv")
+        parallel_path = Path(csv_merge_test_directory, "archive", "parallel.csv")
+        serial_merged = list(log_file_combiner(serial_path, HEADER_LIST, passthrough)(iter(input_paths)))
+        parallel_merged = list(parallel_log_file_combiner(parallel_path, HEADER_LIST, passthrough, jobs=2,
+                                                          files_per_shard=1)(iter(input_paths)))
+        assert parallel_merged == serial_merged
+        assert parallel_path.read_bytes() == serial_path.read_bytes()
+        # The temporary shard directory is cleaned up afterwards.
+        assert sorted(path.name for path in Path(csv_merge_test_directory, "archive").iterdir()) == ["parallel.csv",
+                                                                                                    "serial.csv"]
+
+class TestLogBytesCombiner:
+    def test_line_endings_normalized(self):
+        input_file = BytesIO(b"ALPHA,BRAVO\nAlice,Betty\rAdam,Bob\r\nAdams,Bowers")
+        output_file = BytesIO()
+        assert log_bytes_combiner(output_file, input_file, ["ALPHA", "BRAVO"]) is True
+        assert output_file.getvalue() == b"Alice,Betty\r\nAdam,Bob\r\nAdams,Bowers\r\n"
+
+    def test_carriage_return_split_across_chunks(self, monkeypatch):
+        monkeypatch.setattr("csvlog.csv_merge.PASSTHROUGH_BUFFER_SIZE", 4)
+        input_file = BytesIO(b"abc\ndef\r\nghi\r\n")
+        output_file = BytesIO()
+        assert log_bytes_combiner(output_file, input_file) is True
+        assert output_file.getvalue() == b"abc\r\ndef\r\nghi\r\n"
+
+    def test_mixed_line_endings_after_first_line(self, tmp_path):
+        # The first line ends like the output does, but later lines don't, so the file isn't copied verbatim.
+        input_path = Path(tmp_path, "input.csv")
+        input_path.write_bytes(b"ALPHA,BRAVO\r\nAlice,Betty\nAdam,Bob\rAdams,Bowers\r\n")
+        output_path = Path(tmp_path, "output.csv")
+        output_path.write_bytes(b"")
+        with input_path.open(mode="rb") as input_file, output_path.open(mode="r+b") as output_file:
+            assert log_bytes_combiner(output_file, input_file, ["ALPHA", "BRAVO"]) is True
+        assert output_path.read_bytes() == b"Alice,Betty\r\nAdam,Bob\r\nAdams,Bowers\r\n"
+
+    @pytest.mark.parametrize("chunk_size", [2, 3, 1024])
+    def test_quoted_line_breaks_kept(self, monkeypatch, chunk_size):
+        monkeypatch.setattr("csvlog.csv_merge.PASSTHROUGH_BUFFER_SIZE", chunk_size)
+        input_bytes = b'ALPHA,BRAVO\nAlice,"two\nlines"\r"Adam ""A""","three\r\nline\rfield"\nAdams,Bowers\r'
+        output_file = BytesIO()
+        assert log_bytes_combiner(output_file, BytesIO(input_bytes), ["ALPHA", "BRAVO"]) is True
+        assert output_file.getvalue() == (b'Alice,"two\nlines"\r\n"Adam ""A""","three\r\nline\rfield"\r\n'
+                                          b'Adams,Bowers\r\n')
+        # The csv module keeps the same field data.
+        text = input_bytes.decode()
+        assert list(csv.reader(StringIO(output_file.getvalue().decode(), newline=""))) == list(
+            csv.reader(StringIO(text, newline="")))[1:]
+
+    def test_quoted_line_break_in_crlf_file(self):
+        input_file = BytesIO(b'ALPHA,BRAVO\r\nAlice,"two\nlines"\r\n')
+        output_file = BytesIO()
+        assert log_bytes_combiner(output_file, input_file, ["ALPHA", "BRAVO"]) is True
+        assert output_file.getvalue() == b'Alice,"two\nlines"\r\n'
+
+    def test_incorrect_header(self):
+        input_file = BytesIO(b"ALPHA,BETA\nAlice,Betty\n")
+        output_file = BytesIO()
+        assert log_bytes_combiner(output_file, input_file, ["ALPHA", "BRAVO"]) is False
+        assert output_file.getvalue() == b""
+
+    def test_empty_file_with_header(self):
+        output_file = BytesIO()
+        assert log_bytes_combiner(output_file, BytesIO(b""), ["ALPHA", "BRAVO"]) is False
+        assert output_file.getvalue() == b""
+
+    def test_verbatim_copy_adds_trailing_newline(self, tmp_path):
+        input_path = Path(tmp_path, "input.csv")
+        input_path.write_bytes(b"ALPHA,BRAVO\r\nAlice,Betty\r\nAdam,Bob")
+        output_path = Path(tmp_path, "output.csv")
+        output_path.write_bytes(b"")
+        with input_path.open(mode="rb") as input_file, output_path.open(mode="r+b") as output_file:
+            assert log_bytes_combiner(output_file, input_file, ["ALPHA", "BRAVO"]) is True
+        assert output_path.read_bytes() == b"Alice,Betty\r\nAdam,Bob\r\n"
+
+
 class TestMoveFilesToArchive:
     def test_file_in_top_directory(self, csv_merge_test_directory):
         archive_folder_path = Path(csv_merge_test_directory, "archive")
@@ -163,6 +280,262 @@ class TestMergeLogFiles:
         assert Path(csv_merge_test_directory, "archive", "names.csv").exists()
         assert Path(csv_merge_test_directory, "archive", "places.csv").exists()
 
+    @pytest.mark.parametrize("passthrough", [False, True])
+    def test_compressed_input_and_output(self, csv_merge_test_directory, passthrough):
+        names_path = Path(csv_merge_test_directory, "names.csv")
+        compressed_names_path = Path(csv_merge_test_directory, "names.csv.gz")
+        compressed_names_path.write_bytes(gzip.compress(names_path.read_bytes()))
+        names_path.unlink()
+        output_path = Path(csv_merge_test_directory, "output.csv.gz")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        archive_directory=Path(csv_merge_test_directory, "archive"), passthrough=passthrough)
+        merged_lines = gzip.decompress(output_path.read_bytes()).decode().splitlines()
+        assert tuple(csv.reader(merged_lines)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+        assert Path(csv_merge_test_directory, "archive", "names.csv.gz").exists()
+
+    def test_sorted(self, csv_merge_test_directory):
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        archive_directory=Path(csv_merge_test_directory, "archive"), sort_columns=["CHARLIE"])
+        expected_rows = sorted(NAME_LIST + PLACES_LIST, key=lambda row: row[2])
+        assert tuple((*csv.reader(output_path.open(newline="")),)) == tuple([HEADER_LIST] + expected_rows)
+        assert Path(csv_merge_test_directory, "archive", "names.csv").exists()
+
+    def test_deduplicate(self, csv_merge_test_directory):
+        with Path(csv_merge_test_directory, "names_again.csv").open(mode="w", newline="") as repeat_file:
+            csv.writer(repeat_file).writerows([HEADER_LIST] + NAME_LIST[1:] + PLACES_LIST[:1])
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        archive_directory=Path(csv_merge_test_directory, "archive"), deduplicate=True)
+        output_rows = list(csv.reader(output_path.open(newline="")))
+        assert output_rows == [HEADER_LIST] + NAME_LIST + PLACES_LIST
+        # Every file was merged, even the one that held nothing new.
+        assert Path(csv_merge_test_directory, "archive", "names_again.csv").exists()
+
+    def test_stats(self, csv_merge_test_directory):
+        stats = MergeStats()
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        archive_directory=Path(csv_merge_test_directory, "archive"), stats=stats)
+        report = stats.to_dict()
+        assert set(report["phases"]) >= {"discovery", "header_check", "merge", "archive"}
+        assert report["counters"]["files_merged"] == 2
+        assert report["counters"]["files_archived"] == 2
+        assert report["counters"]["rows_read"] == len(NAME_LIST) + len(PLACES_LIST)
+        assert sorted(Path(file["path"]).name for file in report["files"]) == ["names.csv", "places.csv"]
+        # The phases share out the run's time between them, so together they can't take longer than the run.
+        assert sum(phase["seconds"] for phase in report["phases"].values()) <= report["seconds"]
+
+    def test_recovers_archive_journal(self, csv_merge_test_directory):
+        # An earlier run archived names.csv and was interrupted before its journal was removed.
+        journal_path = Path(csv_merge_test_directory, "journal.jsonl")
+        with journal_path.open(mode="w") as journal:
+            journal.write(json.dumps({"operation": "move", "source": str(Path(csv_merge_test_directory, "names.csv")),
+                                      "destination": str(Path(csv_merge_test_directory, "archive", "names.csv"))}))
+        Path(csv_merge_test_directory, "names.csv").replace(Path(csv_merge_test_directory, "archive", "names.csv"))
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        archive_directory=Path(csv_merge_test_directory, "archive", "run"),
+                        archive_journal_path=journal_path, archive_recovery="rollback")
+        assert tuple((*csv.reader(output_path.open(newline="")),)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+        assert Path(csv_merge_test_directory, "archive", "run", "names.csv").exists()
+        assert not journal_path.exists()
+        # The run's own journal is removed as well once its moves have finished.
+        assert find_archive_journals(journal_path) == []
+
+    def test_parallel_jobs(self, csv_merge_test_directory):
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        archive_directory=Path(csv_merge_test_directory, "archive"), jobs=2)
+        assert tuple((*csv.reader(output_path.open(newline="")),)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+        assert Path(csv_merge_test_directory, "archive", "names.csv").exists()
+        assert Path(csv_merge_test_directory, "archive", "places.csv").exists()
+
+    @pytest.mark.parametrize("passthrough", [False, True])
+    def test_pipeline(self, csv_merge_test_directory, passthrough):
+        stats = MergeStats()
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        archive_directory=Path(csv_merge_test_directory, "archive"), passthrough=passthrough,
+                        pipeline=True, pipeline_readers=2, stats=stats)
+        assert tuple((*csv.reader(output_path.open(newline="")),)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+        assert Path(csv_merge_test_directory, "archive", "names.csv").exists()
+        assert Path(csv_merge_test_directory, "archive", "places.csv").exists()
+        assert stats.to_dict()["counters"]["files_merged"] == 2
+
+    def test_pipeline_with_jobs(self, csv_merge_test_directory):
+        with pytest.raises(ValueError):
+            merge_log_files(search_directory=csv_merge_test_directory,
+                            output_file_path=Path(csv_merge_test_directory, "output.csv"), header_row=HEADER_LIST,
+                            pipeline=True, jobs=2)
+
+    @pytest.mark.parametrize("fsync_policy, syncs", [("never", 0), ("file", 3), ("end", 1)])
+    def test_fsync_policy(self, csv_merge_test_directory, monkeypatch, fsync_policy, syncs):
+        synced = []
+        monkeypatch.setattr(compression.os, "fsync", synced.append)
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        output_buffer_size=64 * 1024, fsync_policy=fsync_policy)
+        assert tuple((*csv.reader(output_path.open(newline="")),)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+        # Once per merged file and once more for the closed output.
+        assert len(synced) == syncs
+
+    def test_unknown_fsync_policy(self, csv_merge_test_directory):
+        with pytest.raises(ValueError):
+            merge_log_files(search_directory=csv_merge_test_directory,
+                            output_file_path=Path(csv_merge_test_directory, "output.csv"), header_row=HEADER_LIST,
+                            fsync_policy="always")
+
+    @pytest.mark.parametrize("pipeline", [False, True])
+    def test_projection(self, csv_merge_test_directory, pipeline):
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        # The animals file has a different header, two of its columns share names with the canonical ones.
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        header_variants=[BAD_HEADER_LIST], output_columns=["ECHO", "ALPHA", "BRAVO"],
+                        pipeline=pipeline)
+        expected = [["ECHO", "ALPHA", "BRAVO"]] + [[row[4], row[0], row[1]] for row in NAME_LIST + PLACES_LIST]
+        expected += [["", row[0], ""] for row in ANIMAL_LIST]
+        assert sorted(csv.reader(output_path.open(newline=""))) == sorted(expected)
+
+    @pytest.mark.parametrize("pipeline", [False, True])
+    def test_where(self, csv_merge_test_directory, pipeline):
+        stats = MergeStats()
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, header_row=HEADER_LIST,
+                        where=["ALPHA^=A", "ECHO=Erica|Evanston"], pipeline=pipeline, stats=stats)
+        assert tuple((*csv.reader(output_path.open(newline="")),)) == (HEADER_LIST, NAME_LIST[0], PLACES_LIST[1])
+        # Rows that were dropped before they were parsed still count as read.
+        assert stats.to_dict()["counters"]["rows_read"] == len(NAME_LIST) + len(PLACES_LIST)
+
+    def test_projection_with_passthrough(self, csv_merge_test_directory):
+        with pytest.raises(ValueError):
+            merge_log_files(search_directory=csv_merge_test_directory,
+                            output_file_path=Path(csv_merge_test_directory, "output.csv"), header_row=HEADER_LIST,
+                            output_columns=["ALPHA"], passthrough=True)
+
+    def test_result(self, csv_merge_test_directory):
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        res = merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path,
+                              header_row=HEADER_LIST, collect_paths=True)
+        assert (res.files_merged, res.files_rejected) == (2, 1)
+        assert sorted(file_path.name for file_path in res.merged_files) == ["names.csv", "places.csv"]
+        assert [file_path.name for file_path in res.rejected_files] == ["animals_bad_header.csv"]
+        assert res.rows_read == len(NAME_LIST) + len(PLACES_LIST)
+        assert res.bytes_read == sum(file_path.stat().st_size for file_path in res.merged_files)
+        assert set(res.phases) >= {"discovery", "header_check", "merge"}
+        assert res.seconds >= sum(res.phases.values())
+
+    def test_result_without_paths(self, csv_merge_test_directory):
+        res = merge_log_files(search_directory=csv_merge_test_directory,
+                              output_file_path=Path(csv_merge_test_directory, "output.csv"), header_row=HEADER_LIST)
+        assert (res.files_merged, res.files_rejected) == (2, 1)
+        assert res.merged_files is None and res.rejected_files is None
+
+    @pytest.mark.parametrize("passthrough", [False, True])
+    def test_binary_stream(self, csv_merge_test_directory, passthrough):
+        output_stream = BytesIO()
+        res = merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_stream,
+                              header_row=HEADER_LIST, passthrough=passthrough)
+        assert not output_stream.closed
+        merged_lines = output_stream.getvalue().decode().splitlines()
+        assert tuple(csv.reader(merged_lines)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+        assert res.files_merged == 2
+
+    def test_text_stream(self, csv_merge_test_directory):
+        output_stream = StringIO(newline="")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_stream,
+                        header_row=HEADER_LIST, where=["ALPHA^=A"], output_columns=["ECHO", "ALPHA"])
+        expected = [["ECHO", "ALPHA"]] + [[row[4], row[0]] for row in NAME_LIST + PLACES_LIST if row[0][0] == "A"]
+        assert list(csv.reader(StringIO(output_stream.getvalue()))) == expected
+
+    def test_pipe(self, csv_merge_test_directory):
+        # A pipe can't seek, so passthrough output to one never takes the kernel copy path.
+        read_fd, write_fd = os.pipe()
+        with open(read_fd, "rb") as pipe_reader, open(write_fd, "wb") as pipe_writer:
+            merge_log_files(search_directory=csv_merge_test_directory, output_file_path=pipe_writer,
+                            header_row=HEADER_LIST, passthrough=True)
+            pipe_writer.close()
+            merged_lines = pipe_reader.read().decode().splitlines()
+        assert tuple(csv.reader(merged_lines)) == tuple([HEADER_LIST] + NAME_LIST + PLACES_LIST)
+
+    def test_output_stream_in_search_directory(self, csv_merge_test_directory):
+        with Path(csv_merge_test_directory, "output.csv").open(mode="w", newline="") as output_file:
+            res = merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_file,
+                                  header_row=HEADER_LIST, collect_paths=True)
+        assert "output.csv" not in [file_path.name for file_path in res.merged_files + res.rejected_files]
+
+    def test_row_sink(self, csv_merge_test_directory):
+        rows = []
+        res = merge_log_files(search_directory=csv_merge_test_directory, output_file_path=rows.append,
+                              header_row=HEADER_LIST, archive_directory=Path(csv_merge_test_directory, "archive"))
+        assert [list(row) for row in rows] == NAME_LIST + PLACES_LIST
+        assert res.rows_read == len(rows)
+        assert Path(csv_merge_test_directory, "archive", "names.csv").exists()
+
+    @pytest.mark.parametrize("options", [{"passthrough": True}, {"jobs": 2}, {"sort_columns": ["ALPHA"]},
+                                         {"pipeline": True}, {"max_part_rows": 10}, {"fsync_policy": "end"}])
+    def test_row_sink_errors(self, csv_merge_test_directory, options):
+        with pytest.raises(ValueError):
+            merge_log_files(search_directory=csv_merge_test_directory, output_file_path=[].append,
+                            header_row=HEADER_LIST, **options)
+
+    @pytest.mark.parametrize("list_kind", ["path", "stream", "names"])
+    def test_file_list(self, csv_merge_test_directory, list_kind):
+        # The subdirectory's food file would be found by a recursive search, only the listed files are merged.
+        names = ["places.csv", "animals_bad_header.csv", str(Path(csv_merge_test_directory, "names.csv"))]
+        list_path = Path(csv_merge_test_directory, "files.txt")
+        list_path.write_bytes("\0".join(names).encode())
+        file_list = {"path": list_path, "stream": BytesIO(list_path.read_bytes()), "names": names}[list_kind]
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        res = merge_log_files(search_directory=csv_merge_test_directory, output_file_path=output_path, recurse=True,
+                              header_row=HEADER_LIST, archive_directory=Path(csv_merge_test_directory, "archive"),
+                              file_list=file_list, collect_paths=True)
+        assert tuple(csv.reader(output_path.open(newline=""))) == tuple([HEADER_LIST] + PLACES_LIST + NAME_LIST)
+        assert [file_path.name for file_path in res.rejected_files] == ["animals_bad_header.csv"]
+        assert Path(csv_merge_test_directory, "archive", "places.csv").exists()
+        assert Path(csv_merge_test_directory, "subdirectory", "food.csv").exists()
+
+    def test_file_list_outside_search_directory(self, csv_merge_test_directory):
+        output_path = Path(csv_merge_test_directory, "output.csv")
+        res = merge_log_files(search_directory=Path(csv_merge_test_directory, "subdirectory"),
+                              output_file_path=output_path, header_row=HEADER_LIST,
+                              file_list=["../names.csv", "food.csv", "../subdirectory/food.csv"], collect_paths=True)
+        # The same file listed twice is merged twice, when it isn't archived in between.
+        assert [file_path.name for file_path in res.merged_files] == ["food.csv", "food.csv"]
+
+    def test_incremental_without_archive(self, csv_merge_test_directory):
+        state_path = Path(csv_merge_test_directory, "state.sqlite3")
+        first_output_path = Path(csv_merge_test_directory, "archive", "first.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=first_output_path,
+                        header_row=HEADER_LIST, state_file_path=state_path)
+        assert len(tuple(csv.reader(first_output_path.open(newline="")))) == 1 + len(NAME_LIST) + len(PLACES_LIST)
+        with Path(csv_merge_test_directory, "more_names.csv").open(mode="w", newline="") as more_names_file:
+            csv.writer(more_names_file).writerows([HEADER_LIST] + NAME_LIST)
+        second_output_path = Path(csv_merge_test_directory, "archive", "second.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=second_output_path,
+                        header_row=HEADER_LIST, state_file_path=state_path)
+        assert tuple(csv.reader(second_output_path.open(newline=""))) == tuple([HEADER_LIST] + NAME_LIST)
+
+    def test_incremental_file_grows_during_merge(self, csv_merge_test_directory):
+        state_path = Path(csv_merge_test_directory, "state.sqlite3")
+        names_path = Path(csv_merge_test_directory, "names.csv")
+        merged_rows = []
+
+        def appending_row_sink(row):
+            # The first row of names.csv is merged, then another is written to the end of the file.
+            if not merged_rows:
+                with names_path.open(mode="a", newline="") as names_file:
+                    csv.writer(names_file).writerow(NAME_LIST[0])
+            merged_rows.append(row)
+
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=appending_row_sink,
+                        header_row=HEADER_LIST, state_file_path=state_path, file_list=["names.csv"])
+        second_output_path = Path(csv_merge_test_directory, "archive", "second.csv")
+        merge_log_files(search_directory=csv_merge_test_directory, output_file_path=second_output_path,
+                        header_row=HEADER_LIST, state_file_path=state_path, file_list=["names.csv"])
+        # names.csv changed after it was opened, so it isn't recorded as merged as it now is.
+        assert len(tuple(csv.reader(second_output_path.open(newline="")))) == 1 + len(NAME_LIST) + 1
+
 
 HEADER_LIST = "ALPHA BRAVO CHARLIE DELTA ECHO".split()
 HEADER_ROW = ",".join(HEADER_LIST)
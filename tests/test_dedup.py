@@ -0,0 +1,78 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from csvlog import dedup
+from csvlog.dedup import BloomFilter, DigestTable, RecordDeduplicator
+
+HEADER_LIST = ["Record Type", "Job number", "Record key"]
+
+
+class TestDigestTable:
+    def test_add(self):
+        table = DigestTable(8)
+        assert table.add(b"a" * 16) is True
+        assert table.add(b"a" * 16) is False
+        assert table.count == 1
+
+    def test_grown_keeps_digests(self):
+        table = DigestTable(8)
+        digests = [bytes([number]) * 16 for number in range(1, 5)]
+        for digest in digests:
+            table.add(digest)
+        assert table.needs_to_grow()
+        bigger_table = table.grown()
+        assert bigger_table.slots == 16
+        assert sorted(bigger_table.digests()) == digests
+
+
+class TestBloomFilter:
+    def test_no_false_negatives(self):
+        bloom_filter = BloomFilter(1024)
+        digests = [random.Random(number).getrandbits(128).to_bytes(16, "big") for number in range(200)]
+        for digest in digests:
+            bloom_filter.add(digest)
+        assert all(bloom_filter.might_contain(digest) for digest in digests)
+
+    def test_empty(self):
+        assert BloomFilter(1024).might_contain(b"x" * 16) is False
+
+
+class TestRecordDeduplicator:
+    def test_whole_row(self):
+        rows = [["INIB", "yy-1", "1"], ["INMB", "yy-1", "1"], ["INIB", "yy-1", "1"]]
+        with RecordDeduplicator() as deduplicator:
+            assert list(deduplicator.filter_rows(rows)) == rows[:2]
+            assert (deduplicator.kept, deduplicator.dropped) == (2, 1)
+
+    def test_key_columns(self):
+        rows = [["INIB", "yy-1", "1"], ["INMB", "yy-1", "1"], ["INMB", "yy-2", "1"]]
+        with RecordDeduplicator(["Job number", "Record key"], HEADER_LIST) as deduplicator:
+            assert list(deduplicator.filter_rows(rows)) == [rows[0], rows[2]]
+
+    def test_fields_do_not_run_together(self):
+        rows = [["ab", "c"], ["a", "bc"]]
+        with RecordDeduplicator() as deduplicator:
+            assert list(deduplicator.filter_rows(rows)) == rows
+
+    @pytest.mark.parametrize("bloom_filter_bytes", [0, 4096])
+    def test_spilled(self, tmp_path, monkeypatch, bloom_filter_bytes):
+        monkeypatch.setattr(dedup, "MAX_SPILLED_RUNS", 2)
+        random_generator = random.Random(99)
+        rows = [["INIB", str(random_generator.randrange(3000))] for _ in range(6000)]
+        first_seen = {}
+        for index, row in enumerate(rows):
+            first_seen.setdefault(tuple(row), index)
+        expected_rows = [row for index, row in enumerate(rows) if first_seen[tuple(row)] == index]
+        with RecordDeduplicator(memory_budget=16 * 1024, bloom_filter_bytes=bloom_filter_bytes,
+                                spill_directory=tmp_path) as deduplicator:
+            assert list(deduplicator.filter_rows(rows)) == expected_rows
+            assert deduplicator.runs
+            assert deduplicator.dropped == len(rows) - len(expected_rows)
+        # The spilled runs are removed when the deduplicator is closed.
+        assert list(Path(tmp_path).iterdir()) == []
+
+
+if __name__ == '__main__':
+    pytest.main()
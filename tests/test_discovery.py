@@ -0,0 +1,120 @@
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from csvlog import discovery
+from csvlog.discovery import has_candidate_files, listed_csv_files, read_path_list, walk_csv_files
+
+
+class TestWalkCSVFiles:
+    def test_flat(self, discovery_test_directory):
+        res = [entry.name for entry in walk_csv_files(discovery_test_directory)]
+        assert res == ["a.csv", "b.csv"]
+
+    def test_recursive_order(self, discovery_test_directory):
+        res = [Path(entry.path).relative_to(discovery_test_directory).as_posix() for entry in
+               walk_csv_files(discovery_test_directory, max_depth=None)]
+        assert res == ["a.csv", "b.csv", "one/c.csv", "one/deeper/d.csv", "two/e.csv"]
+
+    def test_threads_do_not_change_order(self, discovery_test_directory):
+        serial = [entry.path for entry in walk_csv_files(discovery_test_directory, max_depth=None, threads=1)]
+        threaded = [entry.path for entry in walk_csv_files(discovery_test_directory, max_depth=None, threads=4)]
+        assert serial == threaded
+
+    def test_max_depth(self, discovery_test_directory):
+        res = [entry.name for entry in walk_csv_files(discovery_test_directory, max_depth=1)]
+        assert res == ["a.csv", "b.csv", "c.csv", "e.csv"]
+
+    def test_include_patterns(self, discovery_test_directory):
+        res = [entry.name for entry in walk_csv_files(discovery_test_directory, include_patterns=("*.txt",))]
+        assert res == ["notes.txt"]
+
+    def test_exclude_directory(self, discovery_test_directory):
+        res = [entry.name for entry in walk_csv_files(discovery_test_directory, max_depth=None,
+                                                      exclude_patterns=("one",))]
+        assert res == ["a.csv", "b.csv", "e.csv"]
+
+    def test_exclude_relative_path(self, discovery_test_directory):
+        res = [entry.name for entry in walk_csv_files(discovery_test_directory, max_depth=None,
+                                                      exclude_patterns=("one/deeper/*",))]
+        assert res == ["a.csv", "b.csv", "c.csv", "e.csv"]
+
+    def test_ignore_by_identity(self, discovery_test_directory):
+        res = [entry.name for entry in walk_csv_files(discovery_test_directory,
+                                                      ignore=Path(discovery_test_directory, "one", "..", "b.csv"))]
+        assert res == ["a.csv"]
+
+    def test_ignore_does_not_exist(self, discovery_test_directory):
+        res = [entry.name for entry in walk_csv_files(discovery_test_directory,
+                                                      ignore=Path(discovery_test_directory, "missing.csv"))]
+        assert res == ["a.csv", "b.csv"]
+
+
+class TestHasCandidateFiles:
+    def test_found(self, discovery_test_directory):
+        assert has_candidate_files(discovery_test_directory)
+        assert has_candidate_files(Path(discovery_test_directory, "two"))
+
+    def test_only_in_subdirectories(self, discovery_test_directory):
+        assert not has_candidate_files(discovery_test_directory, include_patterns=("*.json",))
+        assert not has_candidate_files(discovery_test_directory, include_patterns=("d.csv",))
+        assert has_candidate_files(discovery_test_directory, max_depth=None, include_patterns=("d.csv",))
+
+    def test_ignored_output(self, discovery_test_directory):
+        assert not has_candidate_files(Path(discovery_test_directory, "two"),
+                                       ignore=Path(discovery_test_directory, "two", "e.csv"))
+
+
+class TestReadPathList:
+    def test_lines(self):
+        assert list(read_path_list(BytesIO(b"a.csv\r\none/c.csv\n\nlast.csv"))) == ["a.csv", "one/c.csv", "last.csv"]
+
+    def test_nul_separated(self):
+        # Line breaks are allowed in names when the list is NUL separated.
+        assert list(read_path_list(BytesIO(b"a.csv\0odd\nname.csv\0"))) == ["a.csv", "odd\nname.csv"]
+
+    def test_entries_span_chunks(self, monkeypatch):
+        # The first chunk only has to be longer than the first path for the separator to be found.
+        monkeypatch.setattr(discovery, "PATH_LIST_CHUNK_SIZE", 24)
+        names = [f"directory/file{number}.csv" for number in range(20)]
+        assert list(read_path_list(BytesIO("\n".join(names).encode()))) == names
+        assert list(read_path_list(BytesIO("\0".join(names).encode()))) == names
+
+    def test_empty(self):
+        assert list(read_path_list(BytesIO(b""))) == []
+
+
+class TestListedCSVFiles:
+    def test_relative_and_absolute(self, discovery_test_directory):
+        names = ["two/e.csv", str(Path(discovery_test_directory, "a.csv")), "./one/../b.csv"]
+        res = [path for path, _ in listed_csv_files(names, discovery_test_directory)]
+        assert res == [str(Path(discovery_test_directory, relative_path)) for relative_path in
+                       ("two/e.csv", "a.csv", "b.csv")]
+
+    def test_skipped(self, discovery_test_directory):
+        # Files outside the directory, missing files and directories are all left out.
+        names = ["../outside.csv", str(Path(discovery_test_directory).parent), "missing.csv", "directory.csv",
+                 "notes.txt"]
+        Path(discovery_test_directory.parent, "outside.csv").touch()
+        res = [Path(path).name for path, _ in listed_csv_files(names, discovery_test_directory)]
+        assert res == ["notes.txt"]
+
+    def test_ignore(self, discovery_test_directory):
+        res = [Path(path).name for path, _ in listed_csv_files(["a.csv", "b.csv"], discovery_test_directory,
+                                                               ignore=Path(discovery_test_directory, "a.csv"))]
+        assert res == ["b.csv"]
+
+
+@pytest.fixture
+def discovery_test_directory(tmp_path):
+    for relative_path in ("b.csv", "a.csv", "notes.txt", "one/c.csv", "one/deeper/d.csv", "two/e.csv"):
+        file_path = Path(tmp_path, relative_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.touch()
+    Path(tmp_path, "directory.csv").mkdir()
+    return tmp_path
+
+
+if __name__ == '__main__':
+    pytest.main()
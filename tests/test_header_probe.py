@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pytest
+
+from csvlog.header_probe import HeaderProbe, file_has_header
+from csvlog.merge_state import HeaderVerdictCache
+
+HEADER_LIST = "ALPHA BRAVO CHARLIE".split()
+
+
+class TestFileHasHeader:
+    def test_matching_header(self, probe_test_directory):
+        assert file_has_header(Path(probe_test_directory, "good_0.csv"), HEADER_LIST) is True
+
+    def test_other_header(self, probe_test_directory):
+        assert file_has_header(Path(probe_test_directory, "bad_0.csv"), HEADER_LIST) is False
+
+    def test_empty_file(self, probe_test_directory):
+        assert file_has_header(Path(probe_test_directory, "empty.csv"), HEADER_LIST) is False
+
+    def test_missing_file(self, probe_test_directory):
+        assert file_has_header(Path(probe_test_directory, "missing.csv"), HEADER_LIST) is False
+
+    def test_header_variant(self, probe_test_directory):
+        header_variants = ["ALPHA BETA GAMMA".split()]
+        assert file_has_header(Path(probe_test_directory, "bad_0.csv"), HEADER_LIST, header_variants) is True
+        assert file_has_header(Path(probe_test_directory, "empty.csv"), HEADER_LIST, header_variants) is False
+
+
+class TestHeaderProbe:
+    def test_order_and_counts(self, probe_test_directory):
+        candidates = sorted(Path(probe_test_directory).iterdir())
+        probe = HeaderProbe(HEADER_LIST, threads=2)
+        res = list(probe(iter(candidates)))
+        assert res == [path for path in candidates if path.name.startswith("good")]
+        assert probe.accepted == 10
+        assert probe.rejected == 21
+
+    def test_stops_early(self, probe_test_directory):
+        candidates = sorted(Path(probe_test_directory).iterdir())
+        probe = HeaderProbe(HEADER_LIST, threads=2)
+        probe_iterator = probe(iter(candidates))
+        assert next(probe_iterator) == Path(probe_test_directory, "good_0.csv")
+        probe_iterator.close()
+
+    def test_verdict_cache_skips_known_files(self, probe_test_directory, tmp_path_factory, monkeypatch):
+        candidates = sorted(Path(probe_test_directory).iterdir())
+        database_path = Path(tmp_path_factory.mktemp("cache"), "cache.sqlite3")
+        with HeaderVerdictCache(database_path, HEADER_LIST) as cache:
+            first_run = list(HeaderProbe(HEADER_LIST, threads=2, verdict_cache=cache)(iter(candidates)))
+        opened_paths = []
+
+        def counting_file_has_header(file_path, header_row, header_variants):
+            opened_paths.append(file_path)
+            return file_has_header(file_path, header_row, header_variants)
+
+        monkeypatch.setattr("csvlog.header_probe.file_has_header", counting_file_has_header)
+        Path(probe_test_directory, "bad_0.csv").write_text("ALPHA,BRAVO,CHARLIE\n4,5,6\n")
+        with HeaderVerdictCache(database_path, HEADER_LIST) as cache:
+            probe = HeaderProbe(HEADER_LIST, threads=2, verdict_cache=cache)
+            second_run = list(probe(iter(candidates)))
+        assert opened_paths == [Path(probe_test_directory, "bad_0.csv")]
+        assert probe.cached == 30
+        assert second_run == [Path(probe_test_directory, "bad_0.csv")] + first_run
+
+
+@pytest.fixture
+def probe_test_directory(tmp_path):
+    for number in range(10):
+        Path(tmp_path, f"good_{number}.csv").write_text("ALPHA,BRAVO,CHARLIE\n1,2,3\n")
+    for number in range(20):
+        Path(tmp_path, f"bad_{number}.csv").write_text("ALPHA,BETA,GAMMA\n1,2,3\n")
+    Path(tmp_path, "empty.csv").touch()
+    return tmp_path
+
+
+if __name__ == '__main__':
+    pytest.main()
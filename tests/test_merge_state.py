@@ -0,0 +1,103 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from csvlog.merge_state import HeaderVerdictCache, MergeStateStore
+
+
+class TestMergeStateStore:
+    def test_unknown_file(self, state_test_directory):
+        with MergeStateStore(Path(state_test_directory, "state.sqlite3")) as store:
+            assert store.is_unchanged(Path(state_test_directory, "one.csv")) is False
+
+    def test_recorded_file(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        with MergeStateStore(Path(state_test_directory, "state.sqlite3")) as store:
+            store.record_merged(file_path)
+            assert store.is_unchanged(file_path) is True
+
+    def test_state_persists(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        database_path = Path(state_test_directory, "state.sqlite3")
+        with MergeStateStore(database_path) as store:
+            store.record_merged(file_path)
+        with MergeStateStore(database_path) as store:
+            assert store.is_unchanged(file_path) is True
+
+    def test_modified_file(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        with MergeStateStore(Path(state_test_directory, "state.sqlite3")) as store:
+            store.record_merged(file_path)
+            file_path.write_text("a,b,c\nd,e,f\n")
+            assert store.is_unchanged(file_path) is False
+
+    def test_touched_file_without_hash(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        with MergeStateStore(Path(state_test_directory, "state.sqlite3")) as store:
+            store.record_merged(file_path)
+            stat_result = file_path.stat()
+            os.utime(file_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10 ** 9))
+            assert store.is_unchanged(file_path) is False
+
+    def test_touched_file_with_hash(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        with MergeStateStore(Path(state_test_directory, "state.sqlite3"), hash_contents=True) as store:
+            store.record_merged(file_path)
+            stat_result = file_path.stat()
+            os.utime(file_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10 ** 9))
+            assert store.is_unchanged(file_path) is True
+
+    def test_snapshot_recorded(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        with MergeStateStore(Path(state_test_directory, "state.sqlite3"), hash_contents=True) as store:
+            snapshot = store.snapshot(file_path)
+            with file_path.open(mode="a") as csv_file:
+                csv_file.write("g,h,i\n")
+            store.record_merged(file_path, *snapshot)
+            # The rows added after the snapshot haven't been merged.
+            assert store.is_unchanged(file_path) is False
+
+
+class TestHeaderVerdictCache:
+    def test_unknown_file(self, state_test_directory):
+        with HeaderVerdictCache(Path(state_test_directory, "cache.sqlite3"), HEADER_LIST) as cache:
+            assert cache.cached_verdict(Path(state_test_directory, "one.csv")) is None
+
+    def test_recorded_verdict_persists(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        database_path = Path(state_test_directory, "cache.sqlite3")
+        with HeaderVerdictCache(database_path, HEADER_LIST) as cache:
+            cache.record_verdict(file_path, False)
+        with HeaderVerdictCache(database_path, HEADER_LIST) as cache:
+            assert cache.cached_verdict(file_path) is False
+
+    def test_modified_file(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        with HeaderVerdictCache(Path(state_test_directory, "cache.sqlite3"), HEADER_LIST) as cache:
+            cache.record_verdict(file_path, False)
+            file_path.write_text("a,b,c,d\n")
+            assert cache.cached_verdict(file_path) is None
+
+    def test_header_change_invalidates(self, state_test_directory):
+        file_path = Path(state_test_directory, "one.csv")
+        database_path = Path(state_test_directory, "cache.sqlite3")
+        with HeaderVerdictCache(database_path, HEADER_LIST) as cache:
+            cache.record_verdict(file_path, False)
+        with HeaderVerdictCache(database_path, ["a", "b", "c"]) as cache:
+            assert cache.cached_verdict(file_path) is None
+        with HeaderVerdictCache(database_path, HEADER_LIST) as cache:
+            assert cache.cached_verdict(file_path) is None
+
+
+HEADER_LIST = "ALPHA BRAVO CHARLIE".split()
+
+
+@pytest.fixture
+def state_test_directory(tmp_path):
+    Path(tmp_path, "one.csv").write_text("a,b,c\n1,2,3\n")
+    return tmp_path
+
+
+if __name__ == '__main__':
+    pytest.main()
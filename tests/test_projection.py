@@ -0,0 +1,49 @@
+import pytest
+
+from csvlog.projection import ColumnProjection
+
+HEADER_LIST = ["Record Type", "Job number", "", "Record key", ""]
+ROWS = [["INMB", "100", "", "A1", ""],
+        ["INMB", "101", "x", "A2", "y"]]
+
+
+class TestColumnProjection:
+    def test_canonical_header_is_unchanged(self):
+        projection = ColumnProjection(HEADER_LIST)
+        assert projection.output_header == HEADER_LIST
+        rows = iter(ROWS)
+        # Nothing is copied when nothing changes.
+        assert projection.row_mapper(HEADER_LIST)(rows) is rows
+
+    def test_unknown_header(self):
+        assert ColumnProjection(HEADER_LIST).row_mapper(["Record Type", "Job"]) is None
+
+    def test_selected_columns(self):
+        projection = ColumnProjection(HEADER_LIST, ["Record key", "0"])
+        assert projection.output_header == ["Record key", "Record Type"]
+        assert list(projection.row_mapper(HEADER_LIST)(ROWS)) == [("A1", "INMB"), ("A2", "INMB")]
+
+    def test_single_column(self):
+        projection = ColumnProjection(HEADER_LIST, ["Job number"])
+        assert list(projection.row_mapper(HEADER_LIST)(ROWS)) == [("100",), ("101",)]
+
+    def test_variant(self):
+        # The variant has its columns in another order, lacks the second empty one and has one of its own.
+        variant = ["Record key", "Vendor", "Record Type", "", "Job number"]
+        projection = ColumnProjection(HEADER_LIST, header_variants=[variant])
+        rows = [["B1", "Acme", "INIB", "z", "200"], ["B2"]]
+        assert list(projection.row_mapper(variant)(rows)) == [("INIB", "200", "z", "B1", ""),
+                                                              ("", "", "", "B2", "")]
+
+    def test_mapping_is_compiled_once(self):
+        projection = ColumnProjection(HEADER_LIST, ["Record key"])
+        assert projection.row_mapper(list(HEADER_LIST)) is projection.row_mapper(tuple(HEADER_LIST))
+
+    @pytest.mark.parametrize("columns", [["Missing"], ["9"]])
+    def test_unknown_column(self, columns):
+        with pytest.raises(ValueError):
+            ColumnProjection(HEADER_LIST, columns)
+
+
+if __name__ == '__main__':
+    pytest.main()
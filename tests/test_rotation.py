@@ -0,0 +1,83 @@
+import csv
+import gzip
+from pathlib import Path
+
+import pytest
+
+from csvlog import rotation
+from csvlog.csv_merge import merge_log_files
+from csvlog.rotation import RotatingOutput, part_output_path
+
+HEADER_LIST = ["Record Type", "Job number", "Record key"]
+ROWS = [["INIB", f"yy-{number:05}", str(number)] for number in range(25)]
+
+
+class TestPartOutputPath:
+    def test_plain(self):
+        assert part_output_path(Path("out", "merged.csv"), 3) == Path("out", "merged_part0003.csv")
+
+    def test_compressed(self):
+        assert part_output_path(Path("merged.csv.gz"), 12) == Path("merged_part0012.csv.gz")
+
+
+class TestRotatingOutput:
+    @pytest.mark.parametrize("writer_threads", [1, 3])
+    def test_max_rows(self, tmp_path, writer_threads):
+        with RotatingOutput(Path(tmp_path, "merged.csv"), HEADER_LIST, max_rows=10,
+                            writer_threads=writer_threads) as rotating_output:
+            csv.writer(rotating_output).writerows(ROWS)
+        assert [path.name for path in rotating_output.part_paths] == [
+            "merged_part0001.csv", "merged_part0002.csv", "merged_part0003.csv"]
+        assert [read_rows(path) for path in rotating_output.part_paths] == [
+            [HEADER_LIST] + ROWS[:10], [HEADER_LIST] + ROWS[10:20], [HEADER_LIST] + ROWS[20:]]
+
+    def test_max_bytes(self, tmp_path):
+        row_length = len("INIB,yy-00000,10\r\n")
+        with RotatingOutput(Path(tmp_path, "merged.csv"), max_bytes=row_length * 4) as rotating_output:
+            csv.writer(rotating_output).writerows(ROWS[10:])
+        assert [len(read_rows(path)) for path in rotating_output.part_paths] == [4, 4, 4, 3]
+
+    def test_header_only_in_first_part(self, tmp_path):
+        with RotatingOutput(Path(tmp_path, "merged.csv"), HEADER_LIST, max_rows=10,
+                            repeat_header=False) as rotating_output:
+            csv.writer(rotating_output).writerows(ROWS)
+        assert [read_rows(path)[0] == HEADER_LIST for path in rotating_output.part_paths] == [True, False, False]
+        assert sum(len(read_rows(path)) for path in rotating_output.part_paths) == len(ROWS) + 1
+
+    def test_small_blocks_compressed(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(rotation, "PART_BLOCK_SIZE", 16)
+        with RotatingOutput(Path(tmp_path, "merged.csv.gz"), HEADER_LIST, max_rows=20,
+                            writer_threads=2) as rotating_output:
+            csv.writer(rotating_output).writerows(ROWS)
+        part_rows = []
+        for path in rotating_output.part_paths:
+            with gzip.open(str(path), mode="rt", newline="") as part_file:
+                part_rows.append(list(csv.reader(part_file)))
+        assert part_rows == [[HEADER_LIST] + ROWS[:20], [HEADER_LIST] + ROWS[20:]]
+
+    def test_no_rows(self, tmp_path):
+        with RotatingOutput(Path(tmp_path, "merged.csv"), HEADER_LIST, max_rows=10) as rotating_output:
+            pass
+        assert [read_rows(path) for path in rotating_output.part_paths] == [[HEADER_LIST]]
+
+
+class TestRotatingMerge:
+    def test_merge_log_files(self, tmp_path):
+        for file_number in range(3):
+            with Path(tmp_path, f"input_{file_number}.csv").open(mode="w", newline="") as input_file:
+                csv.writer(input_file).writerows([HEADER_LIST] + ROWS[file_number * 10:(file_number + 1) * 10])
+        Path(tmp_path, "output").mkdir()
+        merge_log_files(tmp_path, Path(tmp_path, "output", "merged.csv"), header_row=HEADER_LIST, max_part_rows=8,
+                        writer_threads=2)
+        part_paths = sorted(Path(tmp_path, "output").iterdir())
+        assert len(part_paths) == 4
+        assert [row for path in part_paths for row in read_rows(path)[1:]] == ROWS
+
+
+def read_rows(path: Path):
+    with path.open(newline="") as csv_file:
+        return list(csv.reader(csv_file))
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,79 @@
+from io import StringIO
+
+import pytest
+
+from csvlog.row_filter import RowFilter, parse_condition
+
+HEADER_LIST = ["Record Type", "Job number", "Description"]
+INPUT_TEXT = ("Record Type,Job number,Description\r\n"
+              "INMB,100,first\r\n"
+              "INIB,100,second\r\n"
+              "INIB,200,third\r\n"
+              'INIB,100,"quoted, with a comma"\r\n'
+              'INMB,100,"spans\r\n'
+              'INIB,100,two lines"\r\n'
+              "INIB,123\r\n")
+
+
+def filtered_rows(conditions, text=INPUT_TEXT, header_row=HEADER_LIST):
+    filtered_reader = RowFilter(conditions, header_row).reader(StringIO(text, newline=""))
+    return list(filtered_reader), filtered_reader
+
+
+class TestParseCondition:
+    @pytest.mark.parametrize("condition, parsed", [("Job number=100", ("Job number", "=", "100")),
+                                                   ("Job number^=1", ("Job number", "^=", "1")),
+                                                   ("Description~=^t.*d$", ("Description", "~=", "^t.*d$")),
+                                                   ("0=a=b", ("0", "=", "a=b"))])
+    def test_operators(self, condition, parsed):
+        assert parse_condition(condition) == parsed
+
+    @pytest.mark.parametrize("condition", ["Job number", "=100"])
+    def test_invalid(self, condition):
+        with pytest.raises(ValueError):
+            parse_condition(condition)
+
+
+class TestRowFilter:
+    def test_equals(self):
+        rows, _ = filtered_rows(["Record Type=INMB"])
+        assert rows == [HEADER_LIST, ["INMB", "100", "first"], ["INMB", "100", "spans\r\nINIB,100,two lines"]]
+
+    def test_in_set_and_prefix(self):
+        rows, _ = filtered_rows(["Record Type=INIB|INXX", "Job number^=1"])
+        assert rows == [HEADER_LIST, ["INIB", "100", "second"], ["INIB", "100", "quoted, with a comma"],
+                        ["INIB", "123"]]
+
+    def test_regex(self):
+        rows, _ = filtered_rows(["2~=^(first|third)$"])
+        assert [row[2] for row in rows[1:]] == ["first", "third"]
+
+    def test_short_rows_have_empty_fields(self):
+        rows, _ = filtered_rows(["Description="])
+        assert rows == [HEADER_LIST, ["INIB", "123"]]
+
+    def test_lines_are_rejected_before_parsing(self):
+        rows, filtered_reader = filtered_rows(["Job number=200"])
+        assert rows == [HEADER_LIST, ["INIB", "200", "third"]]
+        # The lines with quotes in them are parsed, the others never reach the csv reader.
+        assert filtered_reader.skipped_lines == 3
+        assert filtered_reader.line_num == 8
+
+    def test_header_variant(self):
+        variant = ["Description", "Record Type"]
+        text = "Description,Record Type\r\nfirst,INMB\r\nsecond,INIB\r\n"
+        rows, _ = filtered_rows(["Record Type=INIB", "Job number="], text)
+        assert rows == [variant, ["second", "INIB"]]
+
+    def test_without_header(self):
+        rows = list(RowFilter(["1=200"]).reader(StringIO("INIB,100\r\nINIB,200\r\n", newline=""), has_header=False))
+        assert rows == [["INIB", "200"]]
+
+    @pytest.mark.parametrize("conditions", [["Missing=1"], ["Job number~=("]])
+    def test_invalid_conditions(self, conditions):
+        with pytest.raises(ValueError):
+            RowFilter(conditions, HEADER_LIST)
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,77 @@
+import csv
+import shutil
+from pathlib import Path
+
+import pytest
+
+from csvlog.config_file import default_section_headers
+from csvlog.csv_merge import merge_log_files
+from csvlog.sections import section_log_file_combiner, section_output_path
+
+SAMPLE_EXPORT = Path(Path(__file__).parent, "yy-12345_MaterialOrder.csv")
+
+
+class TestSectionOutputPath:
+    def test_plain(self):
+        assert section_output_path(Path("out", "merged.csv"), "INIB") == Path("out", "merged_INIB.csv")
+
+    def test_compressed(self):
+        assert section_output_path(Path("merged.csv.gz"), "INIB") == Path("merged_INIB.csv.gz")
+
+    def test_no_extension(self):
+        assert section_output_path(Path("merged"), "INIB") == Path("merged_INIB")
+
+
+class TestSectionLogFileCombiner:
+    def test_sample_export(self, sections_test_directory):
+        output_path = Path(sections_test_directory, "output", "merged.csv")
+        input_paths = sorted(Path(sections_test_directory).glob("*.csv"))
+        combiner = section_log_file_combiner(output_path, default_section_headers)
+        assert list(combiner(iter(input_paths))) == [Path(sections_test_directory, "export_1.csv"),
+                                                     Path(sections_test_directory, "export_2.csv")]
+        sample_rows = read_rows(SAMPLE_EXPORT)
+        material_order_rows = [row for row in sample_rows if row[0] == "INMB"]
+        item_rows = [row for row in sample_rows if row[0] == "INIB"]
+        assert read_rows(Path(sections_test_directory, "output", "merged_INMB.csv")) == (
+                [default_section_headers["INMB"]] + material_order_rows * 2)
+        assert read_rows(Path(sections_test_directory, "output", "merged_INIB.csv")) == (
+                [default_section_headers["INIB"]] + item_rows * 2)
+
+    def test_append_writes_headers_once(self, sections_test_directory):
+        output_path = Path(sections_test_directory, "output", "merged.csv")
+        input_path = Path(sections_test_directory, "export_1.csv")
+        for _ in range(2):
+            list(section_log_file_combiner(output_path, default_section_headers, append=True)(iter([input_path])))
+        output_rows = read_rows(Path(sections_test_directory, "output", "merged_INMB.csv"))
+        assert output_rows.count(default_section_headers["INMB"]) == 1
+        assert len(output_rows) == 3
+
+    def test_merge_log_files(self, sections_test_directory):
+        output_path = Path(sections_test_directory, "output", "merged.csv")
+        merge_log_files(sections_test_directory, output_path, header_row=default_section_headers["INMB"],
+                        archive_directory=Path(sections_test_directory, "archive"),
+                        section_headers=default_section_headers)
+        assert sorted(path.name for path in Path(sections_test_directory, "archive").iterdir()) == [
+            "export_1.csv", "export_2.csv"]
+        assert Path(sections_test_directory, "other.csv").exists()
+        assert len(read_rows(Path(sections_test_directory, "output", "merged_INIB.csv"))) > 1
+
+
+def read_rows(path: Path):
+    with path.open(newline="") as csv_file:
+        return list(csv.reader(csv_file))
+
+
+@pytest.fixture
+def sections_test_directory(tmp_path):
+    Path(tmp_path, "output").mkdir()
+    Path(tmp_path, "archive").mkdir()
+    shutil.copy(str(SAMPLE_EXPORT), str(Path(tmp_path, "export_1.csv")))
+    shutil.copy(str(SAMPLE_EXPORT), str(Path(tmp_path, "export_2.csv")))
+    with Path(tmp_path, "other.csv").open(mode="w", newline="") as other_file:
+        csv.writer(other_file).writerows([["ALPHA", "BRAVO"], ["INIB", "1"]])
+    return tmp_path
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,107 @@
+import csv
+import gzip
+from collections import Counter
+from pathlib import Path, PurePath
+
+import pytest
+
+from csvlog.csv_merge import merge_log_files
+from csvlog.sharding import (concatenate_shards, ordered_shard_paths, parse_shard, shard_file_paths, shard_of,
+                             shard_output_path)
+
+HEADER_LIST = ["Record Type", "Job number", "Record key"]
+
+
+class TestParseShard:
+    def test_valid(self):
+        assert parse_shard("2/4") == (2, 4)
+        assert parse_shard("1/1") == (1, 1)
+
+    @pytest.mark.parametrize("spec", ["0/4", "5/4", "2", "2/", "a/b", "1/0", "-1/4"])
+    def test_invalid(self, spec):
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+class TestShardOf:
+    def test_stable(self):
+        # Hosts have to agree on the shard of a file, so the hash can never depend on the process or platform.
+        assert [shard_of(PurePath(name), 4) for name in ["a.csv", "sub/b.csv", "sub/c.csv", "d.csv"]] == [3, 4, 2, 4]
+
+    def test_separators(self):
+        assert shard_of(PurePath("sub", "b.csv"), 7) == shard_of(PurePath("sub/b.csv"), 7)
+
+    def test_every_file_in_one_shard(self, tmp_path):
+        file_paths = [Path(tmp_path, f"directory{number % 10}", f"file{number}.csv") for number in range(1000)]
+        shards = [list(shard_file_paths(iter(file_paths), tmp_path, shard, 4)) for shard in range(1, 5)]
+        assert sorted(file_path for shard in shards for file_path in shard) == sorted(file_paths)
+        # A good hash spreads the files about evenly.
+        assert all(200 < len(shard) < 300 for shard in shards)
+
+    def test_one_shard(self, tmp_path):
+        file_paths = [Path(tmp_path, "a.csv"), Path(tmp_path, "b.csv")]
+        assert list(shard_file_paths(iter(file_paths), tmp_path, 1, 1)) == file_paths
+
+
+class TestShardOutputs:
+    def test_shard_output_path(self):
+        assert shard_output_path(Path("out", "merged.csv"), 2, 4) == Path("out", "merged_shard2of4.csv")
+        assert shard_output_path(Path("merged.csv.gz"), 10, 12) == Path("merged_shard10of12.csv.gz")
+
+    def test_ordered_shard_paths(self):
+        shard_paths = [Path(f"merged_shard{shard}of10.csv") for shard in (10, 2, 1, 3, 4, 5, 6, 7, 8, 9)]
+        assert ordered_shard_paths(shard_paths) == [Path(f"merged_shard{shard}of10.csv") for shard in range(1, 11)]
+
+    @pytest.mark.parametrize("names", [["merged_shard1of3.csv", "merged_shard3of3.csv"],
+                                       ["merged_shard1of2.csv", "merged_shard1of2.csv", "merged_shard2of2.csv"],
+                                       ["merged_shard1of2.csv", "other_shard2of3.csv"], ["merged.csv"]])
+    def test_ordered_shard_paths_invalid(self, names):
+        with pytest.raises(ValueError):
+            ordered_shard_paths([Path(name) for name in names])
+
+
+class TestConcatenateShards:
+    @pytest.mark.parametrize("compressed", [False, True])
+    def test_merge_and_concatenate(self, tmp_path, compressed):
+        input_path = Path(tmp_path, "input")
+        for number in range(40):
+            file_path = Path(input_path, f"directory{number % 3}", f"file{number}.csv")
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with file_path.open(mode="w", newline="") as input_file:
+                csv.writer(input_file).writerows([HEADER_LIST, ["INIB", f"yy-{number:05}", str(number)]])
+        suffix = ".csv.gz" if compressed else ".csv"
+        shard_paths = []
+        for shard in range(1, 4):
+            shard_path = shard_output_path(Path(tmp_path, f"merged{suffix}"), shard, 3)
+            res = merge_log_files(input_path, shard_path, recurse=True, header_row=HEADER_LIST, shard=shard,
+                                  shard_count=3)
+            assert res.files_rejected == 0
+            shard_paths.append(shard_path)
+        output_path = Path(tmp_path, f"joined{suffix}")
+        assert concatenate_shards(output_path, list(reversed(shard_paths))) == 3
+        text = gzip.decompress(output_path.read_bytes()).decode() if compressed else output_path.read_text()
+        rows = list(csv.reader(text.splitlines()))
+        assert rows[0] == HEADER_LIST
+        assert Counter(row[2] for row in rows[1:]) == Counter(str(number) for number in range(40))
+
+    def test_mismatched_header(self, tmp_path):
+        Path(tmp_path, "merged_shard1of2.csv").write_text("A,B\r\n1,2\r\n")
+        Path(tmp_path, "merged_shard2of2.csv").write_text("A,C\r\n3,4\r\n")
+        with pytest.raises(ValueError):
+            concatenate_shards(Path(tmp_path, "joined.csv"), sorted(tmp_path.glob("merged_shard*")))
+
+    def test_no_header(self, tmp_path):
+        Path(tmp_path, "merged_shard1of2.csv").write_text("1,2\r\n")
+        Path(tmp_path, "merged_shard2of2.csv").write_text("3,4")
+        concatenate_shards(Path(tmp_path, "joined.csv"), sorted(tmp_path.glob("merged_shard*")), has_header=False)
+        assert Path(tmp_path, "joined.csv").read_bytes() == b"1,2\r\n3,4\r\n"
+
+    def test_existing_output(self, tmp_path):
+        Path(tmp_path, "merged_shard1of1.csv").write_text("A,B\r\n")
+        Path(tmp_path, "joined.csv").touch()
+        with pytest.raises(FileExistsError):
+            concatenate_shards(Path(tmp_path, "joined.csv"), [Path(tmp_path, "merged_shard1of1.csv")])
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,78 @@
+import csv
+import random
+from pathlib import Path
+
+import pytest
+
+from csvlog import sorted_merge
+from csvlog.sorted_merge import resolve_key_columns, sorted_log_file_combiner
+
+HEADER_LIST = ["Record Type", "Job number", "Record key"]
+
+
+class TestResolveKeyColumns:
+    def test_names(self):
+        assert resolve_key_columns(["Record key", "Job number"], HEADER_LIST) == (2, 1)
+
+    def test_numbers(self):
+        assert resolve_key_columns(["0", "2"], None) == (0, 2)
+
+    def test_unknown_name(self):
+        with pytest.raises(ValueError):
+            resolve_key_columns(["Missing"], HEADER_LIST)
+
+
+class TestSortedLogFileCombiner:
+    def test_in_memory(self, sort_test_directory):
+        input_paths = sorted(Path(sort_test_directory).glob("input_*.csv"))
+        output_path = Path(sort_test_directory, "output", "sorted.csv")
+        merged = list(sorted_log_file_combiner(output_path, HEADER_LIST, ["Job number"])(iter(input_paths)))
+        assert merged == [path for path in input_paths if path.name != "input_bad.csv"]
+        assert read_rows(output_path) == expected_rows(sort_test_directory, merged)
+
+    def test_spilled_runs(self, sort_test_directory, monkeypatch):
+        monkeypatch.setattr(sorted_merge, "MAX_MERGE_FAN_IN", 3)
+        input_paths = sorted(Path(sort_test_directory).glob("input_*.csv"))
+        output_path = Path(sort_test_directory, "output", "sorted.csv")
+        merged = list(sorted_log_file_combiner(output_path, HEADER_LIST, ["Job number"], memory_budget=2000)(
+            iter(input_paths)))
+        assert read_rows(output_path) == expected_rows(sort_test_directory, merged)
+        # Sorted runs are removed once the output is written.
+        assert [path.name for path in Path(sort_test_directory, "output").iterdir()] == ["sorted.csv"]
+
+    def test_nothing_yielded_before_output_complete(self, sort_test_directory):
+        input_paths = sorted(Path(sort_test_directory).glob("input_*.csv"))
+        output_path = Path(sort_test_directory, "output", "sorted.csv")
+        merged_file_iterator = sorted_log_file_combiner(output_path, HEADER_LIST, ["Job number"])(iter(input_paths))
+        next(merged_file_iterator)
+        assert len(read_rows(output_path)) == 1 + 200
+
+
+def read_rows(path: Path):
+    with path.open(newline="") as csv_file:
+        return list(csv.reader(csv_file))
+
+
+def expected_rows(directory: Path, merged_paths):
+    rows = []
+    for path in merged_paths:
+        rows.extend(read_rows(path)[1:])
+    # sorted() is stable, so this is also the expected order of rows with equal keys.
+    return [HEADER_LIST] + sorted(rows, key=lambda row: row[1])
+
+
+@pytest.fixture
+def sort_test_directory(tmp_path):
+    random_generator = random.Random(1234)
+    Path(tmp_path, "output").mkdir()
+    for file_number in range(4):
+        rows = [["INIB", f"yy-{random_generator.randrange(20):05}", str(row_number)] for row_number in range(50)]
+        with Path(tmp_path, f"input_{file_number}.csv").open(mode="w", newline="") as csv_file:
+            csv.writer(csv_file).writerows([HEADER_LIST] + rows)
+    with Path(tmp_path, "input_bad.csv").open(mode="w", newline="") as csv_file:
+        csv.writer(csv_file).writerows([["other", "header"], ["INIB", "yy-00000"]])
+    return tmp_path
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,74 @@
+import csv
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from csvlog.config_file import default_header
+from csvlog.csv_merge import merge_log_files
+from csvlog.sqlite_sink import SQLiteSink, column_names_for_header
+
+HEADER_LIST = ["Record Type", "Job number", "", "Record key", ""]
+ROWS = [["INIB", f"yy-{number:05}", "", str(number), ""] for number in range(7)]
+
+
+class TestColumnNamesForHeader:
+    def test_default_header(self):
+        assert column_names_for_header(default_header) == [
+            "Record Type", "Material Order", "Job number", "Description", "column_4", "column_5", "column_6",
+            "Record key", "column_8", "column_9"]
+
+    def test_repeated_names(self):
+        assert column_names_for_header(["a", "A", "a"]) == ["a", "A_2", "a_3"]
+
+
+class TestSQLiteSink:
+    def test_load_in_batches(self, tmp_path):
+        database_path = Path(tmp_path, "merged.sqlite3")
+        with SQLiteSink(database_path, HEADER_LIST, batch_size=3) as sink:
+            sink.load_rows(iter(ROWS))
+            assert sink.rows_loaded == 7
+        with sqlite3.connect(str(database_path)) as connection:
+            assert connection.execute("SELECT * FROM records").fetchall() == [tuple(row) for row in ROWS]
+
+    def test_short_and_long_rows(self, tmp_path):
+        database_path = Path(tmp_path, "merged.sqlite3")
+        with SQLiteSink(database_path, ["a", "b"]) as sink:
+            sink.load_rows([["1"], ["2", "3", "4"]])
+        with sqlite3.connect(str(database_path)) as connection:
+            assert connection.execute("SELECT * FROM records").fetchall() == [("1", None), ("2", "3")]
+
+    def test_indexes_and_pragmas(self, tmp_path):
+        database_path = Path(tmp_path, "merged.sqlite3")
+        with SQLiteSink(database_path, HEADER_LIST, table_name="items", journal_mode="delete",
+                        index_columns=["Job number", "3"]) as sink:
+            sink.load_rows(ROWS)
+        with sqlite3.connect(str(database_path)) as connection:
+            assert connection.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+            index_names = {row[1] for row in connection.execute("PRAGMA index_list(items)")}
+        assert index_names == {"items_Job number_index", "items_Record key_index"}
+
+    def test_bad_pragma(self, tmp_path):
+        with pytest.raises(ValueError):
+            SQLiteSink(Path(tmp_path, "merged.sqlite3"), HEADER_LIST, synchronous="OFF; DROP TABLE records")
+
+
+class TestSQLiteMerge:
+    def test_merge_log_files(self, tmp_path):
+        for file_number, rows in enumerate((ROWS[:4], ROWS[4:])):
+            with Path(tmp_path, f"input_{file_number}.csv").open(mode="w", newline="") as input_file:
+                csv.writer(input_file).writerows([HEADER_LIST] + rows)
+        with Path(tmp_path, "other.csv").open(mode="w", newline="") as input_file:
+            csv.writer(input_file).writerows([["other"], ["row"]])
+        Path(tmp_path, "archive").mkdir()
+        database_path = Path(tmp_path, "archive", "merged.sqlite3")
+        merge_log_files(tmp_path, database_path, header_row=HEADER_LIST, output_format="sqlite",
+                        archive_directory=Path(tmp_path, "archive"))
+        with sqlite3.connect(str(database_path)) as connection:
+            assert connection.execute("SELECT COUNT(*) FROM records").fetchone() == (7,)
+        assert Path(tmp_path, "archive", "input_1.csv").exists()
+        assert Path(tmp_path, "other.csv").exists()
+
+
+if __name__ == '__main__':
+    pytest.main()
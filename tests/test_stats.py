@@ -0,0 +1,77 @@
+import json
+import pstats
+import time
+import tracemalloc
+from pathlib import Path
+
+from csvlog.stats import MergeStats, profiling, tracing_memory
+
+
+class TestMergeStats:
+    def test_nested_phases_are_exclusive(self):
+        stats = MergeStats()
+        with stats.phase("merge"):
+            with stats.phase("discovery"):
+                time.sleep(0.02)
+        assert stats.phases["discovery"][0] >= 0.02
+        assert stats.phases["merge"][0] < 0.02
+        assert stats.phases["merge"][1] == 1
+
+    def test_timed_iterator(self):
+        stats = MergeStats()
+
+        def slow_numbers():
+            for number in range(3):
+                time.sleep(0.01)
+                yield number
+
+        for _ in stats.timed("discovery", slow_numbers()):
+            time.sleep(0.01)
+        # Four calls, the last one finds the iterator exhausted.  The consumer's time isn't counted.
+        assert stats.phases["discovery"][1] == 4
+        assert 0.03 <= stats.phases["discovery"][0] < 0.06
+
+    def test_record_file(self):
+        stats = MergeStats()
+        stats.record_file(Path("one.csv"), 100, 3, 0.5, True)
+        stats.record_file(Path("two.csv"), 50, 0, 0.1, False)
+        stats.finish()
+        report = stats.to_dict()
+        assert report["counters"] == {"files_read": 1, "files_rejected": 1, "bytes_read": 150, "rows_read": 3}
+        assert [file["path"] for file in report["files"]] == ["one.csv", "two.csv"]
+        assert "rows_per_second" in report
+
+    def test_without_per_file(self):
+        stats = MergeStats(per_file=False)
+        stats.record_file(Path("one.csv"), 100, 3, 0.5, True)
+        assert "files" not in stats.to_dict()
+
+    def test_write_json(self, tmp_path, capsys):
+        stats = MergeStats()
+        stats.count("files_merged", 2)
+        stats.write_json(str(Path(tmp_path, "stats.json")))
+        assert json.loads(Path(tmp_path, "stats.json").read_text())["counters"] == {"files_merged": 2}
+        stats.write_json("-")
+        assert json.loads(capsys.readouterr().out)["counters"] == {"files_merged": 2}
+
+
+class TestProfilingHooks:
+    def test_profiling(self, tmp_path):
+        profile_path = Path(tmp_path, "run.prof")
+        with profiling(profile_path):
+            sorted(range(1000), reverse=True)
+        assert pstats.Stats(str(profile_path)).total_calls > 0
+
+    def test_profiling_without_path(self):
+        with profiling(None):
+            pass
+
+    def test_tracing_memory(self, tmp_path):
+        snapshot_path = Path(tmp_path, "run.snapshot")
+        stats = MergeStats()
+        with tracing_memory(snapshot_path, stats):
+            kept = [bytes(1024) for _ in range(100)]
+        assert not tracemalloc.is_tracing()
+        assert tracemalloc.Snapshot.load(str(snapshot_path)).statistics("filename")
+        assert stats.peak_memory_bytes >= 100 * 1024
+        assert len(kept) == 100
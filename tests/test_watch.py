@@ -0,0 +1,211 @@
+import csv
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from csvlog.watch import BatchCollector, PollingWatcher, InotifyWatcher, rolled_output_path, watch_and_merge
+
+HEADER_LIST = "ALPHA BRAVO CHARLIE".split()
+NAME_LIST = ["Alice Betty Christine".split(), "Adam Bob Christopher".split()]
+
+
+class TestBatchCollector:
+    def test_empty_batch_is_not_ready(self):
+        batch = BatchCollector(max_seconds=0)
+        assert batch.is_ready() is False
+        assert batch.time_until_ready() is None
+
+    def test_time_window(self):
+        batch = BatchCollector(max_seconds=10)
+        batch.add(Path("one.csv"), 1, now=100.0)
+        assert batch.is_ready(now=105.0) is False
+        assert batch.time_until_ready(now=105.0) == 5.0
+        assert batch.is_ready(now=110.0) is True
+
+    def test_file_count_window(self):
+        batch = BatchCollector(max_seconds=10, max_files=2)
+        batch.add(Path("one.csv"), 1, now=100.0)
+        batch.add(Path("two.csv"), 1, now=100.0)
+        assert batch.is_ready(now=100.0) is True
+
+    def test_byte_window(self):
+        batch = BatchCollector(max_seconds=10, max_bytes=100)
+        batch.add(Path("one.csv"), 100, now=100.0)
+        assert batch.is_ready(now=100.0) is True
+
+    def test_take_resets(self):
+        batch = BatchCollector()
+        batch.add(Path("one.csv"), 1)
+        batch.add(Path("one.csv"), 1)
+        assert batch.take() == [Path("one.csv")]
+        assert batch.take() == []
+        assert batch.total_bytes == 0
+
+
+class TestPollingWatcher:
+    def test_prime_returns_existing_files(self, watch_test_directory):
+        watcher = PollingWatcher(watch_test_directory, poll_interval=0)
+        assert [path.name for path, _ in watcher.prime()] == ["existing.csv"]
+
+    def test_new_file_reported_after_settling(self, watch_test_directory):
+        watcher = PollingWatcher(watch_test_directory, poll_interval=0)
+        watcher.prime()
+        write_csv(Path(watch_test_directory, "new.csv"))
+        assert watcher.wait_for_files(0) == []
+        assert [path.name for path, _ in watcher.wait_for_files(0)] == ["new.csv"]
+        assert watcher.wait_for_files(0) == []
+
+    def test_recursive(self, watch_test_directory):
+        watcher = PollingWatcher(watch_test_directory, recurse=True, poll_interval=0)
+        watcher.prime()
+        subdirectory_path = Path(watch_test_directory, "subdirectory")
+        subdirectory_path.mkdir()
+        write_csv(Path(subdirectory_path, "new.csv"))
+        watcher.wait_for_files(0)
+        assert [path.name for path, _ in watcher.wait_for_files(0)] == ["new.csv"]
+
+    def test_discovery_settings(self, watch_test_directory):
+        watcher = PollingWatcher(watch_test_directory, recurse=True, poll_interval=0, max_depth=1,
+                                 include_patterns=["*.csv", "*.txt"], exclude_patterns=["skipped*", "excluded"])
+        for directory in ("excluded", "one/two"):
+            Path(watch_test_directory, directory).mkdir(parents=True)
+        for name in ("new.txt", "skipped.csv", "new.log", "excluded/new.csv", "one/new.csv", "one/two/new.csv"):
+            write_csv(Path(watch_test_directory, name))
+        assert sorted(path.relative_to(watch_test_directory).as_posix() for path, _ in watcher.prime()) == [
+            "existing.csv", "new.txt", "one/new.csv"]
+
+    def test_ignored_paths(self, watch_test_directory):
+        watcher = PollingWatcher(watch_test_directory, ignore=Path(watch_test_directory, "existing.csv"),
+                                 poll_interval=0)
+        assert watcher.prime() == []
+        watcher.ignore_path(Path(watch_test_directory, "rolled.csv"))
+        write_csv(Path(watch_test_directory, "rolled.csv"))
+        watcher.wait_for_files(0)
+        assert watcher.wait_for_files(0) == []
+
+    def test_removed_files_are_forgotten(self, watch_test_directory):
+        watcher = PollingWatcher(watch_test_directory, recurse=True, poll_interval=0)
+        subdirectory_path = Path(watch_test_directory, "subdirectory")
+        subdirectory_path.mkdir()
+        write_csv(Path(subdirectory_path, "new.csv"))
+        watcher.prime()
+        assert sum(len(known_files) for known_files in watcher.known_files.values()) == 2
+        Path(watch_test_directory, "existing.csv").unlink()
+        Path(subdirectory_path, "new.csv").unlink()
+        subdirectory_path.rmdir()
+        assert watcher.wait_for_files(0) == []
+        assert watcher.known_files == {}
+        assert watcher.subdirectories == {str(watch_test_directory): []}
+
+
+class TestInotifyWatcher:
+    def test_new_file_reported(self, watch_test_directory):
+        try:
+            watcher = InotifyWatcher(watch_test_directory)
+        except OSError:
+            pytest.skip("inotify is not available")
+        try:
+            write_csv(Path(watch_test_directory, "new.csv"))
+            assert [path.name for path, _ in watcher.wait_for_files(1)] == ["new.csv"]
+        finally:
+            watcher.close()
+
+    def test_discovery_settings(self, watch_test_directory):
+        try:
+            watcher = InotifyWatcher(watch_test_directory, recurse=True, max_depth=1, exclude_patterns=["skipped*"])
+        except OSError:
+            pytest.skip("inotify is not available")
+        try:
+            assert [path.name for path, _ in watcher.prime()] == ["existing.csv"]
+            write_csv(Path(watch_test_directory, "skipped.csv"))
+            Path(watch_test_directory, "one", "two").mkdir(parents=True)
+            write_csv(Path(watch_test_directory, "one", "new.csv"))
+            write_csv(Path(watch_test_directory, "one", "two", "new.csv"))
+            arrived_files = []
+            deadline = time.monotonic() + 1
+            while time.monotonic() < deadline:
+                arrived_files.extend(path for path, _ in watcher.wait_for_files(0.1))
+            assert set(arrived_files) == {Path(watch_test_directory, "one", "new.csv")}
+        finally:
+            watcher.close()
+
+
+class TestRolledOutputPath:
+    def test_compressed_output(self, tmp_path):
+        rolled_path = rolled_output_path(Path(tmp_path, "merged.csv.gz"), "%Y")
+        assert rolled_path == Path(tmp_path, f"merged_{time.strftime('%Y')}.csv.gz")
+
+    def test_same_second(self, tmp_path):
+        output_path = Path(tmp_path, "merged.csv")
+        first_path = rolled_output_path(output_path, "stamp")
+        first_path.touch()
+        second_path = rolled_output_path(output_path, "stamp")
+        second_path.touch()
+        assert [first_path.name, second_path.name] == ["merged_stamp.csv", "merged_stamp_1.csv"]
+        assert rolled_output_path(output_path, "stamp").name == "merged_stamp_2.csv"
+
+
+class TestWatchAndMerge:
+    def test_merges_existing_and_new_files(self, watch_test_directory):
+        output_path = Path(watch_test_directory, "output", "merged.csv")
+        output_path.parent.mkdir()
+        archive_path = Path(watch_test_directory, "archive")
+        stop_event = threading.Event()
+        watch_thread = threading.Thread(target=watch_and_merge, args=(watch_test_directory, output_path),
+                                        kwargs=dict(header_row=HEADER_LIST, archive_directory=archive_path,
+                                                    poll_interval=0.01, batch_seconds=0, use_inotify=False,
+                                                    stop_event=stop_event))
+        watch_thread.start()
+        try:
+            wait_for(lambda: Path(archive_path, "existing.csv").exists())
+            write_csv(Path(watch_test_directory, "new.csv"))
+            wait_for(lambda: Path(archive_path, "new.csv").exists())
+        finally:
+            stop_event.set()
+            watch_thread.join()
+        assert tuple(csv.reader(output_path.open(newline=""))) == tuple([HEADER_LIST] + NAME_LIST + NAME_LIST)
+
+    def test_rolled_output_in_watched_directory(self, watch_test_directory):
+        output_path = Path(watch_test_directory, "merged.csv")
+        stop_event = threading.Event()
+        watch_thread = threading.Thread(target=watch_and_merge, args=(watch_test_directory, output_path),
+                                        kwargs=dict(header_row=HEADER_LIST, poll_interval=0.01, batch_seconds=0,
+                                                    roll_seconds=0, use_inotify=False, stop_event=stop_event))
+        watch_thread.start()
+        try:
+            wait_for(output_path.exists)
+            write_csv(Path(watch_test_directory, "new.csv"))
+            wait_for(lambda: len(list(watch_test_directory.glob("merged_*.csv"))) == 1)
+            # Long enough for the watcher to have reported the rolled output, were it not ignored.
+            time.sleep(0.2)
+        finally:
+            stop_event.set()
+            watch_thread.join()
+        rolled_paths = list(watch_test_directory.glob("merged_*.csv"))
+        assert len(rolled_paths) == 1
+        for merged_path in [output_path] + rolled_paths:
+            assert tuple(csv.reader(merged_path.open(newline=""))) == tuple([HEADER_LIST] + NAME_LIST)
+
+
+def write_csv(path: Path) -> None:
+    with path.open(mode="w", newline="") as csv_file:
+        csv.writer(csv_file).writerows([HEADER_LIST] + NAME_LIST)
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def watch_test_directory(tmp_path):
+    write_csv(Path(tmp_path, "existing.csv"))
+    return tmp_path
+
+
+if __name__ == '__main__':
+    pytest.main()